@@ -0,0 +1,304 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from argparse import ArgumentParser
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+from main import AGENTS, ROOT, load_service
+from shared.Http import close_http_client
+from shared.RateLimit import BATCH, MAX_WAIT, Backpressure, request_priority, share_limits
+from shared.Server import GraphService
+from shared.Tracing import configure_tracing, span
+
+# Seconds between checks that worker processes are still alive
+WORKER_POLL_SECONDS = 1.0
+
+
+def job_id(job: dict) -> str:
+    """The job's own "id", or a hash of its content, so a resumed run recognises it."""
+    if job.get("id") is not None:
+        return str(job["id"])
+    return hashlib.blake2b(json.dumps(job, sort_keys=True).encode(), digest_size=12).hexdigest()
+
+
+def read_jobs(path: str, default_agent: Optional[str]) -> Iterator[dict]:
+    """
+    Yield the jobs of a JSONL file, one request body per line as sent to
+    POST /agents/{name}, plus an optional "id" and "agent". Lines that can't
+    be parsed come out as jobs carrying their "error", as do repeats of an
+    earlier line's id: ids name a job's result and its checkpoint thread.
+    """
+    first_lines = {}
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                payload = json.loads(line)
+                if not isinstance(payload, dict):
+                    raise ValueError("expected a JSON object")
+            except ValueError as e:
+                yield {"id": f"line-{line_number}", "agent": None, "error": f"line {line_number}: {e}"}
+                continue
+            job = {"id": job_id(payload), "agent": payload.pop("agent", default_agent), "line": line_number}
+            if job["id"] in first_lines:
+                yield {
+                    "id": f"line-{line_number}",
+                    "agent": job["agent"],
+                    "error": f"line {line_number}: duplicate job id {job['id']!r}, first used on line {first_lines[job['id']]}",
+                }
+                continue
+            first_lines[job["id"]] = line_number
+            payload.pop("id", None)
+            # The batch runs at one priority, set on the command line
+            payload.pop("priority", None)
+            job["payload"] = payload
+            yield job
+
+
+def finished_jobs(path: str) -> set:
+    """Ids of the jobs an earlier run completed, skipping a line cut short by a crash."""
+    finished = set()
+    if not os.path.exists(path):
+        return finished
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if result.get("status") == "done":
+                finished.add(result["id"])
+    return finished
+
+
+async def run_job(service: Callable[[str], GraphService], job: dict) -> dict:
+    """Run one job through its agent's graph; failures are reported in the result, not raised."""
+    result = {"id": job["id"], "agent": job["agent"]}
+    started_at = time.perf_counter()
+    try:
+        if "error" in job:
+            raise ValueError(job["error"])
+        if job["agent"] not in AGENTS:
+            raise ValueError(f"unknown agent {job['agent']!r}, expected one of {', '.join(sorted(AGENTS))}")
+        graph_service = service(job["agent"])
+        with span(f"request {job['agent']}", kind="request", **{"request.id": job["id"]}):
+            state, config = await graph_service.prepare(job["payload"], job["id"])
+            final_state = await graph_service.graph.ainvoke(state, config)
+        await graph_service.finish(config)
+        result.update(status="done", response=graph_service.agent.to_response(final_state))
+    except Exception as e:
+        result.update(status="error", error=f"{type(e).__name__}: {e}")
+        if isinstance(e, Backpressure):
+            result["retry_after"] = e.retry_after
+    result["seconds"] = round(time.perf_counter() - started_at, 3)
+    return result
+
+
+async def run_jobs(
+    service: Callable[[str], GraphService],
+    jobs: Iterable[dict],
+    concurrency: int,
+    emit: Callable[[dict], None],
+):
+    """
+    Run jobs on `concurrency` workers sharing this process's agents, caches
+    and clients, handing each result to `emit` as soon as it is ready.
+    Jobs are read as workers free up, so any number of them fits in memory.
+    """
+    pending: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def worker():
+        while (job := await pending.get()) is not None:
+            emit(await run_job(service, job))
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        for job in jobs:
+            await pending.put(job)
+        for _ in workers:
+            await pending.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+        await close_http_client()
+
+
+def service_loader(checkpoints: Optional[str] = None) -> Callable[[str], GraphService]:
+    """Load each agent the first time a job asks for it."""
+    services: Dict[str, GraphService] = {}
+
+    def service(name: str) -> GraphService:
+        if name not in services:
+            services[name] = load_service(name, checkpoints)
+        return services[name]
+
+    return service
+
+
+def shard_jobs(args, skip: set, shard: int, shards: int) -> Iterator[dict]:
+    for index, job in enumerate(read_jobs(args.input, args.agent)):
+        if index % shards == shard and job["id"] not in skip:
+            yield job
+
+
+def run_shard(args, skip: set, shard: int, shards: int, emit: Callable[[dict], None]):
+    """Run this process's share of the jobs."""
+    if shards > 1:
+        share_limits(1 / shards)
+    configure_tracing(f"{args.trace}.{shard}" if args.trace and shards > 1 else args.trace)
+    # The agents resolve ../config relative to their own directory, which all share
+    os.chdir(os.path.join(ROOT, "web-agent"))
+    with request_priority(args.priority):
+        jobs = shard_jobs(args, skip, shard, shards)
+        asyncio.run(run_jobs(service_loader(args.checkpoints), jobs, args.concurrency, emit))
+
+
+def worker_process(args, skip: set, shard: int, shards: int, results: multiprocessing.Queue):
+    try:
+        run_shard(args, skip, shard, shards, results.put)
+    finally:
+        # Tells the parent this worker is done, however it ended
+        results.put(None)
+
+
+class ResultWriter:
+    """Appends results to the output file as they come in and reports progress."""
+
+    def __init__(self, path: str):
+        # A crash may have cut the last line short, start on a fresh one
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                partial = f.read(1) != b"\n"
+        else:
+            partial = False
+        self._file = open(path, "a")
+        if partial:
+            self._file.write("\n")
+        self.done = 0
+        self.failed = 0
+        self.started_at = time.perf_counter()
+
+    def write(self, result: dict):
+        self._file.write(json.dumps(result, default=str) + "\n")
+        self._file.flush()
+        if result["status"] == "done":
+            self.done += 1
+        else:
+            self.failed += 1
+            print(f"{result['id']}: {result['error']}", file=sys.stderr)
+        completed = self.done + self.failed
+        if completed % 10 == 0:
+            self.report()
+
+    def report(self):
+        seconds = time.perf_counter() - self.started_at
+        print(
+            f"{self.done} done, {self.failed} failed in {seconds:.1f}s "
+            f"({(self.done + self.failed) / seconds if seconds else 0.0:.2f} jobs/s)",
+            file=sys.stderr,
+        )
+
+    def close(self):
+        self._file.close()
+
+
+def run_processes(args, skip: set, writer: ResultWriter):
+    """Split the jobs across worker processes, writing their results from this one."""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    workers = [
+        context.Process(target=worker_process, args=(args, skip, shard, args.processes, results), daemon=True)
+        for shard in range(args.processes)
+    ]
+    for process in workers:
+        process.start()
+    running = len(workers)
+    while running:
+        try:
+            result = results.get(timeout=WORKER_POLL_SECONDS)
+        except queue.Empty:
+            # A worker killed outright never sends its end marker
+            if not any(process.is_alive() for process in workers) and results.empty():
+                break
+            continue
+        if result is None:
+            running -= 1
+        else:
+            writer.write(result)
+    for process in workers:
+        process.join()
+    failed = [shard for shard, process in enumerate(workers) if process.exitcode]
+    if failed:
+        print(f"Worker processes {failed} failed, resume the run to finish their jobs", file=sys.stderr)
+
+
+def main():
+    parser = ArgumentParser(description="Run a JSONL file of agent requests and write the results as JSONL")
+    parser.add_argument("input", help="JSONL file, one request body per line with an optional \"id\" and \"agent\"")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file the results are appended to")
+    parser.add_argument("--agent", choices=sorted(AGENTS), help="Agent for lines that don't name one")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Requests running at the same time in each process",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Worker processes; each gets an equal share of the jobs and of the upstream rate limits",
+    )
+    parser.add_argument(
+        "--priority",
+        choices=sorted(MAX_WAIT),
+        default=BATCH,
+        help="Upstream rate limiting priority of the requests",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Run every job again instead of resuming, replacing the output file",
+    )
+    parser.add_argument(
+        "--trace",
+        help="Write spans to this OTLP JSON file, one per process when there are several (default: $TRACE_FILE)",
+    )
+    parser.add_argument(
+        "--checkpoints",
+        help="Directory for SQLite checkpoints, so jobs that failed midway resume from their last completed step",
+    )
+    args = parser.parse_args()
+    args.input = os.path.abspath(args.input)
+    args.checkpoints = os.path.abspath(args.checkpoints) if args.checkpoints else None
+    args.output = os.path.abspath(args.output)
+    args.trace = os.path.abspath(args.trace) if args.trace else os.getenv("TRACE_FILE")
+
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    # Failed jobs are run again on resume, only completed ones are skipped
+    skip = finished_jobs(args.output)
+    if skip:
+        print(f"Resuming, {len(skip)} jobs already done", file=sys.stderr)
+
+    writer = ResultWriter(args.output)
+    try:
+        if args.processes > 1:
+            run_processes(args, skip, writer)
+        else:
+            run_shard(args, skip, 0, 1, writer.write)
+    finally:
+        writer.report()
+        writer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+End-to-end benchmark of the three agent graphs against offline fakes.
+
+Every upstream (Gemini, SerpAPI, Reddit, Yahoo) is replaced by the
+deterministic stand-ins in Fakes.py, with configurable latency and payload
+size distributions. Each graph is compiled once, then driven with
+`--requests` requests at `--concurrency`, reporting throughput and
+end-to-end latency percentiles plus per-node latency percentiles. A second,
+sequential pass under tracemalloc measures peak memory per node; nodes
+running in parallel branches share their peak.
+
+Usage:
+    python benchmarks/Agents.py --requests 50 --concurrency 8 --time-scale 0.1
+    python benchmarks/Agents.py --agent financial-agent --tickers 40 --json results.json
+"""
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from functools import partial
+from typing import Any, Dict, List
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import shared.Clients
+from shared.Http import close_http_client
+from shared.RateLimit import UPSTREAM_LIMITS, rate_limit_stats
+from shared.SingleFlight import coalescing_stats
+from main import AGENTS, load_agent
+from Fakes import (Distribution, FakeChatModel, FakeGenaiClient, FakeReddit, FakeUpstream, Profile,
+                   fake_yf_data, fake_yfinance)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Linearly interpolated percentile, `q` in [0, 100]."""
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class NodeProfiler(BaseCallbackHandler):
+    """
+    Callback handler recording the wall time of every graph node run, and
+    with `trace_memory` the peak traced memory above the level at node start.
+    """
+
+    # Called on the thread running the node, so timings don't include callback scheduling
+    run_inline = True
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.latencies: Dict[str, List[float]] = {}
+        self.peaks: Dict[str, int] = {}
+        # Peak over the whole run, kept across the per-node peak resets
+        self.peak = 0
+        self._running: Dict[Any, tuple] = {}
+        self._lock = threading.Lock()
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        # Nested runnables inherit the node metadata, only the node run itself carries its name
+        if node is None or kwargs.get("name") != node:
+            return
+        with self._lock:
+            baseline = 0
+            if self.trace_memory:
+                if not self._running:
+                    self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+                    tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+            self._running[run_id] = (node, time.perf_counter(), baseline)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        with self._lock:
+            entry = self._running.pop(run_id, None)
+            if entry is None:
+                return
+            node, started_at, baseline = entry
+            self.latencies.setdefault(node, []).append(time.perf_counter() - started_at)
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1] - baseline
+                self.peaks[node] = max(self.peaks.get(node, 0), peak)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self.on_chain_end(None, run_id=run_id)
+
+
+def topic(i: int, args) -> int:
+    """Topic of the i-th request; with --distinct, topics repeat so identical requests overlap."""
+    return i % args.distinct if args.distinct else i
+
+
+def web_agent_payloads(count: int, args) -> List[dict]:
+    return [
+        {
+            "question": f"What changed in benchmark topic {topic(i, args)} this year?",
+            "initial_queries": args.initial_queries,
+            "max_loops": args.max_loops,
+        }
+        for i in range(count)
+    ]
+
+
+def web_agent_2_payloads(count: int, args) -> List[dict]:
+    return [{"question": f"What do people think about benchmark topic {topic(i, args)}?"} for i in range(count)]
+
+
+def financial_agent_payloads(count: int, args) -> List[dict]:
+    universe = [f"T{i:03d}" for i in range(args.universe)]
+    payloads = []
+    for i in range(count):
+        rng = Profile(seed=args.seed).rng("tickers", topic(i, args))
+        payloads.append({"tickers": rng.sample(universe, min(args.tickers, len(universe)))})
+    return payloads
+
+
+PAYLOADS = {
+    "web-agent": web_agent_payloads,
+    "web-agent-2": web_agent_2_payloads,
+    "financial-agent": financial_agent_payloads,
+}
+
+
+def build_agent(name: str, profile: Profile, upstream: FakeUpstream):
+    """Construct and compile an agent, then swap every upstream client for its fake."""
+    agent_module, agent, graph = load_agent(name)
+    if name == "web-agent":
+        agent.client = FakeGenaiClient(profile)
+    elif name == "web-agent-2":
+        agent_module.SERP_API_URL = f"{upstream.url}/search.json"
+        agent.reddit = FakeReddit(profile)
+    else:
+        agent_module.YfData = fake_yf_data(profile)
+        agent_module.yf = fake_yfinance(profile)
+    return agent, graph
+
+
+async def drive(agent, graph, payloads: List[dict], concurrency: int, profiler: NodeProfiler, search_cache: bool):
+    """Run every payload through `graph`, at most `concurrency` at once; returns (latencies, errors, seconds)."""
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = []
+
+    async def one(payload):
+        async with slots:
+            state, config = await agent.from_request(payload)
+            config = dict(config or {})
+            if "configurable" in config and not search_cache:
+                config["configurable"] = {**config["configurable"], "search_cache_path": ""}
+            config["callbacks"] = [profiler]
+            started_at = time.perf_counter()
+            try:
+                await graph.ainvoke(state, config)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                return
+            latencies.append(time.perf_counter() - started_at)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(one(payload) for payload in payloads))
+    return latencies, errors, time.perf_counter() - started_at
+
+
+def benchmark(name: str, args, profile: Profile, upstream: FakeUpstream) -> dict:
+    # Agents resolve caches under ../config, keep them inside a throwaway directory
+    workdir = tempfile.mkdtemp(prefix="agent-bench-")
+    os.makedirs(os.path.join(workdir, "agent"))
+    os.chdir(os.path.join(workdir, "agent"))
+    shared.Clients.clear_clients()
+
+    agent, graph = build_agent(name, profile, upstream)
+    payloads = PAYLOADS[name](args.requests, args)
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+
+    async def run():
+        with output:
+            profiler = NodeProfiler()
+            latencies, errors, seconds = await drive(
+                agent, graph, payloads, args.concurrency, profiler, args.search_cache
+            )
+            memory_profiler = NodeProfiler(trace_memory=True)
+            memory_payloads = PAYLOADS[name](args.requests + args.memory_requests, args)[args.requests:]
+            tracemalloc.start()
+            try:
+                await drive(agent, graph, memory_payloads, 1, memory_profiler, args.search_cache)
+                peak = max(memory_profiler.peak, tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+                await close_http_client()
+        return profiler, latencies, errors, seconds, memory_profiler, peak
+
+    coalescing_before = coalescing_stats()
+    limits_before = rate_limit_stats()
+    profiler, latencies, errors, seconds, memory_profiler, peak = asyncio.run(run())
+    coalescing = {
+        group: {key: value - coalescing_before.get(group, {}).get(key, 0) for key, value in stats.items()}
+        for group, stats in coalescing_stats().items()
+    }
+    rate_limits = {
+        upstream: {key: stats[key] - limits_before.get(upstream, {}).get(key, 0) for key in ("used", "throttled", "rejected")}
+        for upstream, stats in rate_limit_stats().items()
+    }
+    return {
+        "agent": name,
+        "requests": len(payloads),
+        "concurrency": args.concurrency,
+        "errors": errors,
+        "seconds": seconds,
+        "throughput": len(latencies) / seconds if seconds else 0.0,
+        "latency": {f"p{q}": percentile(latencies, q) for q in (50, 95, 99)},
+        "peak_memory_bytes": peak,
+        "coalescing": {group: stats for group, stats in coalescing.items() if stats["calls"]},
+        "rate_limits": {upstream: stats for upstream, stats in rate_limits.items() if stats["used"] or stats["rejected"]},
+        "nodes": {
+            node: {
+                "calls": len(values),
+                **{f"p{q}": percentile(values, q) for q in (50, 95, 99)},
+                "peak_memory_bytes": memory_profiler.peaks.get(node),
+            }
+            for node, values in profiler.latencies.items()
+        },
+    }
+
+
+def print_result(result: dict):
+    latency = result["latency"]
+    print(
+        f"{result['agent']}: {result['requests']} requests at concurrency {result['concurrency']} "
+        f"in {result['seconds']:.2f}s, {result['throughput']:.2f} req/s, "
+        f"p50 {latency['p50']:.3f}s p95 {latency['p95']:.3f}s p99 {latency['p99']:.3f}s, "
+        f"peak traced memory {result['peak_memory_bytes'] / 2 ** 20:.1f} MiB, {len(result['errors'])} errors"
+    )
+    for error in sorted(set(result["errors"]))[:5]:
+        print(f"    error: {error}")
+    for group, stats in result["coalescing"].items():
+        print(f"    {group}: {stats['calls']} upstream calls, {stats['coalesced']} coalesced")
+    for upstream, stats in result["rate_limits"].items():
+        print(f"    {upstream} limiter: {stats['used']} calls paced, {stats['throttled']} throttled, {stats['rejected']} rejected")
+    print(f"    {'node':<24} {'calls':>6} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'peak KiB':>10}")
+    for node, stats in result["nodes"].items():
+        peak = stats["peak_memory_bytes"]
+        print(
+            f"    {node:<24} {stats['calls']:>6} {stats['p50']:>8.3f} {stats['p95']:>8.3f} "
+            f"{stats['p99']:>8.3f} {'-' if peak is None else f'{peak / 1024:.0f}':>10}"
+        )
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark the agent graphs against offline fakes")
+    parser.add_argument("--agent", action="append", choices=sorted(AGENTS), help="Agent to run, repeat for several (default: all)")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--memory-requests", type=int, default=3, help="Sequential requests traced for peak memory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--distinct", type=int,
+        help="Number of distinct questions or ticker sets, lower it to send identical concurrent requests",
+    )
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Multiplier applied to every upstream latency")
+    parser.add_argument("--gemini-latency", type=Distribution.parse, default=Distribution(0.8, 0.3), help="Seconds, as median[:sigma]")
+    parser.add_argument("--serp-latency", type=Distribution.parse, default=Distribution(0.5, 0.3))
+    parser.add_argument("--reddit-latency", type=Distribution.parse, default=Distribution(0.6, 0.4))
+    parser.add_argument("--yahoo-latency", type=Distribution.parse, default=Distribution(0.3, 0.3))
+    parser.add_argument("--text-chars", type=Distribution.parse, default=Distribution(2000, 0.5), help="Size of search texts and snippets")
+    parser.add_argument("--answer-tokens", type=Distribution.parse, default=Distribution(300, 0.3))
+    parser.add_argument("--results", type=int, default=5, help="Sources, results and queries per upstream call")
+    parser.add_argument("--initial-queries", type=int, default=3)
+    parser.add_argument("--max-loops", type=int, default=2)
+    parser.add_argument("--tickers", type=int, default=10, help="Tickers per financial-agent request")
+    parser.add_argument("--universe", type=int, default=100, help="Number of distinct tickers requests draw from")
+    parser.add_argument("--search-cache", action="store_true", help="Keep web-agent's grounded search cache enabled")
+    parser.add_argument(
+        "--rate-limits", action="store_true",
+        help="Pace the fakes with the real upstream rate limits (default: limits high enough to never wait)",
+    )
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the agents' own output")
+    args = parser.parse_args()
+    # Each agent runs from its own temporary directory
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    profile = Profile(
+        gemini_latency=args.gemini_latency,
+        serp_latency=args.serp_latency,
+        reddit_latency=args.reddit_latency,
+        yahoo_latency=args.yahoo_latency,
+        text_chars=args.text_chars,
+        answer_tokens=args.answer_tokens,
+        results=args.results,
+        time_scale=args.time_scale,
+        seed=args.seed,
+    )
+    # Agents read their keys at construction; the fakes never look at them
+    for key in ("GEMINI_API_KEY", "SERP_KEY", "REDDIT_CLIENT_ID", "REDDIT_SECRET"):
+        os.environ[key] = "benchmark"
+    if not args.rate_limits:
+        for upstream in UPSTREAM_LIMITS:
+            os.environ[f"RATE_LIMIT_{upstream.upper()}"] = "100000:100000"
+    shared.Clients.ChatGoogleGenerativeAI = partial(FakeChatModel, profile=profile)
+
+    upstream = FakeUpstream(profile).start()
+    results = []
+    try:
+        for name in args.agent or sorted(AGENTS):
+            result = benchmark(name, args, profile, upstream)
+            print_result(result)
+            results.append(result)
+    finally:
+        upstream.stop()
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Micro-benchmark for web-agent's citation marker insertion.
+
+Builds synthetic grounded responses with thousands of grounding supports and
+compares `insert_citation_markers` against the previous per-citation slicing
+implementation, checking that both produce the same text.
+
+Usage:
+    python benchmarks/CitationMarkers.py --supports 1000 5000 --repeat 5
+"""
+import os
+import random
+import sys
+import timeit
+from argparse import ArgumentParser
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "web-agent"))
+from Utils import insert_citation_markers, iter_cited_text
+
+
+def slicing_insert_citation_markers(text, citations_list):
+    """The previous implementation, kept as the baseline: O(n·k) string rebuilding."""
+    sorted_citations = sorted(
+        citations_list, key=lambda c: (c["end_index"], c["start_index"]), reverse=True
+    )
+    modified_text = text
+    for citation_info in sorted_citations:
+        end_idx = citation_info["end_index"]
+        marker_to_insert = ""
+        for segment in citation_info["segments"]:
+            marker_to_insert += f" [{segment['label']}]({segment['short_url']})"
+        modified_text = (
+            modified_text[:end_idx] + marker_to_insert + modified_text[end_idx:]
+        )
+    return modified_text
+
+
+def synthetic_response(supports: int, chunks: int = 50, seed: int = 0):
+    """Build a text of one sentence per support and a citation for each sentence."""
+    rng = random.Random(seed)
+    sentences = [
+        f"Sentence {i} states a fact that was found during grounded research. "
+        for i in range(supports)
+    ]
+    text = "".join(sentences)
+    citations = []
+    start = 0
+    for sentence in sentences:
+        end = start + len(sentence) - 1
+        citations.append(
+            {
+                "start_index": start,
+                "end_index": end,
+                "segments": [
+                    {
+                        "label": f"source{chunk}",
+                        "short_url": f"https://vertexaisearch.cloud.google.com/id/-{chunk}",
+                        "value": f"https://example.com/{chunk}",
+                    }
+                    for chunk in rng.sample(range(chunks), rng.randint(1, 3))
+                ],
+            }
+        )
+        start += len(sentence)
+    rng.shuffle(citations)
+    return text, citations
+
+
+def main():
+    parser = ArgumentParser(description="Benchmark citation marker insertion")
+    parser.add_argument("--supports", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'supports':>10} {'text chars':>12} {'slicing ms':>12} {'single-pass ms':>15} {'speedup':>8}")
+    for supports in args.supports:
+        text, citations = synthetic_response(supports)
+        expected = slicing_insert_citation_markers(text, citations)
+        assert insert_citation_markers(text, citations) == expected
+        assert "".join(iter_cited_text(text, citations)) == expected
+
+        slicing = min(timeit.repeat(
+            lambda: slicing_insert_citation_markers(text, citations), number=1, repeat=args.repeat
+        ))
+        single_pass = min(timeit.repeat(
+            lambda: insert_citation_markers(text, citations), number=1, repeat=args.repeat
+        ))
+        print(
+            f"{supports:>10} {len(text):>12} {slicing * 1000:>12.2f} "
+            f"{single_pass * 1000:>15.2f} {slicing / single_pass:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
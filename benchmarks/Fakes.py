@@ -0,0 +1,457 @@
+"""
+Deterministic offline stand-ins for the services the agents call.
+
+- `FakeGenaiClient` replaces google.genai's client for grounded web search.
+- `FakeChatModel` replaces ChatGoogleGenerativeAI, including streaming and
+  structured output.
+- `FakeUpstream` is a local HTTP server answering SerpAPI searches.
+- `FakeReddit` replaces praw, including comment trees.
+- `FakeYfData`, `FakeTicker` and `fake_history` replace the yfinance calls.
+
+Latencies and payload sizes are drawn from lognormal distributions seeded by
+the request content, so the same run produces the same upstream behaviour.
+"""
+import asyncio
+import hashlib
+import math
+import random
+import re
+import threading
+import time
+import types
+from typing import Any, Iterator, List, Optional, get_args, get_origin
+
+import numpy as np
+import pandas as pd
+from aiohttp import web
+from google.genai import types as genai_types
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from praw.models import MoreComments
+from pydantic import BaseModel
+
+WORDS = (
+    "market research source report growth company analysis data result evidence "
+    "study price risk trend policy model question answer review forecast signal"
+).split()
+
+
+class Distribution:
+    """Lognormal distribution given by its median and the sigma of its log, 0 for a constant."""
+
+    def __init__(self, median: float, sigma: float = 0.0):
+        self.median = median
+        self.sigma = sigma
+
+    @classmethod
+    def parse(cls, value: str) -> "Distribution":
+        """Parse "median" or "median:sigma", e.g. "0.8:0.3"."""
+        median, _, sigma = value.partition(":")
+        return cls(float(median), float(sigma or 0))
+
+    def sample(self, rng: random.Random) -> float:
+        if self.sigma <= 0:
+            return self.median
+        return self.median * math.exp(rng.gauss(0, self.sigma))
+
+    def __repr__(self):
+        return f"{self.median:g}:{self.sigma:g}"
+
+
+class Profile:
+    """
+    Upstream behaviour shared by all fakes.
+
+    `time_scale` multiplies every latency, so a run can keep the shape of a
+    production profile while finishing quickly.
+    """
+
+    def __init__(
+        self,
+        gemini_latency: Distribution = Distribution(0.8, 0.3),
+        serp_latency: Distribution = Distribution(0.5, 0.3),
+        reddit_latency: Distribution = Distribution(0.6, 0.4),
+        yahoo_latency: Distribution = Distribution(0.3, 0.3),
+        text_chars: Distribution = Distribution(2000, 0.5),
+        answer_tokens: Distribution = Distribution(300, 0.3),
+        results: int = 5,
+        time_scale: float = 1.0,
+        seed: int = 0,
+    ):
+        self.gemini_latency = gemini_latency
+        self.serp_latency = serp_latency
+        self.reddit_latency = reddit_latency
+        self.yahoo_latency = yahoo_latency
+        self.text_chars = text_chars
+        self.answer_tokens = answer_tokens
+        self.results = results
+        self.time_scale = time_scale
+        self.seed = seed
+
+    def rng(self, *key: Any) -> random.Random:
+        """Random generator seeded by the run seed and `key`, independent of call order."""
+        return random.Random(f"{self.seed}:{':'.join(map(str, key))}")
+
+    def delay(self, latency: Distribution, rng: random.Random) -> float:
+        return latency.sample(rng) * self.time_scale
+
+    def text(self, rng: random.Random, chars: Optional[float] = None) -> str:
+        chars = int(self.text_chars.sample(rng) if chars is None else chars)
+        words = []
+        length = 0
+        while length < chars:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return " ".join(words)
+
+
+def digest(text: str) -> str:
+    return hashlib.blake2b(text.encode(), digest_size=6).hexdigest()
+
+
+class FakeModels:
+    def __init__(self, profile: Profile):
+        self.profile = profile
+        self.calls = 0
+
+    def generate_content(self, model: str, contents: str, config: Any = None):
+        self.calls += 1
+        rng = self.profile.rng("gemini-search", contents)
+        time.sleep(self.profile.delay(self.profile.gemini_latency, rng))
+
+        chunks = [
+            genai_types.GroundingChunk(web=genai_types.GroundingChunkWeb(
+                uri=f"https://example.com/{digest(contents)}/{i}", title=f"source{i}.example.com",
+            ))
+            for i in range(self.profile.results)
+        ]
+        # One support per sentence, citing one to three chunks
+        sentences = [f"{self.profile.text(rng, rng.randint(60, 200)).capitalize()}. " for _ in range(
+            max(1, int(self.profile.text_chars.sample(rng)) // 130)
+        )]
+        supports = []
+        start = 0
+        for sentence in sentences:
+            end = start + len(sentence) - 1
+            supports.append(genai_types.GroundingSupport(
+                segment=genai_types.Segment(start_index=start, end_index=end),
+                grounding_chunk_indices=rng.sample(range(len(chunks)), min(len(chunks), rng.randint(1, 3))),
+            ))
+            start += len(sentence)
+        text = "".join(sentences)
+        return genai_types.GenerateContentResponse(
+            candidates=[genai_types.Candidate(
+                content=genai_types.Content(parts=[genai_types.Part(text=text)], role="model"),
+                grounding_metadata=genai_types.GroundingMetadata(
+                    grounding_chunks=chunks, grounding_supports=supports,
+                ),
+            )],
+            usage_metadata=genai_types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=len(contents) // 4,
+                candidates_token_count=len(text) // 4,
+                total_token_count=(len(contents) + len(text)) // 4,
+            ),
+        )
+
+
+class FakeGenaiClient:
+    """Stand-in for google.genai.Client, only `models.generate_content` is used by the agents."""
+
+    def __init__(self, profile: Profile):
+        self.models = FakeModels(profile)
+
+
+def build_structured(schema: type, prompt: str, rng: random.Random, profile: Profile) -> BaseModel:
+    """Build a plausible instance of `schema` for `prompt`."""
+    if schema.__name__ == "Reflection":
+        # Never sufficient, so runs do exactly max_research_loops loops; the
+        # prompt digest keeps follow-ups unique across loops and requests
+        return schema(
+            is_sufficient=False,
+            knowledge_gap=profile.text(rng, 120),
+            follow_up_queries=[f"follow up {digest(prompt)} {i}" for i in range(2)],
+        )
+    if schema.__name__ == "FinancialSentimentBatch":
+        tickers = re.findall(r"^- (\S+): ", prompt, flags=re.MULTILINE)
+        analysis = schema.model_fields["analyses"].annotation.__args__[0]
+        return schema(analyses=[
+            analysis(tinker=ticker, overall_sentiment=profile.text(rng, 200)) for ticker in tickers
+        ])
+
+    values = {}
+    for name, field in schema.model_fields.items():
+        annotation = field.annotation
+        if annotation is bool:
+            values[name] = rng.random() < 0.5
+        elif get_origin(annotation) in (list, List) and get_args(annotation) == (str,):
+            values[name] = [f"{profile.text(rng, 40)} {digest(prompt)} {i}" for i in range(profile.results)]
+        elif annotation in (str, Optional[str]):
+            values[name] = profile.text(rng, 200)
+    return schema(**values)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Stand-in for ChatGoogleGenerativeAI: answers after a sampled latency,
+    streams token by token, and returns synthetic structured output.
+
+    Accepts the constructor arguments the client registry passes, so it can
+    replace `shared.Clients.ChatGoogleGenerativeAI` directly.
+    """
+
+    model: str = "fake"
+    temperature: float = 0.0
+    max_retries: int = 0
+    api_key: Optional[str] = None
+    profile: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini"
+
+    @staticmethod
+    def prompt_text(messages) -> str:
+        return "\n".join(str(message.content) for message in messages)
+
+    def usage(self, prompt: str, output_tokens: int) -> dict:
+        input_tokens = len(prompt) // 4
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+
+    def answer_tokens(self, prompt: str) -> List[str]:
+        rng = self.profile.rng("gemini-answer", prompt)
+        return [f"{rng.choice(WORDS)} " for _ in range(int(self.profile.answer_tokens.sample(rng)))]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prompt = self.prompt_text(messages)
+        tokens = self.answer_tokens(prompt)
+        time.sleep(self.profile.delay(self.profile.gemini_latency, self.profile.rng("gemini-latency", prompt)))
+        message = AIMessage(content="".join(tokens), usage_metadata=self.usage(prompt, len(tokens)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        prompt = self.prompt_text(messages)
+        tokens = self.answer_tokens(prompt)
+        # Time to first token is the sampled latency, the rest streams over half as long again
+        latency = self.profile.delay(self.profile.gemini_latency, self.profile.rng("gemini-latency", prompt))
+        time.sleep(latency)
+        for token in tokens:
+            time.sleep(latency / 2 / len(tokens))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    def with_structured_output(self, schema, include_raw: bool = False, **kwargs):
+        profile = self.profile
+
+        def prepare(prompt):
+            prompt = prompt if isinstance(prompt, str) else str(prompt)
+            rng = profile.rng("gemini-structured", schema.__name__, prompt)
+            return prompt, rng, profile.delay(profile.gemini_latency, rng)
+
+        def result(prompt, rng):
+            parsed = build_structured(schema, prompt, rng, profile)
+            if not include_raw:
+                return parsed
+            raw = AIMessage(content="", usage_metadata=self.usage(prompt, len(parsed.model_dump_json()) // 4))
+            return {"raw": raw, "parsed": parsed, "parsing_error": None}
+
+        def invoke(prompt):
+            prompt, rng, delay = prepare(prompt)
+            time.sleep(delay)
+            return result(prompt, rng)
+
+        async def ainvoke(prompt):
+            prompt, rng, delay = prepare(prompt)
+            await asyncio.sleep(delay)
+            return result(prompt, rng)
+
+        return RunnableLambda(invoke, afunc=ainvoke, name=f"{schema.__name__}Output")
+
+
+class FakeUpstream:
+    """
+    Local HTTP server answering SerpAPI searches, run on its own thread and
+    event loop so it doesn't compete with the agents for the benchmark's loop.
+    """
+
+    def __init__(self, profile: Profile):
+        self.profile = profile
+        self.requests = 0
+        self.url = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="fake-upstream", daemon=True)
+        self._runner = None
+
+    async def serp_search(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        query = request.query.get("q", "")
+        rng = self.profile.rng("serp", query)
+        await asyncio.sleep(self.profile.delay(self.profile.serp_latency, rng))
+        return web.json_response({"organic_results": [
+            {
+                "position": i + 1,
+                "title": self.profile.text(rng, 60),
+                "link": f"https://example.com/{digest(query)}/{i}",
+                "snippet": self.profile.text(rng),
+            }
+            for i in range(self.profile.results * 2)
+        ]})
+
+    async def _start(self):
+        app = web.Application()
+        app.add_routes([web.get("/search.json", self.serp_search)])
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    def start(self) -> "FakeUpstream":
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def fake_comments(profile: Profile, key: str, depth: int = 0) -> list:
+    """A level of a comment tree: `results` comments with replies, and a stub hiding more."""
+    rng = profile.rng("comments", key)
+    level = [
+        types.SimpleNamespace(
+            body=profile.text(rng, profile.text_chars.median / 4),
+            score=rng.randint(0, 500),
+            replies=fake_comments(profile, f"{key}.{i}", depth + 1) if depth < 2 else [],
+        )
+        for i in range(profile.results)
+    ]
+    return level + [FakeMoreComments(profile, f"{key}.more", depth)]
+
+
+class FakeMoreComments(MoreComments):
+    """A "load more comments" stub whose expansion costs another request."""
+
+    def __init__(self, profile: Profile, key: str, depth: int):
+        self.profile = profile
+        self.key = key
+        self.depth = depth
+
+    def comments(self, *, update: bool = True) -> list:
+        rng = self.profile.rng("more", self.key)
+        time.sleep(self.profile.delay(self.profile.reddit_latency, rng))
+        return fake_comments(self.profile, self.key, self.depth)[:-1]
+
+
+class FakeSubmission:
+    """Submission whose comment tree is fetched, with a delay, on first access."""
+
+    def __init__(self, profile: Profile, submission_id: str):
+        self.profile = profile
+        self.id = submission_id
+        self.comment_sort = "confidence"
+        self.comment_limit = None
+        self._comments = None
+
+    @property
+    def comments(self) -> list:
+        if self._comments is None:
+            rng = self.profile.rng("submission", self.id)
+            time.sleep(self.profile.delay(self.profile.reddit_latency, rng))
+            self._comments = fake_comments(self.profile, self.id)
+        return self._comments
+
+
+class FakeReddit:
+    """Stand-in for praw.Reddit's `subreddit(...).search(...)` and `submission(...)`."""
+
+    def __init__(self, profile: Profile):
+        self.profile = profile
+
+    def subreddit(self, name: str) -> "FakeReddit":
+        return self
+
+    def submission(self, id: str) -> FakeSubmission:
+        return FakeSubmission(self.profile, id)
+
+    def search(self, query: str, limit: int = 5):
+        rng = self.profile.rng("reddit", query)
+        time.sleep(self.profile.delay(self.profile.reddit_latency, rng))
+        return [
+            types.SimpleNamespace(
+                id=f"{digest(query)}{i}",
+                title=self.profile.text(rng, 60),
+                selftext=self.profile.text(rng),
+                url=f"https://reddit.com/r/all/comments/{digest(query)}{i}",
+            )
+            for i in range(limit)
+        ]
+
+
+def fake_quote(profile: Profile, ticker: str) -> dict:
+    rng = profile.rng("quote", ticker)
+    return {
+        "symbol": ticker,
+        "regularMarketTime": int(time.time()),
+        "forwardPE": round(rng.uniform(5, 60), 2),
+        "priceToBook": round(rng.uniform(0.5, 20), 2),
+        "revenuePerShare": round(rng.uniform(1, 100), 2),
+        "exchangeTimezoneName": "America/New_York",
+    }
+
+
+def fake_yf_data(profile: Profile) -> type:
+    """Stand-in for yfinance's YfData, answering batched quote requests."""
+
+    class FakeYfData:
+        def get_raw_json(self, url: str, params: Optional[dict] = None, timeout: int = 30):
+            tickers = params["symbols"].split(",")
+            time.sleep(profile.delay(profile.yahoo_latency, profile.rng("yahoo-quote", params["symbols"])))
+            return {"quoteResponse": {"result": [fake_quote(profile, ticker) for ticker in tickers]}}
+
+    return FakeYfData
+
+
+def fake_yfinance(profile: Profile) -> types.SimpleNamespace:
+    """Stand-in for the yfinance module, with `Ticker(...).info` and `.history` for per-ticker fetches."""
+
+    class FakeTicker:
+        def __init__(self, ticker: str):
+            self.ticker = ticker
+
+        @property
+        def info(self) -> dict:
+            time.sleep(profile.delay(profile.yahoo_latency, profile.rng("yahoo-info", self.ticker)))
+            return fake_quote(profile, self.ticker)
+
+        def history(self, **kwargs) -> pd.DataFrame:
+            return fake_history(profile, self.ticker)
+
+    return types.SimpleNamespace(Ticker=FakeTicker)
+
+
+def fake_history(profile: Profile, ticker: str, days: int = 5 * 252) -> pd.DataFrame:
+    """A daily OHLCV random walk shaped like `Ticker(...).history(...)`."""
+    rng = profile.rng("yahoo-history", ticker)
+    time.sleep(profile.delay(profile.yahoo_latency, rng))
+    generator = np.random.default_rng(rng.getrandbits(32))
+    index = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=days, tz="America/New_York")
+    close = 100 * np.exp(np.cumsum(generator.normal(0.0003, 0.02, size=days)))
+    return pd.DataFrame(
+        {
+            "Open": close * (1 + generator.normal(0, 0.005, days)),
+            "High": close * 1.01,
+            "Low": close * 0.99,
+            "Close": close,
+            "Volume": generator.integers(1e5, 1e7, days).astype(np.float64),
+        },
+        index=index,
+    )
@@ -1,94 +1,531 @@
 import datetime
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 import yfinance as yf
+from dotenv import load_dotenv
+from langgraph.graph import StateGraph, START, END
+from yfinance.data import YfData
 from State import FinancialState, CompanyData
-import requests
+from Schema import FinancialComparison, FinancialSentimentBatch
+from Prompt import comparison_instructions, sentiment_instructions
+from TickerResolver import TickerResolver
+from QuoteCache import QuoteCache
+from PriceHistory import PriceStore, compute_metrics, ticker_metrics
+from typing import List
 import asyncio
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.Checkpoint import model_codec
+from shared.Clients import get_structured_model
+from shared.Http import close_http_client, get_http_client
+from shared.RateLimit import BACKPRESSURE_RETRY, BATCH, as_backpressure, get_limiter, is_throttled, request_priority
+from shared.SingleFlight import single_flight
+from shared.Streaming import astream_events, print_event
+from shared.Tracing import configure_tracing, in_context, span, traced_node
+
+YAHOO_SEARCH_URL = "https://query2.finance.yahoo.com/v1/finance/search"
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36'
+YAHOO_QUOTE_URL = "https://query1.finance.yahoo.com/v7/finance/quote"
+# The only quote fields CompanyData and the quote cache need
+QUOTE_FIELDS = ["regularMarketTime", "forwardPE", "priceToBook", "revenuePerShare", "exchangeTimezoneName"]
+QUOTE_BATCH_SIZE = 50
+# Rough prompt budget per sentiment call, estimated at four characters per token
+SENTIMENT_BATCH_TOKENS = 4000
+# Error messages of a prompt over the model's context window, the only failure a smaller batch fixes
+CONTEXT_LENGTH_ERRORS = ("input token count", "context length", "context window", "maximum number of tokens", "too long")
+# Nodes whose LLM tokens are forwarded when streaming; sentiment is structured output, so none yet
+ANSWER_NODES = set()
+# State types stored in checkpoints, beyond what LangGraph serializes itself
+CHECKPOINT_CODECS = {
+    "CompanyData": model_codec(CompanyData), "FinancialComparison": model_codec(FinancialComparison),
+}
+
 class Agent:
-    def __init__(self, ticker="RACE"):
-        #TODO:
-        #   - make the functions async
-        #   - create llm for sentiment analysis
+    def __init__(self, ticker="RACE", max_concurrency=8):
+        load_dotenv("../config/.env")
+        self.api_key = os.getenv("GEMINI_API_KEY")
+        self.model = "gemini-1.5-flash"
         self.ticker = ticker
-        state = FinancialState(
-            question="Retrieve a financial analysis of these companies: Apple, Ferrari",
-            tickers=[self.ticker],
-        )
-        self.ticker_data_retrieval(state)
+        # yfinance is blocking, so fetches run on a bounded worker pool
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="ticker-fetch")
+        # Persisted so quotes carry over between runs and batch worker processes; empty keeps them in memory
+        self.quote_cache = QuoteCache(path=os.getenv("QUOTE_CACHE_PATH", "../config/quote_cache.sqlite3"))
+        self.price_store = PriceStore()
+        # One history refresh at a time per process, the store's file lock covers other processes
+        self.price_store_lock = asyncio.Lock()
+        self.resolver = TickerResolver(fetch=self.get_ticker, index_path=os.getenv("SYMBOL_INDEX_PATH"))
 
     @staticmethod
-    def get_ticker(company_name):
+    async def get_ticker(company_name):
+        """
+        Searches Yahoo for the company's ticker; None only when Yahoo found no match.
+
+        Failed lookups raise rather than return None, so the resolver doesn't cache them as unknown names.
+        """
         print("Retrieving ticker data for {}".format(company_name))
-        yfinance = "https://query2.finance.yahoo.com/v1/finance/search"
-        user_agent = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36'
+        user_agent = os.getenv("YAHOO_USER_AGENT", DEFAULT_USER_AGENT)
         params = {"q": company_name, "quotes_count": 1, "country": "United States"}
 
-        res = requests.get(url=yfinance, params=params, headers={'User-Agent': user_agent})
         try:
-            data = res.json()
-            company_code = data['quotes'][0]['symbol']
-            return company_code
+            async with get_limiter("yahoo").aslot():
+                data = await get_http_client().get_json(
+                    YAHOO_SEARCH_URL, params=params, headers={'User-Agent': user_agent}
+                )
+            quotes = data["quotes"]
+            return quotes[0]["symbol"] if quotes else None
         except Exception as e:
-            print("Error retrieving ticker data for {}".format(company_name))
-            return None
+            if is_throttled(e):
+                raise as_backpressure("yahoo", e) from e
+            # Not a ValueError, the request itself was fine
+            raise ConnectionError(f"Ticker lookup for {company_name} failed: {type(e).__name__}: {e}") from e
+
+    async def resolve_tickers(self, company_names: List[str]):
+        """Resolves company names to tickers through the cache and symbol index, dropping unknown names."""
+        symbols = await self.resolver.resolve_many(company_names)
+        return [symbol for symbol in dict.fromkeys(symbols.values()) if symbol is not None]
+
+    @staticmethod
+    def company_data_fields(info: dict):
+        """Maps Yahoo quote fields onto the CompanyData aliases."""
+        # Safely get data, using .get() to handle missing keys
+        return {
+            "last_updated": datetime.datetime.fromtimestamp(info["regularMarketTime"]).strftime("%Y-%m-%d"),
+            "forwardPE": info.get("forwardPE"),
+            "priceToBook": info.get("priceToBook"),
+            "revenuePerShare": info.get("revenuePerShare"),
+        }
+
+    @staticmethod
+    def fetch_quote_batch(tickers: List[str]):
+        """Fetches the CompanyData fields for many tickers with a single quote request."""
+        print(f"Fetching quotes for {', '.join(tickers)}...")
+        started_at = time.perf_counter()
+        try:
+            with span("yahoo.quote", kind="upstream", tickers=len(tickers)), get_limiter("yahoo").slot():
+                response = YfData().get_raw_json(
+                    YAHOO_QUOTE_URL,
+                    params={"symbols": ",".join(tickers), "fields": ",".join(QUOTE_FIELDS), "formatted": "false"},
+                )
+            quotes = (response.get("quoteResponse") or {}).get("result") or []
+        except Exception as e:
+            # Falling back to one request per ticker would only make throttling worse
+            if is_throttled(e):
+                raise as_backpressure("yahoo", e) from e
+            print(f"Batched quote request failed, falling back to per-ticker fetches: {e}")
+            return {}
+        latency = time.perf_counter() - started_at
+
+        results = {}
+        requested = set(tickers)
+        for quote in quotes:
+            ticker = quote.get("symbol")
+            # Symbols without a market time can't fill CompanyData, leave them to the per-ticker path
+            if ticker in requested and quote.get("regularMarketTime") is not None:
+                results[ticker] = {
+                    "ticker": ticker,
+                    "data": Agent.company_data_fields(quote),
+                    "timezone": quote.get("exchangeTimezoneName"),
+                    "latency": latency,
+                }
+        return results
+
+    async def fetch_quotes(self, tickers: List[str]):
+        """Fetches quotes for all tickers in batches of QUOTE_BATCH_SIZE, concurrently."""
+        loop = asyncio.get_running_loop()
+        batches = [tickers[i:i + QUOTE_BATCH_SIZE] for i in range(0, len(tickers), QUOTE_BATCH_SIZE)]
+        results = {}
+        for batch_results in await asyncio.gather(
+            *(loop.run_in_executor(self.executor, in_context(self.fetch_quote_batch), batch) for batch in batches)
+        ):
+            results.update(batch_results)
+        return results
 
     @staticmethod
     def fetch_single_ticker_data(ticker: str):
-        """Asynchronously fetches data for a single ticker."""
+        """Fetches data for a single ticker, sharing the call with concurrent fetches of the same ticker."""
+        result, _ = single_flight("yahoo.info").do(ticker.upper(), lambda: Agent.fetch_ticker_info(ticker))
+        return result
+
+    @staticmethod
+    def fetch_ticker_info(ticker: str):
         print(f"Fetching data for {ticker}...")
         try:
             # Use asyncio.to_thread to run the blocking yfinance call concurrently
-            ticker_yf = yf.Ticker(ticker)
-            info = ticker_yf.info
-
-            # Safely get data, using .get() to handle missing keys
-            data = {
-                "last_updated": datetime.datetime.fromtimestamp(info["regularMarketTime"]).strftime("%Y-%m-%d"),
-                "priceToEarnings": info.get("forwardPE"),
-                "priceToBook": info.get("priceToBook"),
-                "revenuePerShare": info.get("revenuePerShare"),
+            with span("yahoo.info", kind="upstream", ticker=ticker), get_limiter("yahoo").slot():
+                ticker_yf = yf.Ticker(ticker)
+                info = ticker_yf.info
+
+            return {
+                "ticker": ticker,
+                "data": Agent.company_data_fields(info),
+                "timezone": info.get("exchangeTimezoneName"),
             }
-            return {"ticker": ticker, "data": data}
         except Exception as e:
+            if is_throttled(e):
+                raise as_backpressure("yahoo", e) from e
             print(f"Error fetching data for {ticker}: {e}")
             return {"ticker": ticker, "error": str(e)}
 
-    def ticker_data_retrieval(self, state: FinancialState):
+    def timed_fetch(self, ticker: str):
+        """Fetches a single ticker and records how long the fetch itself took."""
+        started_at = time.perf_counter()
+        # Copied, the result may be shared with other requests
+        res = dict(self.fetch_single_ticker_data(ticker))
+        res["latency"] = time.perf_counter() - started_at
+        return res
+
+    async def iter_ticker_data(self, tickers: List[str]):
+        """Yields ticker results as soon as each fetch completes, at most max_concurrency at a time."""
+        loop = asyncio.get_running_loop()
+        fetches = [loop.run_in_executor(self.executor, in_context(self.timed_fetch), t) for t in dict.fromkeys(tickers)]
+        for fetch in asyncio.as_completed(fetches):
+            yield await fetch
+
+    async def iter_fresh_ticker_data(self, tickers: List[str]):
+        """Yields upstream results for tickers, batched first then per ticker, caching each one."""
+        if not tickers:
+            return
+        quotes = await self.fetch_quotes(tickers)
+        unresolved = [t for t in tickers if t not in quotes]
+        if unresolved:
+            print(f"Falling back to per-ticker fetches for {', '.join(unresolved)}")
+        for res in quotes.values():
+            self.quote_cache.put(res)
+            yield res
+        async for res in self.iter_ticker_data(unresolved):
+            self.quote_cache.put(res)
+            yield res
+
+    async def refresh_quotes(self, tickers: List[str]):
+        # Background refreshes only use Yahoo capacity no user request is waiting for
+        with request_priority(BATCH):
+            async for _ in self.iter_fresh_ticker_data(tickers):
+                pass
+
+    async def ticker_data_retrieval(self, state: FinancialState):
         """Node to retrieve stock data concurrently using asyncio."""
         print("Step 2: Retrieving data for all tickers concurrently...")
         tickers = state.get("tickers", [])
         if not tickers:
             print("No tickers found. Skipping data retrieval.")
-            return {"company_data": {}}
-
-        results = [self.fetch_single_ticker_data(t) for t in tickers]
+            return {"company_data": {}, "ticker_latency": {}}
 
+        tickers = list(dict.fromkeys(tickers))
         companies_data = {}
-        for res in results:
+        ticker_latency = {}
+
+        def record(res):
             ticker = res.get("ticker")
+            ticker_latency[ticker] = res["latency"]
             if "error" in res:
                 companies_data[ticker] = CompanyData(overall_sentiment=f"Data retrieval failed: {res['error']}")
             else:
                 companies_data[ticker] = CompanyData(**res["data"])
+            print(f"Retrieved {ticker} in {res['latency']:.2f}s ({len(companies_data)}/{len(tickers)})")
+
+        # Serve cached quotes immediately, refreshing stale ones in the background
+        missing = []
+        stale = []
+        for ticker in tickers:
+            res, is_stale = self.quote_cache.get(ticker)
+            if res is None:
+                missing.append(ticker)
+                continue
+            record({**res, "latency": 0.0})
+            if is_stale:
+                stale.append(ticker)
+        if stale:
+            print(f"Serving stale quotes for {', '.join(stale)} while refreshing them")
+            self.quote_cache.revalidate(stale, self.refresh_quotes)
+
+        async for res in self.iter_fresh_ticker_data(missing):
+            record(res)
         print(companies_data)
-        return {"company_data": companies_data}
+        return {"company_data": companies_data, "ticker_latency": ticker_latency}
+
+    @staticmethod
+    def fetch_price_history(ticker: str, period: str = "5y"):
+        """Downloads a ticker's daily OHLCV history, raising on errors rather than returning an empty frame."""
+        with span("yahoo.history", kind="upstream", ticker=ticker), get_limiter("yahoo").slot():
+            return yf.Ticker(ticker).history(
+                period=period, interval="1d", auto_adjust=True, actions=False, raise_errors=True
+            )
+
+    def quote_timezones(self, tickers: List[str]):
+        """Exchange timezones of the tickers with a cached quote, which set when their history goes stale."""
+        timezones = {}
+        for ticker in tickers:
+            res, _ = self.quote_cache.get(ticker)
+            if res is not None and res.get("timezone"):
+                timezones[ticker] = res["timezone"]
+        return timezones
+
+    async def refresh_price_history(self, tickers: List[str]):
+        """Downloads the histories of tickers concurrently and stores the ones that succeeded."""
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(self.executor, in_context(self.fetch_price_history), t) for t in tickers),
+            return_exceptions=True,
+        )
+        histories = {}
+        throttled = None
+        for ticker, result in zip(tickers, results):
+            if not isinstance(result, BaseException):
+                histories[ticker] = result
+            elif is_throttled(result):
+                throttled = result
+            else:
+                print(f"Price history download failed for {ticker}: {result}")
+        await loop.run_in_executor(self.executor, self.price_store.update, histories)
+        if throttled is not None:
+            raise as_backpressure("yahoo", throttled) from throttled
+
+    async def price_history_analysis(self, state: FinancialState):
+        """Node computing return, volatility, drawdown and growth metrics for all tickers at once."""
+        print("Computing historical price metrics...")
+        tickers = list(dict.fromkeys(state.get("tickers", [])))
+        if not tickers:
+            return {"price_metrics": {}}
+        try:
+            async with self.price_store_lock:
+                # Another request may have refreshed these tickers while this one waited
+                stale = self.price_store.stale(tickers, self.quote_timezones(tickers))
+                if stale:
+                    await self.refresh_price_history(stale)
+            # Tickers whose refresh failed keep their previous history
+            available = self.price_store.stored(tickers)
+            if not available:
+                return {"price_metrics": {}}
+            close = self.price_store.matrix("Close", available)
+            return {"price_metrics": ticker_metrics(compute_metrics(close), available)}
+        except Exception as e:
+            if is_throttled(e):
+                raise as_backpressure("yahoo", e) from e
+            # The quotes and sentiment don't depend on the history, they still make a report
+            print(f"Price history analysis failed for {', '.join(tickers)}: {e}")
+            return {"price_metrics": {}}
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        return len(text) // 4 + 1
+
+    def pack_sentiment_batches(self, items: dict, budget: int = SENTIMENT_BATCH_TOKENS):
+        """Packs ticker descriptions into batches whose estimated prompt size stays within budget."""
+        overhead = self.estimate_tokens(sentiment_instructions)
+        batches = []
+        batch, batch_tokens = {}, overhead
+        for ticker, description in items.items():
+            tokens = self.estimate_tokens(description)
+            if batch and batch_tokens + tokens > budget:
+                batches.append(batch)
+                batch, batch_tokens = {}, overhead
+            batch[ticker] = description
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
 
-    def analyze_sentiment(self, state: FinancialState):
-        """Node to perform sentiment analysis for each company."""
+    @staticmethod
+    def is_size_error(error: BaseException) -> bool:
+        """Whether a failed call was rejected for its prompt's length, so a smaller batch may pass."""
+        message = str(error).casefold()
+        return any(marker in message for marker in CONTEXT_LENGTH_ERRORS)
+
+    async def split_sentiment_batch(self, question: str, batch: dict, retry_missing: bool):
+        tickers = list(batch)
+        half = len(tickers) // 2
+        first, second = await asyncio.gather(
+            self.analyze_sentiment_batch(question, {t: batch[t] for t in tickers[:half]}, retry_missing),
+            self.analyze_sentiment_batch(question, {t: batch[t] for t in tickers[half:]}, retry_missing),
+        )
+        return {**first, **second}
+
+    async def analyze_sentiment_batch(self, question: str, batch: dict, retry_missing: bool = True):
+        """
+        Runs one structured sentiment call for a batch. A batch too large for
+        the model's context or output is split in half, other failures fail
+        it once; tickers the answer leaves out are asked for once more.
+        """
+        llm = get_structured_model(
+            self.model, temperature=0, schema=FinancialSentimentBatch, api_key=self.api_key, include_raw=True
+        )
+        formatted_prompt = sentiment_instructions.format(
+            current_date=datetime.datetime.now().strftime("%Y-%m-%d"),
+            question=question,
+            companies="\n".join(batch.values()),
+        )
+        try:
+            output = await llm.ainvoke(formatted_prompt)
+        except Exception as e:
+            # Splitting a throttled batch would double the calls
+            if is_throttled(e):
+                raise as_backpressure("gemini", e) from e
+            if len(batch) > 1 and self.is_size_error(e):
+                return await self.split_sentiment_batch(question, batch, retry_missing)
+            print(f"Sentiment analysis failed for {', '.join(batch)}: {e}")
+            return {}
+        if output["parsed"] is None:
+            # Structured output cut off at the output token limit
+            if len(batch) > 1 and output["raw"].response_metadata.get("finish_reason") == "MAX_TOKENS":
+                return await self.split_sentiment_batch(question, batch, retry_missing)
+            print(f"Sentiment analysis failed for {', '.join(batch)}: {output['parsing_error']}")
+            return {}
+        sentiments = {
+            analysis.tinker: analysis.overall_sentiment
+            for analysis in output["parsed"].analyses
+            if analysis.tinker in batch
+        }
+        missing = {ticker: description for ticker, description in batch.items() if ticker not in sentiments}
+        if missing and retry_missing:
+            print(f"Sentiment analysis left out {', '.join(missing)}, asking again")
+            sentiments.update(await self.analyze_sentiment_batch(question, missing, retry_missing=False))
+        return sentiments
+
+    async def analyze_sentiment(self, state: FinancialState):
+        """Node to perform sentiment analysis for all companies, many tickers per LLM call."""
         print("Step 3: Analyzing sentiment for each company...")
         companies_data = state.get("company_data", {})
-        llm = MockLLM()
 
-        for ticker, data in companies_data.items():
-            if "Data retrieval failed" not in data.overall_sentiment:
-                prompt = f"Analyze the sentiment for {ticker} based on its financial data and public perception."
-                sentiment = llm.invoke(prompt)
-                data.overall_sentiment = sentiment
+        items = {
+            ticker: f"- {ticker}: {data.model_dump_json(exclude={'overall_sentiment'})}"
+            for ticker, data in companies_data.items()
+            if "Data retrieval failed" not in data.overall_sentiment
+        }
+        batches = self.pack_sentiment_batches(items)
+        results = await asyncio.gather(
+            *(self.analyze_sentiment_batch(state.get("question", ""), batch) for batch in batches)
+        )
+        sentiments = {ticker: sentiment for result in results for ticker, sentiment in result.items()}
+
+        for ticker in items:
+            companies_data[ticker].overall_sentiment = sentiments.get(
+                ticker, "Sentiment analysis failed."
+            )
 
         return {"company_data": companies_data}
 
+    async def compare_companies(self, state: FinancialState):
+        """
+        Node comparing the first two requested companies on their price history
+        metrics and ratios, with the other companies' figures as context.
+        """
+        tickers = list(dict.fromkeys(state.get("tickers", [])))
+        if len(tickers) < 2:
+            return {"comparison": None}
+        print("Step 4: Comparing companies...")
+        companies_data = state.get("company_data", {})
+        price_metrics = state.get("price_metrics", {})
+        companies = "\n".join(
+            f"- {ticker}: {companies_data[ticker].model_dump_json() if ticker in companies_data else 'no data'}\n"
+            f"  {json.dumps(price_metrics.get(ticker))}"
+            for ticker in tickers
+        )
+        llm = get_structured_model(
+            self.model, temperature=0, schema=FinancialComparison, api_key=self.api_key
+        )
+        formatted_prompt = comparison_instructions.format(
+            current_date=datetime.datetime.now().strftime("%Y-%m-%d"),
+            company_a=tickers[0],
+            company_b=tickers[1],
+            question=state.get("question", ""),
+            companies=companies,
+        )
+        try:
+            comparison = await llm.ainvoke(formatted_prompt)
+        except Exception as e:
+            if is_throttled(e):
+                raise as_backpressure("gemini", e) from e
+            print(f"Comparison failed for {tickers[0]} and {tickers[1]}: {e}")
+            return {"comparison": None}
+        return {"comparison": comparison}
+
+    def build_graph(self, checkpointer=None):
+        builder = StateGraph(FinancialState)
+        builder.add_node("ticker_data_retrieval", traced_node("ticker_data_retrieval", self.ticker_data_retrieval), retry_policy=BACKPRESSURE_RETRY)
+        builder.add_node("price_history_analysis", traced_node("price_history_analysis", self.price_history_analysis), retry_policy=BACKPRESSURE_RETRY)
+        builder.add_node("analyze_sentiment", traced_node("analyze_sentiment", self.analyze_sentiment), retry_policy=BACKPRESSURE_RETRY)
+        builder.add_node("compare_companies", traced_node("compare_companies", self.compare_companies), retry_policy=BACKPRESSURE_RETRY)
+
+        # Price history only needs the tickers, so it runs alongside quote retrieval and sentiment;
+        # the comparison needs both
+        builder.add_edge(START, "ticker_data_retrieval")
+        builder.add_edge(START, "price_history_analysis")
+        builder.add_edge("ticker_data_retrieval", "analyze_sentiment")
+        builder.add_edge(["analyze_sentiment", "price_history_analysis"], "compare_companies")
+        builder.add_edge("compare_companies", END)
+        return builder.compile(name="financial-agent", checkpointer=checkpointer)
+
+    async def stream(self, graph, state: FinancialState):
+        """Run the graph, yielding node progress events and the state after each step."""
+        async for event in astream_events(graph, state, ANSWER_NODES):
+            yield event
+
+    async def report(self, graph, state: FinancialState):
+        final_state = {}
+        try:
+            with span("request financial-agent", kind="request"):
+                async for event in self.stream(graph, state):
+                    final_state = print_event(event) or final_state
+        finally:
+            await close_http_client()
+        return final_state
+
+    async def from_request(self, payload: dict):
+        """
+        Build the (state, config) of a graph run from a server request body.
+
+        Companies are given as "tickers", "companies" (names resolved to tickers), or both.
+        """
+        tickers = payload.get("tickers") or []
+        companies = payload.get("companies") or []
+        if not isinstance(tickers, list) or not isinstance(companies, list):
+            raise ValueError("'tickers' and 'companies' must be lists")
+        if not all(isinstance(item, str) and item.strip() for item in tickers + companies):
+            raise ValueError("'tickers' and 'companies' must only hold non-empty strings")
+        if payload.get("question") is not None and not isinstance(payload["question"], str):
+            raise ValueError("'question' must be a string")
+        if companies:
+            tickers = list(dict.fromkeys(tickers + await self.resolve_tickers(companies)))
+        if not tickers:
+            raise ValueError("at least one known ticker or company is required")
+        question = payload.get("question") or f"Retrieve a financial analysis of these companies: {', '.join(tickers)}"
+        return FinancialState(question=question, tickers=tickers), None
+
+    @staticmethod
+    def to_response(state: dict) -> dict:
+        return {
+            "company_data": {ticker: data.model_dump() for ticker, data in state.get("company_data", {}).items()},
+            "price_metrics": state.get("price_metrics", {}),
+            "comparison": state["comparison"].model_dump() if state.get("comparison") else None,
+            "ticker_latency": state.get("ticker_latency", {}),
+        }
+
+    def run(self):
+        graph = self.build_graph()
+        tracer = configure_tracing()
+        state = FinancialState(
+            question="Retrieve a financial analysis of these companies: Apple, Ferrari",
+            tickers=[self.ticker],
+        )
+        final_state = asyncio.run(self.report(graph, state))
+        for ticker, data in final_state.get("company_data", {}).items():
+            print(f"{ticker}: {data}")
+            print(f"    {final_state.get('price_metrics', {}).get(ticker)}")
+        comparison = final_state.get("comparison")
+        if comparison is not None:
+            print(f"{comparison.company_a_name} vs {comparison.company_b_name}:")
+            print(f"    Revenue: {comparison.revenue_comparison}")
+            print(f"    Key metrics: {comparison.key_metrics_comparison}")
+            if comparison.recommendation:
+                print(f"    Recommendation: {comparison.recommendation}")
+        if tracer is not None:
+            print(tracer.metrics.format(), file=sys.stderr)
+            tracer.close()
 
 
 if __name__ == '__main__':
-    Agent()
+    Agent().run()
 
@@ -0,0 +1,246 @@
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from QuoteCache import MarketSession
+
+OHLCV_FIELDS = ["Open", "High", "Low", "Close", "Volume"]
+TRADING_DAYS = 252
+# File naming the store's current version directory
+CURRENT = "CURRENT"
+
+
+def day_index(index: pd.Index) -> np.ndarray:
+    """The trading days of a history's index, dropping the exchange timezone."""
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.to_numpy().astype("datetime64[D]")
+
+
+class PriceStore:
+    """
+    Columnar store of daily OHLCV history for many tickers.
+
+    Each field is a (days x tickers) float64 matrix saved as its own .npy file
+    and opened memory-mapped, so multi-year histories for dozens of tickers are
+    loaded without copying and every metric is computed across all tickers at once.
+
+    Every update is written to a new version directory and published by
+    replacing the CURRENT pointer, under a file lock shared by the batch worker
+    processes: readers always see one complete version, and no process drops
+    the tickers another one added. A ticker's history is stale once its
+    exchange has closed a session after it was downloaded.
+    """
+
+    def __init__(self, path: str = "../config/prices"):
+        self.path = path
+        self.version: Optional[str] = None
+        self.tickers: List[str] = []
+        self.dates: np.ndarray = np.array([], dtype="datetime64[D]")
+        self.fields: Dict[str, np.ndarray] = {}
+        # ticker -> time its history was downloaded
+        self.downloaded_at: Dict[str, float] = {}
+        # Guards swapping in a newly saved store while other threads read the current one
+        self._lock = threading.Lock()
+        self.open()
+
+    def current_version(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.path, CURRENT)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            # Stores saved before versioning keep their files at the top level
+            return "." if os.path.exists(os.path.join(self.path, "meta.json")) else None
+
+    def open(self):
+        """Open the current version, unless it's the one already open."""
+        for _ in range(3):
+            version = self.current_version()
+            if version is None or version == self.version:
+                return
+            directory = os.path.join(self.path, version)
+            try:
+                with open(os.path.join(directory, "meta.json")) as f:
+                    meta = json.load(f)
+                dates = np.load(os.path.join(directory, "dates.npy"))
+                fields = {
+                    field: np.load(os.path.join(directory, f"{field}.npy"), mmap_mode="r")
+                    for field in OHLCV_FIELDS
+                }
+            except FileNotFoundError:
+                # Pruned by another process after a newer version replaced it
+                continue
+            with self._lock:
+                self.version, self.tickers, self.dates, self.fields = version, meta["tickers"], dates, fields
+                self.downloaded_at = meta.get("downloaded_at", {})
+            return
+
+    @contextmanager
+    def locked(self):
+        """Hold the store's file lock, taken by every process updating it."""
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def stale(self, tickers: List[str], timezones: Optional[Dict[str, str]] = None, now: Optional[float] = None) -> List[str]:
+        """
+        Tickers missing from the store, or downloaded before their exchange's last session close.
+        """
+        self.open()
+        now = time.time() if now is None else now
+        timezones = timezones or {}
+        with self._lock:
+            downloaded_at = self.downloaded_at
+        return [
+            ticker for ticker in tickers
+            if downloaded_at.get(ticker, 0) < MarketSession(timezones.get(ticker)).last_close(now)
+        ]
+
+    def update(self, histories: Dict[str, pd.DataFrame], downloaded_at: Optional[float] = None):
+        """
+        Store freshly downloaded histories (one OHLCV frame per ticker, as from
+        `Ticker.history`) next to the stored ones, aligned on one date index.
+        """
+        downloaded_at = time.time() if downloaded_at is None else downloaded_at
+        histories = {ticker: history for ticker, history in histories.items() if len(history)}
+        if not histories:
+            return
+        with self.locked():
+            # Another process may have published a version since this one was opened
+            self.open()
+            with self._lock:
+                stored, dates, fields = self.tickers, self.dates, self.fields
+                downloaded = dict(self.downloaded_at)
+            days = {ticker: day_index(history.index) for ticker, history in histories.items()}
+            all_dates = np.unique(np.concatenate([dates, *days.values()]))
+            tickers = sorted(set(stored) | set(histories))
+            columns = {ticker: i for i, ticker in enumerate(tickers)}
+            kept = [ticker for ticker in stored if ticker not in histories]
+            stored_columns = {ticker: i for i, ticker in enumerate(stored)}
+            kept_columns = [stored_columns[ticker] for ticker in kept]
+            stored_rows = np.searchsorted(all_dates, dates)
+
+            matrices = {}
+            for field in OHLCV_FIELDS:
+                matrix = np.full((len(all_dates), len(tickers)), np.nan)
+                if kept:
+                    matrix[np.ix_(stored_rows, [columns[t] for t in kept])] = fields[field][:, kept_columns]
+                for ticker, history in histories.items():
+                    matrix[np.searchsorted(all_dates, days[ticker]), columns[ticker]] = history[field].to_numpy(dtype=np.float64)
+                matrices[field] = matrix
+            for ticker in histories:
+                downloaded[ticker] = downloaded_at
+            self.save(tickers, all_dates, matrices, downloaded)
+
+    def save(self, tickers: List[str], dates: np.ndarray, matrices: Dict[str, np.ndarray], downloaded_at: Dict[str, float]):
+        """Write a new version, point CURRENT at it and reopen it memory-mapped; needs the file lock."""
+        previous = self.current_version()
+        directory = tempfile.mkdtemp(prefix="v-", dir=self.path)
+        for field, matrix in matrices.items():
+            np.save(os.path.join(directory, f"{field}.npy"), matrix)
+        np.save(os.path.join(directory, "dates.npy"), dates)
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump({"tickers": tickers, "downloaded_at": downloaded_at}, f)
+        version = os.path.basename(directory)
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{CURRENT}.", dir=self.path)
+        with os.fdopen(fd, "w") as f:
+            f.write(version)
+        os.replace(tmp_path, os.path.join(self.path, CURRENT))
+        # The previous version stays for readers that picked it just before the switch
+        for name in os.listdir(self.path):
+            if name.startswith("v-") and name not in (version, previous):
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        self.open()
+
+    def matrix(self, field: str, tickers: Optional[List[str]] = None, start: Optional[str] = None) -> np.ndarray:
+        """
+        Return the (days x tickers) matrix of `field`, optionally restricted to tickers and a start date.
+        """
+        with self._lock:
+            values, dates, stored = self.fields[field], self.dates, self.tickers
+        rows = slice(None)
+        if start is not None:
+            rows = slice(int(np.searchsorted(dates, np.datetime64(start, "D"))), None)
+        if tickers is None:
+            return values[rows]
+        positions = {ticker: i for i, ticker in enumerate(stored)}
+        return values[rows][:, [positions[ticker] for ticker in tickers]]
+
+    def stored(self, tickers: List[str]) -> List[str]:
+        with self._lock:
+            stored = set(self.tickers)
+        return [ticker for ticker in tickers if ticker in stored]
+
+
+def forward_fill(values: np.ndarray) -> np.ndarray:
+    """Forward-fill NaNs down each column, so holidays and late listings don't break returns."""
+    mask = np.isnan(values)
+    index = np.where(~mask, np.arange(values.shape[0])[:, None], 0)
+    np.maximum.accumulate(index, axis=0, out=index)
+    return values[index, np.arange(values.shape[1])]
+
+
+def compute_metrics(close: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Compute return, risk and growth metrics for every column of a (days x tickers) close matrix.
+    """
+    close = forward_fill(np.asarray(close, dtype=np.float64))
+    valid = ~np.isnan(close)
+    observations = valid.sum(axis=0)
+    first_row = np.argmax(valid, axis=0)
+    columns = np.arange(close.shape[1])
+    first = close[first_row, columns]
+    last = close[-1]
+
+    # Tickers without data yield NaN metrics rather than warnings
+    with np.errstate(divide="ignore", invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        total_return = last / first - 1
+        years = (observations - 1) / TRADING_DAYS
+        cagr = np.where(years > 0, (last / first) ** (1 / np.where(years > 0, years, 1)) - 1, np.nan)
+
+        log_returns = np.diff(np.log(close), axis=0)
+        volatility = np.nanstd(log_returns, axis=0, ddof=1) * np.sqrt(TRADING_DAYS)
+        mean_return = np.nanmean(log_returns, axis=0) * TRADING_DAYS
+        sharpe = mean_return / volatility
+
+        running_max = np.fmax.accumulate(close, axis=0)
+        max_drawdown = np.nanmin(close / running_max - 1, axis=0)
+
+        year_ago = close[max(close.shape[0] - 1 - TRADING_DAYS, 0)]
+        one_year_return = last / year_ago - 1
+
+    return {
+        "total_return": total_return,
+        "cagr": cagr,
+        "one_year_return": one_year_return,
+        "annualized_volatility": volatility,
+        "sharpe_ratio": sharpe,
+        "max_drawdown": max_drawdown,
+    }
+
+
+def ticker_metrics(metrics: Dict[str, np.ndarray], tickers: List[str]) -> Dict[str, Dict[str, Optional[float]]]:
+    """Turn the per-metric arrays into one plain dict of metrics per ticker."""
+    return {
+        ticker: {
+            name: (None if np.isnan(values[i]) else round(float(values[i]), 4))
+            for name, values in metrics.items()
+        }
+        for i, ticker in enumerate(tickers)
+    }
@@ -0,0 +1,36 @@
+sentiment_instructions = """You are an expert financial analyst assessing investor sentiment for several companies at once.
+
+Instructions:
+- The current date is {current_date}.
+- For every company listed below, describe the overall mood of investors towards it.
+- Base your assessment on its financial data and its public perception.
+- Return exactly one analysis per company, using the ticker exactly as given in the "tinker" field.
+
+Format:
+- Format your response as a JSON object with the key "analyses", a list of objects with these exact keys:
+   - "tinker": The ticker of the company
+   - "overall_sentiment": The overall mood of investors towards the company
+
+User Question:
+{question}
+
+Companies:
+{companies}
+"""
+
+comparison_instructions = """You are an expert financial analyst comparing companies for an investor.
+
+Instructions:
+- The current date is {current_date}.
+- Compare {company_a} (company A) with {company_b} (company B).
+- Base the revenue comparison on their growth over the price history: total and one year return and CAGR.
+- Base the key metrics comparison on their ratios and risk: P/E, price to book, earnings per share, volatility, Sharpe ratio and maximum drawdown.
+- The other companies listed show where both stand among everything the user asked about.
+- Only use the figures given below, don't make up any numbers.
+
+User Question:
+{question}
+
+Companies (ratios and sentiment, then price history metrics over the last five years):
+{companies}
+"""
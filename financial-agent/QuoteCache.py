@@ -0,0 +1,179 @@
+import asyncio
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+# Regular session hours (local open, local close) by exchange timezone.
+# Holidays are not modelled: a holiday is treated as a trading day, which only
+# costs an extra refresh, never serves data past a real session.
+EXCHANGE_SESSIONS: Dict[str, Tuple[datetime.time, datetime.time]] = {
+    "America/New_York": (datetime.time(9, 30), datetime.time(16, 0)),
+    "America/Toronto": (datetime.time(9, 30), datetime.time(16, 0)),
+    "Europe/London": (datetime.time(8, 0), datetime.time(16, 30)),
+    "Europe/Berlin": (datetime.time(9, 0), datetime.time(17, 30)),
+    "Europe/Paris": (datetime.time(9, 0), datetime.time(17, 30)),
+    "Europe/Rome": (datetime.time(9, 0), datetime.time(17, 30)),
+    "Europe/Amsterdam": (datetime.time(9, 0), datetime.time(17, 30)),
+    "Europe/Zurich": (datetime.time(9, 0), datetime.time(17, 30)),
+    "Asia/Tokyo": (datetime.time(9, 0), datetime.time(15, 0)),
+    "Asia/Hong_Kong": (datetime.time(9, 30), datetime.time(16, 0)),
+    "Asia/Shanghai": (datetime.time(9, 30), datetime.time(15, 0)),
+    "Australia/Sydney": (datetime.time(10, 0), datetime.time(16, 0)),
+}
+DEFAULT_TIMEZONE = "America/New_York"
+
+
+class MarketSession:
+    """Regular trading hours of one exchange, Monday to Friday."""
+
+    def __init__(self, timezone: Optional[str] = None):
+        if timezone not in EXCHANGE_SESSIONS:
+            timezone = DEFAULT_TIMEZONE
+        self.timezone = ZoneInfo(timezone)
+        self.open_time, self.close_time = EXCHANGE_SESSIONS[timezone]
+
+    def is_open(self, at: float) -> bool:
+        local = datetime.datetime.fromtimestamp(at, self.timezone)
+        return local.weekday() < 5 and self.open_time <= local.time() < self.close_time
+
+    def next_open(self, at: float) -> float:
+        """Timestamp of the first session open strictly after `at`."""
+        local = datetime.datetime.fromtimestamp(at, self.timezone)
+        day = local.date()
+        while True:
+            opens = datetime.datetime.combine(day, self.open_time, self.timezone)
+            if day.weekday() < 5 and opens > local:
+                return opens.timestamp()
+            day += datetime.timedelta(days=1)
+
+    def last_close(self, at: float) -> float:
+        """Timestamp of the last session close at or before `at`."""
+        local = datetime.datetime.fromtimestamp(at, self.timezone)
+        day = local.date()
+        while True:
+            closes = datetime.datetime.combine(day, self.close_time, self.timezone)
+            if day.weekday() < 5 and closes <= local:
+                return closes.timestamp()
+            day -= datetime.timedelta(days=1)
+
+
+class QuoteCache:
+    """
+    Quote cache whose freshness follows the exchange's trading session.
+
+    A quote fetched while its market is open stays fresh for `intraday_ttl`
+    seconds; one fetched while the market is closed can't change and stays
+    fresh until the next session opens. Stale quotes younger than `max_stale`
+    are still served while a background refresh replaces them
+    (stale-while-revalidate).
+
+    With a `path`, entries are also kept in a SQLite file, so they outlive
+    the process: the next CLI run and the other batch worker processes start
+    from them, and pick up quotes another process has refreshed since.
+    """
+
+    def __init__(self, intraday_ttl: float = 60, max_stale: float = 24 * 60 * 60, path: Optional[str] = None):
+        self.intraday_ttl = intraday_ttl
+        self.max_stale = max_stale
+        # ticker -> (result, fresh until)
+        self.entries: Dict[str, Tuple[dict, float]] = {}
+        self.refreshing: set = set()
+        self.tasks: set = set()
+        self._lock = threading.Lock()
+        self._connection = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Batch worker processes share the file, a writer may have to wait for another
+            self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            with self._connection:
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS quotes (
+                        ticker TEXT PRIMARY KEY,
+                        result TEXT NOT NULL,
+                        expires_at REAL NOT NULL
+                    )
+                    """
+                )
+                # Quotes too old to be served even stale
+                self._connection.execute("DELETE FROM quotes WHERE expires_at < ?", (time.time() - max_stale,))
+
+    def expires_at(self, timezone: Optional[str], fetched_at: float) -> float:
+        session = MarketSession(timezone)
+        if session.is_open(fetched_at):
+            return fetched_at + self.intraday_ttl
+        return session.next_open(fetched_at)
+
+    def put(self, result: dict, fetched_at: Optional[float] = None):
+        """Cache a successful ticker result; failed fetches are never cached."""
+        if "error" in result:
+            return
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        expires_at = self.expires_at(result.get("timezone"), fetched_at)
+        self.entries[result["ticker"]] = (result, expires_at)
+        if self._connection is not None:
+            with self._lock, self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO quotes (ticker, result, expires_at) VALUES (?, ?, ?)",
+                    (result["ticker"], json.dumps(result, default=str), expires_at),
+                )
+
+    def load(self, ticker: str) -> Optional[Tuple[dict, float]]:
+        """The stored (result, fresh until) of `ticker`, if the cache has a file."""
+        if self._connection is None:
+            return None
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT result, expires_at FROM quotes WHERE ticker = ?", (ticker,)
+            ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def get(self, ticker: str, now: Optional[float] = None) -> Tuple[Optional[dict], bool]:
+        """
+        Return (result, is_stale) for `ticker`, or (None, False) if nothing usable is cached.
+        """
+        entry = self.entries.get(ticker)
+        now = time.time() if now is None else now
+        if entry is None or now >= entry[1]:
+            # An earlier run or another process may have stored a newer quote
+            stored = self.load(ticker)
+            if stored is not None and (entry is None or stored[1] > entry[1]):
+                entry = self.entries[ticker] = stored
+        if entry is None:
+            return None, False
+        result, expires_at = entry
+        if now < expires_at:
+            return result, False
+        if now - expires_at < self.max_stale:
+            return result, True
+        return None, False
+
+    def revalidate(self, tickers: Iterable[str], refresh: Callable[[List[str]], Awaitable[None]]):
+        """
+        Refresh stale tickers in the background, at most one refresh per ticker at a time.
+        """
+        tickers = [t for t in tickers if t not in self.refreshing]
+        if not tickers:
+            return
+        self.refreshing.update(tickers)
+
+        async def run():
+            try:
+                await refresh(tickers)
+            except Exception as e:
+                print(f"Background quote refresh failed for {', '.join(tickers)}: {e}")
+            finally:
+                self.refreshing.difference_update(tickers)
+
+        task = asyncio.get_running_loop().create_task(run())
+        # Keep a reference so the task isn't garbage collected mid-flight
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
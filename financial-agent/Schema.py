@@ -13,6 +13,12 @@ class FinancialSentimentAnalysis(BaseModel):
     overall_sentiment: str = Field(description="The overall mood of investors of the specific asset")
 
 
+class FinancialSentimentBatch(BaseModel):
+    """Sentiment analyses for a batch of companies, one per ticker."""
+    analyses: List[FinancialSentimentAnalysis] = Field(
+        description="One sentiment analysis for each company in the batch.")
+
+
 class FinancialComparison(BaseModel):
     """Comparative analysis of two or more companies."""
     company_a_name: str
@@ -2,11 +2,16 @@ from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, TypedDict
 import datetime
 
+from Schema import FinancialComparison
+
 class FinancialState(TypedDict):
     """Represents the state of our financial data retrieval process."""
     question: str
     tickers: List[str]
     company_data: Dict[str, "CompanyData"]
+    ticker_latency: Dict[str, float]
+    price_metrics: Dict[str, Dict[str, Optional[float]]]
+    comparison: Optional[FinancialComparison]
 
 # A Pydantic model to define the structure of the data we expect from the LLM.
 class TickerList(BaseModel):
@@ -0,0 +1,210 @@
+import asyncio
+import bisect
+import csv
+import difflib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Words that don't help telling companies apart, e.g. "Apple Inc." vs "Apple"
+NAME_STOPWORDS = {
+    "the", "inc", "incorporated", "corp", "corporation", "co", "company", "ltd", "limited",
+    "plc", "nv", "sa", "spa", "ag", "se", "llc", "lp", "holdings", "holding", "group",
+    "class", "a", "b", "c", "common", "stock", "shares", "ordinary", "ads", "adr",
+}
+SYMBOL_COLUMNS = ("symbol", "ticker", "act symbol", "nasdaq symbol")
+NAME_COLUMNS = ("name", "security name", "company name", "company", "description")
+
+
+def normalize_name(name: str) -> str:
+    """Reduce a company name to the words that identify it."""
+    # Listings append the share class after a dash, e.g. "Apple Inc. - Common Stock"
+    name = name.split(" - ")[0]
+    words = re.sub(r"[^\w\s]", " ", name.casefold()).split()
+    return " ".join(word for word in words if word not in NAME_STOPWORDS) or " ".join(words)
+
+
+class TickerResolver:
+    """
+    Resolves company names to ticker symbols, hitting the network only as a last resort.
+
+    Lookups go through, in order: the in-memory cache, a local symbol index
+    loaded from exchange listing files (exact, symbol, prefix and fuzzy
+    matches), and finally `fetch`, the async network lookup. Names `fetch`
+    answered None for are cached for `negative_ttl` seconds so unknown names
+    don't hit the network on every run; errors it raises are not cached.
+
+    Network results are also kept in a SQLite file at `cache_path`, shared by
+    later runs and the batch worker processes. An unreadable file leaves the
+    cache in memory only.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[Optional[str]]],
+        cache_path: Optional[str] = "../config/ticker_cache.sqlite3",
+        index_path: Optional[str] = None,
+        negative_ttl: float = 60 * 60,
+        fuzzy_cutoff: float = 0.88,
+    ):
+        self.fetch = fetch
+        self.negative_ttl = negative_ttl
+        self.fuzzy_cutoff = fuzzy_cutoff
+        # normalized name -> (symbol or None for a failed lookup, resolved at)
+        self.cache: Dict[str, Tuple[Optional[str], float]] = {}
+        self.names: Dict[str, str] = {}
+        self.symbols: Dict[str, str] = {}
+        self.sorted_names: List[str] = []
+        self._lock = threading.Lock()
+        self._connection = None
+        if cache_path:
+            self.open_cache(cache_path)
+        if index_path:
+            self.load_index(index_path)
+
+    def open_cache(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            # Batch worker processes share the file, a writer may have to wait for another
+            connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            with connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS tickers (
+                        name TEXT PRIMARY KEY,
+                        symbol TEXT,
+                        resolved_at REAL NOT NULL
+                    )
+                    """
+                )
+                rows = connection.execute("SELECT name, symbol, resolved_at FROM tickers").fetchall()
+        except sqlite3.DatabaseError as e:
+            print(f"Ticker cache {path} is unreadable, keeping resolved names in memory only: {e}")
+            return
+        self._connection = connection
+        self.cache = {name: (symbol, resolved_at) for name, symbol, resolved_at in rows}
+
+    def load_index(self, path: str):
+        """
+        Load a symbol listing (CSV, or pipe/tab separated like nasdaqlisted.txt) into the index.
+        """
+        with open(path, newline="") as f:
+            sample = f.read(4096)
+            f.seek(0)
+            dialect = csv.Sniffer().sniff(sample, delimiters=",|\t;")
+            reader = csv.DictReader(f, dialect=dialect)
+            columns = {column.strip().casefold(): column for column in reader.fieldnames or []}
+            symbol_column = next((columns[c] for c in SYMBOL_COLUMNS if c in columns), None)
+            name_column = next((columns[c] for c in NAME_COLUMNS if c in columns), None)
+            if symbol_column is None or name_column is None:
+                raise ValueError(f"{path} has no symbol/name columns: {reader.fieldnames}")
+            for row in reader:
+                symbol = (row.get(symbol_column) or "").strip()
+                name = (row.get(name_column) or "").strip()
+                if not symbol or not name:
+                    continue
+                self.symbols.setdefault(symbol.casefold(), symbol)
+                # The first listing wins, exchange files list primary shares first
+                self.names.setdefault(normalize_name(name), symbol)
+        self.sorted_names = sorted(self.names)
+
+    def lookup_index(self, name: str) -> Optional[str]:
+        """
+        Find `name` in the local symbol index without touching the network.
+        """
+        normalized = normalize_name(name)
+        if normalized in self.names:
+            return self.names[normalized]
+        if name.strip().casefold() in self.symbols:
+            return self.symbols[name.strip().casefold()]
+        if not normalized:
+            return None
+
+        # Prefix match on whole words: "ferrari" matches "ferrari n v" but not "ferraris"
+        start = bisect.bisect_left(self.sorted_names, normalized)
+        candidates = []
+        for indexed in self.sorted_names[start:]:
+            if not indexed.startswith(normalized):
+                break
+            if indexed[len(normalized)] == " ":
+                candidates.append(indexed)
+        if candidates:
+            return self.names[min(candidates, key=len)]
+
+        matches = difflib.get_close_matches(normalized, self.sorted_names, n=1, cutoff=self.fuzzy_cutoff)
+        return self.names[matches[0]] if matches else None
+
+    def cached(self, name: str) -> Tuple[bool, Optional[str]]:
+        """
+        Return (hit, symbol) from the cache; expired negative entries are a miss.
+        """
+        normalized = normalize_name(name)
+        entry = self.cache.get(normalized)
+        if entry is None or entry[0] is None:
+            # Another process may have resolved it since
+            stored = self.load(normalized)
+            if stored is not None and (entry is None or stored[1] > entry[1]):
+                entry = self.cache[normalized] = stored
+        if entry is None:
+            return False, None
+        symbol, resolved_at = entry
+        if symbol is None and time.time() - resolved_at > self.negative_ttl:
+            return False, None
+        return True, symbol
+
+    def load(self, normalized: str) -> Optional[Tuple[Optional[str], float]]:
+        if self._connection is None:
+            return None
+        try:
+            with self._lock:
+                row = self._connection.execute(
+                    "SELECT symbol, resolved_at FROM tickers WHERE name = ?", (normalized,)
+                ).fetchone()
+        except sqlite3.DatabaseError as e:
+            print(f"Ticker cache lookup failed: {e}")
+            return None
+        return tuple(row) if row else None
+
+    def remember(self, name: str, symbol: Optional[str], persist: bool = True):
+        normalized = normalize_name(name)
+        resolved_at = time.time()
+        self.cache[normalized] = (symbol, resolved_at)
+        if not persist or self._connection is None:
+            return
+        try:
+            with self._lock, self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO tickers (name, symbol, resolved_at) VALUES (?, ?, ?)",
+                    (normalized, symbol, resolved_at),
+                )
+        except sqlite3.DatabaseError as e:
+            print(f"Ticker cache write failed: {e}")
+
+    async def resolve(self, name: str) -> Optional[str]:
+        """
+        Resolve one company name to its ticker symbol, or None if it can't be found.
+
+        Errors raised by `fetch` propagate uncached, so a failed lookup is retried next time.
+        """
+        hit, symbol = self.cached(name)
+        if hit:
+            return symbol
+        symbol = self.lookup_index(name)
+        if symbol is not None:
+            # Memoized so repeated names skip the prefix and fuzzy search; the index is local, nothing to persist
+            self.remember(name, symbol, persist=False)
+            return symbol
+
+        symbol = await self.fetch(name)
+        self.remember(name, symbol)
+        return symbol
+
+    async def resolve_many(self, names: List[str]) -> Dict[str, Optional[str]]:
+        symbols = await asyncio.gather(*(self.resolve(name) for name in names))
+        return dict(zip(names, symbols))
@@ -1,5 +1,109 @@
+import contextlib
+import importlib
+import os
+import sys
+from argparse import ArgumentParser
+from typing import Optional
+
+from shared.Checkpoint import CompactSerializer, SqliteSaver
+from shared.Server import AgentServer, GraphService
+from shared.Tracing import configure_tracing
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Served name -> (directory, module, agent class)
+AGENTS = {
+    "web-agent": ("web-agent", "WebAgent", "WebAgent"),
+    "web-agent-2": ("web-agent-2", "WebAgent", "WebAgent"),
+    "financial-agent": ("financial-agent", "FinancialAgent", "Agent"),
+}
+
+
+@contextlib.contextmanager
+def agent_modules(directory: str):
+    """
+    Make an agent's own modules importable for the duration of the block.
+
+    Every agent has its own State, Schema, Utils, ... modules imported by plain
+    name, so each one is imported with only its own directory on the path and
+    its local modules are removed from sys.modules afterwards. Anything that
+    looks modules up by name, like resolving the graph state's type hints,
+    has to happen inside the block.
+    """
+    path = os.path.join(ROOT, directory)
+    local = {name[:-3] for name in os.listdir(path) if name.endswith(".py")}
+    saved = {name: sys.modules.pop(name) for name in local if name in sys.modules}
+    sys.path.insert(0, path)
+    try:
+        yield
+    finally:
+        sys.path.remove(path)
+        for name in local:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved)
+
+
+def load_agent(name: str, checkpoints: Optional[str] = None):
+    """
+    Import, construct and compile the agent served as `name`; returns (module, agent, graph).
+
+    With a `checkpoints` directory, the graph saves its runs to `<name>.sqlite3` in it.
+    """
+    directory, module, cls = AGENTS[name]
+    with agent_modules(directory):
+        agent_module = importlib.import_module(module)
+        agent = getattr(agent_module, cls)()
+        checkpointer = None
+        if checkpoints:
+            checkpointer = SqliteSaver(
+                os.path.join(checkpoints, f"{name}.sqlite3"), CompactSerializer(agent_module.CHECKPOINT_CODECS)
+            )
+        return agent_module, agent, agent.build_graph(checkpointer)
+
+
+def load_service(name: str, checkpoints: Optional[str] = None) -> GraphService:
+    agent_module, agent, graph = load_agent(name, checkpoints)
+    return GraphService(agent, graph, agent_module.ANSWER_NODES)
+
+
 def main():
-    print("Hello from agentai!")
+    parser = ArgumentParser(description="Serve the agents over HTTP with server-sent events")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--agent",
+        action="append",
+        choices=sorted(AGENTS),
+        help="Agent to serve, repeat for several (default: all)",
+    )
+    parser.add_argument(
+        "--max-active",
+        type=int,
+        default=8,
+        help="Maximum number of requests running at the same time",
+    )
+    parser.add_argument(
+        "--max-queued",
+        type=int,
+        default=32,
+        help="Maximum number of requests waiting for a slot before new ones are rejected",
+    )
+    parser.add_argument(
+        "--trace",
+        help="Write spans to this OTLP JSON file and serve a timing summary on /metrics (default: $TRACE_FILE)",
+    )
+    parser.add_argument(
+        "--checkpoints",
+        help="Directory for SQLite checkpoints of the agents' runs, so failed requests can be resumed",
+    )
+    args = parser.parse_args()
+    configure_tracing(args.trace)
+    checkpoints = os.path.abspath(args.checkpoints) if args.checkpoints else None
+
+    # The agents resolve ../config relative to their own directory, which all share
+    os.chdir(os.path.join(ROOT, "web-agent"))
+    services = {name: load_service(name, checkpoints) for name in args.agent or sorted(AGENTS)}
+    server = AgentServer(services, max_active=args.max_active, max_queued=args.max_queued)
+    server.run(args.host, args.port)
 
 
 if __name__ == "__main__":
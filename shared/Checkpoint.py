@@ -0,0 +1,384 @@
+import os
+import random
+import sqlite3
+import threading
+import zlib
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    SerializerProtocol,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+# Name -> (type, encode to plain data, decode from it)
+Codecs = Dict[str, Tuple[type, Callable[[Any], Any], Callable[[Any], Any]]]
+
+CODEC_KEY = "__codec__"
+# Serialized values larger than this many bytes are stored compressed
+COMPRESS_OVER = 1024
+
+
+def model_codec(model: type) -> Tuple[type, Callable[[Any], Any], Callable[[Any], Any]]:
+    """Codec for a pydantic model, stored under its field aliases."""
+    return model, lambda value: value.model_dump(by_alias=True), model.model_validate
+
+
+class CompactSerializer(SerializerProtocol):
+    """
+    Checkpoint serializer: LangGraph's msgpack serialization, plus codecs for
+    the agents' own state types and zlib for large values.
+
+    Codecs hold the classes themselves, so loading a checkpoint never imports
+    a module by name; every agent has its own State, Schema, ... module and
+    the name alone would resolve to whichever was imported last.
+    """
+
+    def __init__(self, codecs: Optional[Codecs] = None, compress_over: int = COMPRESS_OVER):
+        self.codecs = codecs or {}
+        self.names = {cls: name for name, (cls, _, _) in self.codecs.items()}
+        self.compress_over = compress_over
+        self.inner = JsonPlusSerializer()
+
+    def encode(self, value: Any) -> Any:
+        name = self.names.get(type(value))
+        if name is not None:
+            return {CODEC_KEY: name, "data": self.codecs[name][1](value)}
+        if type(value) is dict:
+            return {key: self.encode(item) for key, item in value.items()}
+        if type(value) in (list, tuple):
+            return type(value)(self.encode(item) for item in value)
+        return value
+
+    def decode(self, value: Any) -> Any:
+        if type(value) is dict:
+            if value.get(CODEC_KEY) in self.codecs:
+                return self.codecs[value[CODEC_KEY]][2](value["data"])
+            return {key: self.decode(item) for key, item in value.items()}
+        if type(value) in (list, tuple):
+            return type(value)(self.decode(item) for item in value)
+        return value
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        kind, data = self.inner.dumps_typed(self.encode(obj))
+        if len(data) > self.compress_over:
+            return f"{kind}+zlib", zlib.compress(data)
+        return kind, data
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        kind, payload = data
+        if kind.endswith("+zlib"):
+            kind, payload = kind[: -len("+zlib")], zlib.decompress(payload)
+        return self.decode(self.inner.loads_typed((kind, payload)))
+
+
+class SqliteSaver(BaseCheckpointSaver[str]):
+    """
+    LangGraph checkpointer keeping graph runs in a SQLite file.
+
+    Every finished step is a checkpoint and every finished task's output a
+    pending write, so a run that fails midway resumes from its last step
+    without re-running the tasks of the failed step that had completed,
+    such as the web searches that did succeed. Channel values are stored
+    once per version, so steps that don't touch the research results don't
+    store them again.
+    """
+
+    def __init__(self, path: str, serde: Optional[SerializerProtocol] = None):
+        super().__init__(serde=serde or CompactSerializer())
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Batch worker processes share the file, a writer may have to wait for another
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL,
+                    checkpoint_id TEXT NOT NULL,
+                    parent_checkpoint_id TEXT,
+                    type TEXT NOT NULL,
+                    checkpoint BLOB NOT NULL,
+                    metadata_type TEXT NOT NULL,
+                    metadata BLOB NOT NULL,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+                )
+                """
+            )
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS blobs (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL,
+                    channel TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    value BLOB,
+                    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+                )
+                """
+            )
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS writes (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL,
+                    checkpoint_id TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    channel TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    value BLOB,
+                    task_path TEXT NOT NULL,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                )
+                """
+            )
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, row: tuple) -> CheckpointTuple:
+        checkpoint_id, parent_checkpoint_id, kind, data, metadata_type, metadata = row
+        checkpoint = self.serde.loads_typed((kind, data))
+        with self._lock:
+            blobs = [
+                self._connection.execute(
+                    """
+                    SELECT type, value FROM blobs
+                    WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?
+                    """,
+                    (thread_id, checkpoint_ns, channel, str(version)),
+                ).fetchone() + (channel,)
+                for channel, version in checkpoint["channel_versions"].items()
+            ]
+            writes = self._connection.execute(
+                """
+                SELECT task_id, channel, type, value FROM writes
+                WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+                ORDER BY task_path, task_id, idx
+                """,
+                (thread_id, checkpoint_ns, checkpoint_id),
+            ).fetchall()
+        checkpoint["channel_values"] = {
+            channel: self.serde.loads_typed((kind, value)) for kind, value, channel in blobs if kind != "empty"
+        }
+        return CheckpointTuple(
+            config={"configurable": {
+                "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id,
+            }},
+            checkpoint=checkpoint,
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config={"configurable": {
+                "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_checkpoint_id,
+            }} if parent_checkpoint_id else None,
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((kind, value)))
+                for task_id, channel, kind, value in writes
+            ],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self._connection.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self._connection.execute(
+                    f"""
+                    SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?
+                    ORDER BY checkpoint_id DESC LIMIT 1
+                    """,
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+        return self._tuple(thread_id, checkpoint_ns, row) if row else None
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id FROM checkpoints WHERE 1 = 1"
+        params = []
+        if config:
+            query += " AND thread_id = ?"
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                query += " AND checkpoint_ns = ?"
+                params.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            query += " AND checkpoint_id < ?"
+            params.append(before_id)
+        query += " ORDER BY checkpoint_id DESC"
+        with self._lock:
+            keys = self._connection.execute(query, params).fetchall()
+        for thread_id, checkpoint_ns, checkpoint_id in keys:
+            if limit is not None and limit <= 0:
+                return
+            found = self.get_tuple({"configurable": {
+                "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id,
+            }})
+            if found is None or (filter and any(found.metadata.get(k) != v for k, v in filter.items())):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield found
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        checkpoint = checkpoint.copy()
+        values = checkpoint.pop("channel_values")
+        blobs = [
+            (thread_id, checkpoint_ns, channel, str(version),
+             *(self.serde.dumps_typed(values[channel]) if channel in values else ("empty", None)))
+            for channel, version in new_versions.items()
+        ]
+        kind, data = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_data = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)", blobs)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 kind, data, metadata_type, metadata_data),
+            )
+        return {"configurable": {
+            "thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"],
+        }}
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = [
+            (thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel,
+             *self.serde.dumps_typed(value), task_path)
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        # Special writes (errors, interrupts) replace earlier ones, regular writes are only stored once
+        replace = "REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "IGNORE"
+        with self._lock, self._connection:
+            self._connection.executemany(f"INSERT OR {replace} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock, self._connection:
+            for table in ("checkpoints", "blobs", "writes"):
+                self._connection.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    # SQLite calls are short and local, the async versions run them inline
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.get_tuple(config)
+
+    async def alist(self, config: Optional[RunnableConfig], **kwargs):
+        for found in self.list(config, **kwargs):
+            yield found
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        return self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return self.delete_thread(thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        if current is None:
+            current_version = 0
+        elif isinstance(current, int):
+            current_version = current
+        else:
+            current_version = int(current.split(".")[0])
+        return f"{current_version + 1:032}.{random.random():016}"
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def thread_config(config: Optional[RunnableConfig], thread_id: str) -> RunnableConfig:
+    """`config` with the graph run assigned to checkpoint thread `thread_id`."""
+    config = dict(config or {})
+    config["configurable"] = {**config.get("configurable", {}), "thread_id": thread_id}
+    return config
+
+
+def resume_input(graph, state: dict, config: RunnableConfig) -> Optional[dict]:
+    """
+    The input to run `graph` with on `config`'s thread: None when an earlier
+    run on it stopped midway, so it continues after its last completed step,
+    otherwise `state` on a fresh thread.
+    """
+    if graph.checkpointer is None:
+        return state
+    snapshot = graph.get_state(config)
+    if snapshot.next:
+        return None
+    if snapshot.created_at is not None:
+        # A run that finished but wasn't cleared would add the new request to its state
+        graph.checkpointer.delete_thread(config["configurable"]["thread_id"])
+    return state
+
+
+async def aresume_input(graph, state: dict, config: RunnableConfig) -> Optional[dict]:
+    """Async version of `resume_input`."""
+    if graph.checkpointer is None:
+        return state
+    snapshot = await graph.aget_state(config)
+    if snapshot.next:
+        return None
+    if snapshot.created_at is not None:
+        await graph.checkpointer.adelete_thread(config["configurable"]["thread_id"])
+    return state
+
+
+def forget(graph, config: RunnableConfig):
+    """Drop the checkpoints of a finished run, they're only kept for runs that still need resuming."""
+    if graph.checkpointer is not None:
+        graph.checkpointer.delete_thread(config["configurable"]["thread_id"])
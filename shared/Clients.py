@@ -0,0 +1,87 @@
+import threading
+from typing import Any, Optional
+
+from google.genai import Client
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from shared.RateLimit import ChatRateLimiter, RateLimitFeedback, get_limiter
+from shared.Tracing import LLM_CALLBACKS
+
+_lock = threading.Lock()
+_genai_clients: dict[str, Client] = {}
+_chat_models: dict[tuple, ChatGoogleGenerativeAI] = {}
+_structured_models: dict[tuple, Any] = {}
+
+
+def get_genai_client(api_key: str) -> Client:
+    """
+    Return the process-wide google.genai client for `api_key`.
+
+    The client owns the HTTP connection pool, so every agent in the process
+    reuses the same connections instead of opening new ones per node call.
+    """
+    with _lock:
+        if api_key not in _genai_clients:
+            _genai_clients[api_key] = Client(api_key=api_key)
+        return _genai_clients[api_key]
+
+
+def get_chat_model(
+    model: str, temperature: float, api_key: str, max_retries: int = 2
+) -> ChatGoogleGenerativeAI:
+    """
+    Return the process-wide chat model for (model, temperature, api_key).
+
+    Every call made through it is traced whenever a tracer is installed, and
+    paced by the process-wide Gemini rate limiter.
+    """
+    key = (model, temperature, api_key, max_retries)
+    with _lock:
+        if key not in _chat_models:
+            _chat_models[key] = ChatGoogleGenerativeAI(
+                model=model,
+                temperature=temperature,
+                max_retries=max_retries,
+                api_key=api_key,
+                rate_limiter=ChatRateLimiter(get_limiter("gemini")),
+                callbacks=[LLM_CALLBACKS, RateLimitFeedback(get_limiter("gemini"))],
+            )
+        return _chat_models[key]
+
+
+def get_structured_model(
+    model: str,
+    temperature: float,
+    schema: type,
+    api_key: str,
+    include_raw: bool = False,
+    max_retries: int = 2,
+):
+    """
+    Return the process-wide structured-output runnable for (model, temperature, schema).
+    """
+    key = (model, temperature, schema, api_key, include_raw, max_retries)
+    with _lock:
+        structured = _structured_models.get(key)
+    if structured is None:
+        llm = get_chat_model(model, temperature, api_key, max_retries=max_retries)
+        structured = llm.with_structured_output(schema, include_raw=include_raw)
+        with _lock:
+            structured = _structured_models.setdefault(key, structured)
+    return structured
+
+
+def clear_clients(api_key: Optional[str] = None):
+    """
+    Drop registered clients and models, optionally only those for `api_key`.
+    """
+    with _lock:
+        if api_key is None:
+            _genai_clients.clear()
+            _chat_models.clear()
+            _structured_models.clear()
+            return
+        _genai_clients.pop(api_key, None)
+        for registry in (_chat_models, _structured_models):
+            for key in [key for key in registry if api_key in key]:
+                del registry[key]
@@ -0,0 +1,129 @@
+import asyncio
+import random
+import weakref
+from typing import Any, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from shared.Tracing import span
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, HttpClient]" = weakref.WeakKeyDictionary()
+
+
+class HttpClient:
+    """
+    Pooled async HTTP client shared by the agents' nodes.
+
+    Connections are kept alive and reused across requests, each host gets its
+    own concurrency limit, and transient failures (transport errors, 429 and
+    5xx responses) are retried with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 10.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        per_host_limit: int = 8,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 8.0,
+    ):
+        self.per_host_limit = per_host_limit
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+            ),
+            follow_redirects=True,
+        )
+        self._host_limits: dict[str, asyncio.Semaphore] = {}
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_limits[host]
+
+    def _delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        if response is not None and "Retry-After" in response.headers:
+            try:
+                return min(self.max_backoff, float(response.headers["Retry-After"]))
+            except ValueError:
+                pass
+        # Full jitter keeps concurrent retries from hitting the host in lockstep
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    async def get(
+        self,
+        url: str,
+        params: Optional[dict[str, Any]] = None,
+        headers: Optional[dict[str, str]] = None,
+    ) -> httpx.Response:
+        """
+        GET `url` with `params` encoded into the query string, retrying transient failures.
+
+        Raises httpx.HTTPStatusError for error responses once retries are exhausted.
+        """
+        parts = urlsplit(url)
+        # The query string is left out, it may carry api keys
+        with span(f"GET {parts.netloc}", kind="http", **{"http.path": parts.path}) as request_span:
+            async with self._host_limit(url):
+                for attempt in range(self.retries + 1):
+                    request_span.set("http.attempts", attempt + 1)
+                    try:
+                        response = await self._client.get(url, params=params, headers=headers)
+                    except httpx.TransportError:
+                        if attempt == self.retries:
+                            raise
+                        await asyncio.sleep(self._delay(attempt))
+                        continue
+                    request_span.set("http.status_code", response.status_code)
+                    if response.status_code in RETRY_STATUS_CODES and attempt < self.retries:
+                        await asyncio.sleep(self._delay(attempt, response))
+                        continue
+                    response.raise_for_status()
+                    request_span.set("bytes.response", len(response.content))
+                    return response
+
+    async def get_json(
+        self,
+        url: str,
+        params: Optional[dict[str, Any]] = None,
+        headers: Optional[dict[str, str]] = None,
+    ) -> Any:
+        response = await self.get(url, params=params, headers=headers)
+        return response.json()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+def get_http_client() -> HttpClient:
+    """
+    Return the shared HttpClient for the running event loop.
+
+    Async connections and semaphores are bound to the loop that created them,
+    so one client is kept per loop and reused by every request on it.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = HttpClient()
+    return client
+
+
+async def close_http_client():
+    """
+    Close the shared HttpClient of the running event loop, if one was created.
+    """
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -0,0 +1,173 @@
+import math
+import re
+from collections import Counter
+from typing import List, Optional, Sequence
+
+from shared.Tracing import current_span
+
+# Estimated at four characters per token, like the sentiment batches
+CHARS_PER_TOKEN = 4
+# Passages sharing this much of their word shingles with an earlier one are dropped
+NEAR_DUPLICATE = 0.8
+SHINGLE_WORDS = 3
+# A passage that doesn't fit is trimmed into what's left of the budget, if that's at least this much
+MIN_TRIM_TOKENS = 48
+
+_LINK = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_WORD = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"[.!?]\s|\n")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_passages(document: str) -> List[str]:
+    """Split a document into its paragraphs."""
+    return [passage.strip() for passage in re.split(r"\n\s*\n", document) if passage.strip()]
+
+
+def passage_terms(passage: str) -> List[str]:
+    """Lowercased words of a passage, ignoring citation link targets and very short words."""
+    return [word for word in _WORD.findall(_LINK.sub(r"\1", passage).casefold()) if len(word) > 2]
+
+
+def shingles(terms: Sequence[str], size: int = SHINGLE_WORDS) -> set:
+    if len(terms) <= size:
+        return {tuple(terms)}
+    return {tuple(terms[i:i + size]) for i in range(len(terms) - size + 1)}
+
+
+def trim_to_tokens(passage: str, max_tokens: int) -> str:
+    """Cut a passage to about `max_tokens`, at a sentence end where possible and never inside a citation link."""
+    # Leaves room for the ellipsis marking the cut
+    limit = (max_tokens - 2) * CHARS_PER_TOKEN
+    if len(passage) <= limit:
+        return passage
+    cut = passage[:limit]
+    ends = [match.end() for match in _SENTENCE_END.finditer(cut)]
+    if ends and ends[-1] > limit // 2:
+        cut = cut[:ends[-1]]
+    elif " " in cut:
+        cut = cut[:cut.rindex(" ")]
+    # Drop a citation marker cut in half, its url would be useless
+    opening = cut.rfind("[")
+    if opening != -1 and ")" not in cut[opening:]:
+        cut = cut[:opening]
+    return cut.rstrip() + " ..."
+
+
+def pack_documents(
+    documents: Sequence[str],
+    topic: str,
+    max_tokens: Optional[int],
+    near_duplicate: float = NEAR_DUPLICATE,
+    headers: bool = False,
+) -> List[str]:
+    """
+    Pack documents into a prompt's token budget, passage by passage.
+
+    Repeated and near-duplicate paragraphs are dropped, the rest are ranked
+    against `topic` with BM25 and taken best first until `max_tokens` is
+    spent (None packs without a budget). Returns one string per document
+    with its kept passages in their original order, so citations and the
+    documents' own structure survive. With `headers`, each document's first
+    passage names its source and is kept whenever any other passage of the
+    document is.
+    """
+    passages = []
+    first_positions = {}
+    for doc_index, document in enumerate(documents):
+        for passage in split_passages(document):
+            first_positions.setdefault(doc_index, len(passages))
+            passages.append((doc_index, len(passages), passage, passage_terms(passage)))
+
+    kept = []
+    seen_shingles = []
+    seen_texts = set()
+    for doc_index, position, passage, terms in passages:
+        key = " ".join(terms) or passage
+        if key in seen_texts:
+            continue
+        passage_shingles = shingles(terms)
+        if terms and any(
+            len(passage_shingles & earlier) >= near_duplicate * len(passage_shingles) for earlier in seen_shingles
+        ):
+            continue
+        seen_texts.add(key)
+        seen_shingles.append(passage_shingles)
+        kept.append((doc_index, position, passage, terms))
+
+    # BM25 over the surviving passages, with the topic's words as the query
+    query = set(passage_terms(topic))
+    frequencies = Counter(term for _, _, _, terms in kept for term in set(terms) if term in query)
+    average_length = sum(len(terms) for _, _, _, terms in kept) / len(kept) if kept else 1.0
+
+    def score(terms: List[str]) -> float:
+        counts = Counter(terms)
+        total = 0.0
+        for term in query:
+            if not counts[term]:
+                continue
+            idf = math.log(1 + (len(kept) - frequencies[term] + 0.5) / (frequencies[term] + 0.5))
+            norm = counts[term] + 1.2 * (0.25 + 0.75 * len(terms) / (average_length or 1.0))
+            total += idf * counts[term] * 2.2 / norm
+        return total
+
+    header_passages = {}
+    if headers:
+        header_passages = {
+            doc_index: (position, passage)
+            for doc_index, position, passage, _ in kept
+            if first_positions[doc_index] == position
+        }
+    # Headers on their own only get what the documents' content leaves
+    ranked = sorted(
+        kept, key=lambda item: (header_passages.get(item[0], (None,))[0] == item[1], -score(item[3]), item[1])
+    )
+    selected = {}
+    remaining = max_tokens
+    for doc_index, position, passage, _ in ranked:
+        if position in selected:
+            continue
+        # A passage brings its document's header along, within the same budget
+        header = header_passages.get(doc_index)
+        if header is not None and header[0] in selected:
+            header = None
+        header_tokens = estimate_tokens(header[1]) if header is not None and header[0] != position else 0
+        tokens = estimate_tokens(passage)
+        if remaining is None or tokens + header_tokens <= remaining:
+            pass
+        elif remaining - header_tokens >= MIN_TRIM_TOKENS:
+            passage = trim_to_tokens(passage, remaining - header_tokens)
+            tokens = estimate_tokens(passage)
+        else:
+            continue
+        selected[position] = (doc_index, passage)
+        if header_tokens:
+            selected[header[0]] = (doc_index, header[1])
+        if remaining is not None:
+            remaining -= tokens + header_tokens
+
+    packed = [[] for _ in documents]
+    for position in sorted(selected):
+        doc_index, passage = selected[position]
+        packed[doc_index].append(passage)
+
+    packed_span = current_span()
+    packed_span.add("context.tokens.input", sum(estimate_tokens(passage) for _, _, passage, _ in passages))
+    packed_span.add("context.tokens.packed", sum(estimate_tokens(passage) for _, passage in selected.values()))
+    packed_span.add("context.passages.dropped", len(passages) - len(selected))
+    return ["\n\n".join(document) for document in packed]
+
+
+def pack_context(
+    documents: Sequence[str],
+    topic: str,
+    max_tokens: Optional[int],
+    separator: str = "\n\n---\n\n",
+    headers: bool = False,
+) -> str:
+    """`pack_documents` joined into a single prompt section, leaving out documents with nothing kept."""
+    packed = pack_documents(documents, topic, max_tokens, headers=headers)
+    return separator.join(document for document in packed if document)
@@ -0,0 +1,322 @@
+import asyncio
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.rate_limiters import BaseRateLimiter
+from langgraph.runtime import get_runtime
+from langgraph.types import RetryPolicy
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+# Upstream -> (requests per second, burst, quota per window or None, window seconds).
+# Override with RATE_LIMIT_<NAME>="rate[:burst[:quota[:window]]]", e.g. RATE_LIMIT_SERPAPI="1:5:5000:2592000"
+UPSTREAM_LIMITS: Dict[str, Tuple[float, float, Optional[int], float]] = {
+    "gemini": (5.0, 10, None, 24 * 60 * 60),
+    "serpapi": (1.0, 5, None, 30 * 24 * 60 * 60),
+    "reddit": (1.6, 10, None, 60),
+    "yahoo": (2.0, 10, None, 60 * 60),
+}
+# Longest a caller queues for a slot before the limiter pushes back, per priority
+MAX_WAIT = {INTERACTIVE: 10.0, BATCH: 120.0}
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("request_priority", default=INTERACTIVE)
+_limiters: Dict[str, "RateLimiter"] = {}
+_limiters_lock = threading.Lock()
+# Fraction of each upstream's limits this process may use
+_share = 1.0
+
+
+class Backpressure(Exception):
+    """
+    An upstream can't take more requests right now: it is throttling us, its
+    quota is spent, or the queue for it is longer than the caller may wait.
+    Carries how long to wait before trying again.
+    """
+
+    def __init__(self, upstream: str, retry_after: float, reason: str):
+        super().__init__(f"{upstream} {reason}, retry after {retry_after:.1f}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+def as_backpressure(upstream: str, error: BaseException) -> Backpressure:
+    """Turn an upstream's rate limit error into Backpressure, honouring its Retry-After."""
+    if isinstance(error, Backpressure):
+        return error
+    retry_after = 1.0
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        retry_after = float(headers.get("Retry-After", retry_after))
+    except (TypeError, ValueError):
+        pass
+    return Backpressure(upstream, retry_after, "is throttling requests")
+
+
+def should_retry(error: BaseException) -> bool:
+    """Whether a node failing with `error` is retried: backpressure the request's priority may wait out."""
+    return isinstance(error, Backpressure) and error.retry_after <= MAX_WAIT[_priority.get()]
+
+
+# Graph nodes retry on backpressure instead of answering from empty results. The wait
+# the upstream asked for is spent in the node wrapper (`backpressure_delay`), the
+# policy's own interval only spreads the retries out
+BACKPRESSURE_RETRY = RetryPolicy(initial_interval=0.5, backoff_factor=2.0, max_attempts=3, retry_on=should_retry)
+
+
+def backpressure_delay(error: BaseException) -> float:
+    """Seconds a node failing with `error` waits before LangGraph retries it, 0 if it won't be."""
+    if not should_retry(error):
+        return 0.0
+    try:
+        execution_info = get_runtime().execution_info
+    except RuntimeError:
+        # Called outside a graph run
+        return 0.0
+    if execution_info is not None and execution_info.node_attempt >= BACKPRESSURE_RETRY.max_attempts:
+        return 0.0
+    return error.retry_after
+
+
+def is_throttled(error: BaseException) -> bool:
+    """Whether `error` is an upstream rate limit response, across the clients in use."""
+    if isinstance(error, Backpressure):
+        return True
+    response = getattr(error, "response", None)
+    for status in (getattr(error, "status_code", None), getattr(error, "code", None), getattr(response, "status_code", None)):
+        if status == 429:
+            return True
+    return type(error).__name__ in {"ResourceExhausted", "TooManyRequests", "YFRateLimitError"}
+
+
+class RateLimiter:
+    """
+    Adaptive token bucket for one upstream.
+
+    The refill rate follows AIMD: every successful call raises it by
+    `increase` up to `max_rate`, every throttled one halves it down to
+    `min_rate` and pauses the bucket. Interactive callers may queue on future
+    tokens; batch callers only take a token while `reserve` tokens remain
+    for interactive ones, so batch jobs never delay a user. A caller whose
+    wait would exceed its priority's maximum, or who finds the quota spent,
+    gets `Backpressure` right away.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: float,
+        quota: Optional[int] = None,
+        quota_window: float = 24 * 60 * 60,
+        min_rate: Optional[float] = None,
+        increase: Optional[float] = None,
+        reserve: Optional[float] = None,
+    ):
+        self.name = name
+        self.max_rate = rate
+        self.min_rate = min_rate if min_rate is not None else rate / 20
+        self.increase = increase if increase is not None else rate / 20
+        self.rate = rate
+        self.burst = burst
+        self.reserve = reserve if reserve is not None else max(1.0, burst / 4)
+        self.tokens = float(burst)
+        self.quota = quota
+        self.quota_window = quota_window
+        self.window_started = time.time()
+        self.used = 0
+        self.throttled = 0
+        self.rejected = 0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self, priority: str, max_wait: float) -> float:
+        """
+        Take a token and return how long to wait before using it. A negative
+        value means no token was taken and the (batch) caller should poll
+        again after that long.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.quota is not None:
+                if time.time() - self.window_started >= self.quota_window:
+                    self.window_started, self.used = time.time(), 0
+                if self.used >= self.quota:
+                    self.rejected += 1
+                    retry_after = self.window_started + self.quota_window - time.time()
+                    raise Backpressure(self.name, retry_after, "quota is spent")
+
+            if priority == BATCH and self.tokens - 1 < self.reserve:
+                delay = (self.reserve + 1 - self.tokens) / self.rate
+                if delay > max_wait:
+                    self.rejected += 1
+                    raise Backpressure(self.name, delay, "is saturated")
+                return -delay
+            delay = max(0.0, (1 - self.tokens) / self.rate)
+            if delay > max(max_wait, 0.0):
+                self.rejected += 1
+                raise Backpressure(self.name, delay, "is saturated")
+            self.tokens -= 1
+            self.used += 1
+            return delay
+
+    def acquire(self, priority: Optional[str] = None):
+        """Block until a call may go out, or raise Backpressure."""
+        priority = priority or _priority.get()
+        deadline = time.monotonic() + MAX_WAIT[priority]
+        while True:
+            delay = self._reserve(priority, deadline - time.monotonic())
+            time.sleep(abs(delay))
+            if delay >= 0:
+                return
+
+    async def aacquire(self, priority: Optional[str] = None):
+        priority = priority or _priority.get()
+        deadline = time.monotonic() + MAX_WAIT[priority]
+        while True:
+            delay = self._reserve(priority, deadline - time.monotonic())
+            await asyncio.sleep(abs(delay))
+            if delay >= 0:
+                return
+
+    def success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def throttle(self, retry_after: Optional[float] = None):
+        """Back off after a rate limit response: halve the rate and drain the bucket."""
+        with self._lock:
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._refill(time.monotonic())
+            # Negative tokens make everyone wait out the upstream's pause
+            self.tokens = min(self.tokens, 0.0) - (retry_after or 0.0) * self.rate
+
+    def record(self, error: Optional[BaseException]):
+        """Feed a call's outcome back into the rate."""
+        if error is None:
+            self.success()
+        elif is_throttled(error):
+            self.throttle(getattr(error, "retry_after", None))
+
+    @contextlib.contextmanager
+    def slot(self, priority: Optional[str] = None):
+        """Wait for a slot, run the block as the upstream call, and learn from its outcome."""
+        self.acquire(priority)
+        try:
+            yield
+        except BaseException as e:
+            self.record(e)
+            raise
+        self.record(None)
+
+    @contextlib.asynccontextmanager
+    async def aslot(self, priority: Optional[str] = None):
+        await self.aacquire(priority)
+        try:
+            yield
+        except BaseException as e:
+            self.record(e)
+            raise
+        self.record(None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "rate": round(self.rate, 3),
+                "max_rate": self.max_rate,
+                "tokens": round(self.tokens, 2),
+                "used": self.used,
+                "quota": self.quota,
+                "throttled": self.throttled,
+                "rejected": self.rejected,
+            }
+
+
+class ChatRateLimiter(BaseRateLimiter):
+    """Plugs an upstream's RateLimiter into LangChain chat models' `rate_limiter`."""
+
+    def __init__(self, limiter: RateLimiter):
+        self.limiter = limiter
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        self.limiter.acquire()
+        return True
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        await self.limiter.aacquire()
+        return True
+
+
+class RateLimitFeedback(BaseCallbackHandler):
+    """Reports each chat model call's outcome to the upstream's RateLimiter."""
+
+    run_inline = True
+
+    def __init__(self, limiter: RateLimiter):
+        self.limiter = limiter
+
+    def on_llm_end(self, response, **kwargs):
+        self.limiter.success()
+
+    def on_llm_error(self, error, **kwargs):
+        self.limiter.record(error)
+
+
+def get_limiter(name: str) -> RateLimiter:
+    """Return the process-wide limiter for upstream `name`, configured from UPSTREAM_LIMITS and the env."""
+    with _limiters_lock:
+        if name not in _limiters:
+            rate, burst, quota, window = UPSTREAM_LIMITS[name]
+            override = os.getenv(f"RATE_LIMIT_{name.upper()}")
+            if override:
+                values = override.split(":")
+                rate = float(values[0])
+                burst = float(values[1]) if len(values) > 1 else burst
+                quota = int(values[2]) if len(values) > 2 else quota
+                window = float(values[3]) if len(values) > 3 else window
+            rate, burst = rate * _share, max(1.0, burst * _share)
+            quota = int(quota * _share) if quota is not None else None
+            _limiters[name] = RateLimiter(name, rate, burst, quota=quota, quota_window=window)
+        return _limiters[name]
+
+
+def share_limits(fraction: float):
+    """
+    Let this process use only `fraction` of every upstream's limits, for jobs
+    split across processes that share one allowance. Call it before the first
+    limiter is created.
+    """
+    global _share
+    with _limiters_lock:
+        if _limiters:
+            raise RuntimeError("share_limits must be called before any limiter is created")
+        _share = fraction
+
+
+def rate_limit_stats() -> Dict[str, dict]:
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
+
+
+@contextlib.contextmanager
+def request_priority(priority: str):
+    """Run the block, and the graph runs started in it, at `priority`."""
+    if priority not in MAX_WAIT:
+        raise ValueError(f"unknown priority {priority!r}, expected one of {', '.join(MAX_WAIT)}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
@@ -0,0 +1,264 @@
+import asyncio
+import contextlib
+import json
+import time
+import uuid
+from typing import Any, Collection, Dict
+
+from aiohttp import web
+
+from shared.Checkpoint import aresume_input, thread_config
+from shared.Http import close_http_client
+from shared.RateLimit import INTERACTIVE, MAX_WAIT, Backpressure, rate_limit_stats, request_priority
+from shared.SingleFlight import coalescing_stats
+from shared.Streaming import astream_events
+from shared.Tracing import current_span, get_tracer, span
+
+
+class Overloaded(Exception):
+    """Raised when a request arrives while every slot and the whole waiting queue are taken."""
+
+
+class AdmissionControl:
+    """
+    Lets at most `max_active` requests run at once and up to `max_queued` more
+    wait for a slot; anything beyond that is rejected straight away, so a burst
+    gets a fast 503 instead of piling up behind the model and search quotas.
+    """
+
+    def __init__(self, max_active: int, max_queued: int):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.active = 0
+        self.queued = 0
+        self._slots = asyncio.Semaphore(max_active)
+
+    @contextlib.asynccontextmanager
+    async def admit(self):
+        if self._slots.locked() and self.queued >= self.max_queued:
+            raise Overloaded()
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._slots.release()
+
+
+class GraphService:
+    """
+    An agent served over HTTP: its graph is compiled once and shared by every request.
+
+    `agent` must provide `async from_request(payload) -> (state, config)`, raising
+    ValueError for bad input, and `to_response(state) -> dict`.
+    """
+
+    def __init__(self, agent: Any, graph: Any, answer_nodes: Collection[str]):
+        self.agent = agent
+        self.graph = graph
+        self.answer_nodes = answer_nodes
+
+    async def prepare(self, payload: dict, thread_id: str):
+        """
+        The (input, config) of a graph run for a request body. With a
+        checkpointer the run belongs to `thread_id`, and a run on it that
+        failed midway is resumed instead of started again.
+        """
+        state, config = await self.agent.from_request(payload)
+        if self.graph.checkpointer is None:
+            return state, config
+        config = thread_config(config, thread_id)
+        return await aresume_input(self.graph, state, config), config
+
+    async def finish(self, config: dict):
+        """Drop the checkpoints of a run that completed."""
+        if self.graph.checkpointer is not None:
+            await self.graph.checkpointer.adelete_thread(config["configurable"]["thread_id"])
+
+
+class AgentServer:
+    """
+    HTTP server streaming agent runs as server-sent events.
+
+    POST /agents/{name} with a JSON body runs that agent and streams "start",
+    "token", "progress", "node" and finally "done" (or "error"/"cancelled")
+    events. An optional "priority" of "batch" lets the request use only
+    upstream capacity that interactive requests leave spare.
+    DELETE /requests/{id} cancels a queued or running request, as does the
+    client disconnecting. Blocking nodes already running on a worker thread
+    finish in the background, but nothing after them is started. When the
+    agents keep checkpoints, sending a failed or cancelled request again with
+    the same X-Request-Id resumes it after its last completed step.
+    """
+
+    def __init__(
+        self,
+        services: Dict[str, GraphService],
+        max_active: int = 8,
+        max_queued: int = 32,
+        retry_after: int = 1,
+    ):
+        self.services = services
+        self.admission = AdmissionControl(max_active, max_queued)
+        self.retry_after = retry_after
+        self.requests: Dict[str, asyncio.Task] = {}
+        self.cancelled: set = set()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([
+            web.get("/health", self.health),
+            web.get("/metrics", self.metrics),
+            web.post("/agents/{agent}", self.run_agent),
+            web.delete("/requests/{request_id}", self.cancel),
+        ])
+        app.on_cleanup.append(self.cleanup)
+        return app
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "agents": sorted(self.services),
+            "active": self.admission.active,
+            "queued": self.admission.queued,
+            "max_active": self.admission.max_active,
+            "max_queued": self.admission.max_queued,
+        })
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        """
+        Upstream calls coalesced per group, upstream rate limiter state, plus per
+        node, LLM and upstream call timings once tracing is configured.
+        """
+        tracer = get_tracer()
+        return web.json_response({
+            "coalescing": coalescing_stats(),
+            "rate_limits": rate_limit_stats(),
+            "spans": tracer.metrics.summary() if tracer is not None else None,
+        })
+
+    async def run_agent(self, request: web.Request) -> web.StreamResponse:
+        service = self.services.get(request.match_info["agent"])
+        if service is None:
+            return web.json_response({"error": f"unknown agent {request.match_info['agent']!r}"}, status=404)
+        try:
+            payload = await request.json()
+        except json.JSONDecodeError:
+            return web.json_response({"error": "body must be JSON"}, status=400)
+        if not isinstance(payload, dict):
+            return web.json_response({"error": "body must be a JSON object"}, status=400)
+        priority = payload.pop("priority", INTERACTIVE)
+        if priority not in MAX_WAIT:
+            return web.json_response({"error": f"priority must be one of {', '.join(MAX_WAIT)}"}, status=400)
+
+        # Clients may pick the id, so they can cancel a request still waiting in the queue
+        request_id = request.headers.get("X-Request-Id") or uuid.uuid4().hex
+        if request_id in self.requests:
+            return web.json_response({"error": f"request {request_id} is already running"}, status=409)
+
+        self.requests[request_id] = asyncio.current_task()
+        queued_at = time.perf_counter()
+        try:
+            with span(f"request {request.match_info['agent']}", kind="request", **{"request.id": request_id}) as request_span:
+                async with self.admission.admit():
+                    request_span.set("queue.seconds", time.perf_counter() - queued_at)
+                    request_span.set("request.priority", priority)
+                    with request_priority(priority):
+                        return await self.serve(request, request_id, service, payload)
+        except Overloaded:
+            return web.json_response(
+                {"error": "server is at capacity, retry later"},
+                status=503,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        except asyncio.CancelledError:
+            if request_id not in self.cancelled:
+                raise
+            # Cancelled through DELETE while still queued
+            asyncio.current_task().uncancel()
+            return web.json_response({"error": "cancelled"}, status=499)
+        finally:
+            self.requests.pop(request_id, None)
+            self.cancelled.discard(request_id)
+
+    async def serve(
+        self, request: web.Request, request_id: str, service: GraphService, payload: dict
+    ) -> web.StreamResponse:
+        try:
+            state, config = await service.prepare(payload, request_id)
+        except (TypeError, ValueError) as e:
+            return web.json_response({"error": str(e)}, status=400)
+        except Backpressure as e:
+            return self.backpressure(e)
+        except ConnectionError as e:
+            # An upstream lookup the request needs failed, e.g. resolving its company names
+            return web.json_response({"error": str(e)}, status=502)
+
+        response = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "X-Request-Id": request_id,
+        })
+        await response.prepare(request)
+        await self.send(response, "start", {"request_id": request_id})
+        final_state = {}
+        try:
+            async for event in astream_events(service.graph, state, service.answer_nodes, config):
+                if event["type"] == "state":
+                    final_state = event["state"]
+                elif event["type"] == "token":
+                    await self.send(response, "token", {"node": event["node"], "content": event["content"]})
+                elif event["type"] == "progress":
+                    await self.send(response, "progress", event["data"])
+                else:
+                    await self.send(response, "node", {"node": event["node"]})
+            await service.finish(config)
+            await self.send(response, "done", service.agent.to_response(final_state))
+        except asyncio.CancelledError:
+            # A disconnected client has nobody left to tell
+            if request_id not in self.cancelled:
+                raise
+            asyncio.current_task().uncancel()
+            await self.send(response, "cancelled", {"request_id": request_id})
+        except Exception as e:
+            current_span().fail(f"{type(e).__name__}: {e}")
+            error = {"error": f"{type(e).__name__}: {e}"}
+            if isinstance(e, Backpressure):
+                error["retry_after"] = e.retry_after
+            await self.send(response, "error", error)
+        await response.write_eof()
+        return response
+
+    async def cancel(self, request: web.Request) -> web.Response:
+        request_id = request.match_info["request_id"]
+        task = self.requests.get(request_id)
+        if task is None:
+            return web.json_response({"error": f"no running request {request_id}"}, status=404)
+        self.cancelled.add(request_id)
+        task.cancel()
+        return web.json_response({"request_id": request_id, "cancelled": True})
+
+    @staticmethod
+    def backpressure(error: Backpressure) -> web.Response:
+        return web.json_response(
+            {"error": str(error), "upstream": error.upstream, "retry_after": error.retry_after},
+            status=503,
+            headers={"Retry-After": str(max(1, round(error.retry_after)))},
+        )
+
+    @staticmethod
+    async def send(response: web.StreamResponse, event: str, data: dict):
+        body = json.dumps(data, default=str)
+        await response.write(f"event: {event}\ndata: {body}\n\n".encode())
+
+    @staticmethod
+    async def cleanup(app: web.Application):
+        await close_http_client()
+
+    def run(self, host: str = "127.0.0.1", port: int = 8000):
+        # handler_cancellation: a client disconnecting cancels its graph run
+        web.run_app(self.app(), host=host, port=port, handler_cancellation=True)
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from shared.Tracing import current_span
+
+_groups: Dict[str, "SingleFlight"] = {}
+_groups_lock = threading.Lock()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical upstream calls.
+
+    While a call for a key is in flight, further calls for the same key wait
+    for it and share its result (or exception) instead of calling upstream
+    again. Nothing is cached once the call finishes. Blocking callers use
+    `do`, coroutines use `ado`. Shared results must be treated as read-only.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Tuple[asyncio.AbstractEventLoop, Hashable], asyncio.Task] = {}
+
+    def _count(self, coalesced: bool):
+        # Caller holds the lock
+        if coalesced:
+            self.coalesced += 1
+        else:
+            self.calls += 1
+        current_span().set("coalesced", int(coalesced))
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run `func()` unless a call for `key` is in flight; returns (result, coalesced)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            self._count(not leader)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    async def ado(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Await `func()` unless a call for `key` is in flight on this loop; returns (result, coalesced)."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._tasks.get((loop, key))
+            leader = task is None
+            if leader:
+                # The call runs as its own task, so cancelling the caller that
+                # started it doesn't fail the others waiting on it
+                task = self._tasks[(loop, key)] = loop.create_task(func())
+                task.add_done_callback(lambda done: self._finish(loop, key, done))
+            self._count(not leader)
+        return await asyncio.shield(task), not leader
+
+    def _finish(self, loop: asyncio.AbstractEventLoop, key: Hashable, task: asyncio.Task):
+        with self._lock:
+            self._tasks.pop((loop, key), None)
+        # Mark the exception retrieved in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": self.calls, "coalesced": self.coalesced}
+
+
+def single_flight(name: str) -> SingleFlight:
+    """Return the process-wide SingleFlight group `name`, shared by every agent."""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+def coalescing_stats() -> Dict[str, dict]:
+    """Upstream calls made and calls coalesced into them, per group."""
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {group.name: group.stats() for group in groups}
+
+
+def flight_key(text: str) -> str:
+    """Normalize free text so trivially different spellings of a query share a call."""
+    return " ".join(text.casefold().split())
@@ -0,0 +1,84 @@
+import sys
+from typing import Any, AsyncIterator, Collection, Iterator, Optional
+
+from langchain_core.messages import AIMessageChunk
+
+STREAM_MODES = ["updates", "messages", "custom", "values"]
+
+
+def message_text(message: AIMessageChunk) -> str:
+    """Return the text of a message chunk whose content is a string or a list of content blocks."""
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(
+        block if isinstance(block, str) else block.get("text", "")
+        for block in message.content
+        if isinstance(block, str) or block.get("type") == "text"
+    )
+
+
+def to_event(mode: str, chunk: Any, answer_nodes: Collection[str]) -> Optional[dict]:
+    """
+    Translate one LangGraph stream item into a streaming event.
+
+    Events are dicts with a "type" of:
+    - "token": a piece of the answer, with "node" and "content"
+    - "node": a node finished, with "node" and its state "update"
+    - "progress": data a node wrote with LangGraph's stream writer while
+      running, a dict naming the "node" it came from
+    - "state": the full graph state after a step, with "state"
+    Tokens from nodes outside `answer_nodes` (query generation, structured
+    output, ...) are dropped.
+    """
+    if mode == "messages":
+        message, metadata = chunk
+        node = metadata.get("langgraph_node")
+        # Complete messages are state updates echoed back, only chunks are live tokens
+        if node not in answer_nodes or not isinstance(message, AIMessageChunk):
+            return None
+        content = message_text(message)
+        return {"type": "token", "node": node, "content": content} if content else None
+    if mode == "custom":
+        return {"type": "progress", "node": chunk.get("node"), "data": chunk}
+    if mode == "updates":
+        node, update = next(iter(chunk.items()))
+        return {"type": "node", "node": node, "update": update}
+    return {"type": "state", "state": chunk}
+
+
+def stream_events(
+    graph, state: dict, answer_nodes: Collection[str], config: Optional[dict] = None
+) -> Iterator[dict]:
+    """Run `graph` on `state`, yielding answer tokens as they arrive plus node and state events."""
+    for mode, chunk in graph.stream(state, config, stream_mode=STREAM_MODES):
+        event = to_event(mode, chunk, answer_nodes)
+        if event is not None:
+            yield event
+
+
+async def astream_events(
+    graph, state: dict, answer_nodes: Collection[str], config: Optional[dict] = None
+) -> AsyncIterator[dict]:
+    """Async version of `stream_events`, required for graphs with async nodes."""
+    async for mode, chunk in graph.astream(state, config, stream_mode=STREAM_MODES):
+        event = to_event(mode, chunk, answer_nodes)
+        if event is not None:
+            yield event
+
+
+def print_event(event: dict) -> Optional[dict]:
+    """
+    Print an event for the CLI: tokens go to stdout as they arrive, progress to stderr.
+
+    Returns the state carried by "state" events, so callers can keep the last one.
+    """
+    if event["type"] == "token":
+        print(event["content"], end="", flush=True)
+    elif event["type"] == "node":
+        print(f"[{event['node']}] done", file=sys.stderr, flush=True)
+    elif event["type"] == "progress":
+        details = ", ".join(f"{key}={value}" for key, value in event["data"].items() if key != "node")
+        print(f"[{event['node']}] {details}", file=sys.stderr, flush=True)
+    elif event["type"] == "state":
+        return event["state"]
+    return None
@@ -0,0 +1,362 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from shared.RateLimit import Backpressure, backpressure_delay
+
+# OpenTelemetry span kinds, as used in the OTLP JSON encoding
+SPAN_KINDS = {"internal": 1, "request": 2, "node": 1, "llm": 3, "http": 3, "upstream": 3}
+# Durations kept per span name for the percentiles of the summary
+SUMMARY_WINDOW = 1024
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_tracer: Optional["Tracer"] = None
+
+
+class Span:
+    """One timed operation: a graph node, an LLM call or an outbound request."""
+
+    __slots__ = ("tracer", "name", "kind", "trace_id", "span_id", "parent_id",
+                 "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, tracer: Optional["Tracer"], name: str, kind: str, parent: Optional["Span"], attributes: dict):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes)
+        self.error = None
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add(self, key: str, value: float):
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def fail(self, message: str):
+        """Mark the span as failed for errors that are handled rather than raised."""
+        self.error = message
+
+    def end(self, error: Optional[BaseException] = None):
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        if self.tracer is not None:
+            self.tracer.record(self)
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_otlp(self) -> dict:
+        """The span in the OTLP JSON encoding."""
+        otlp = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": otlp_value(value)}
+                for key, value in {"span.kind": self.kind, **self.attributes}.items()
+                if value is not None
+            ],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            otlp["parentSpanId"] = self.parent_id
+        return otlp
+
+
+class _NoopSpan:
+    """Returned when tracing is off, so instrumented code needs no checks."""
+
+    def set(self, key: str, value: Any):
+        pass
+
+    def add(self, key: str, value: float):
+        pass
+
+    def fail(self, message: str):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class JsonlExporter:
+    """
+    Appends finished spans to a file, one OTLP JSON export request per line.
+
+    This is the format read by the OpenTelemetry collector's `otlpjsonfile`
+    receiver, so traces can be forwarded to any OTel backend.
+    """
+
+    def __init__(self, path: str, service_name: str = "agentai"):
+        self.path = path
+        self.resource = {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a")
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps({"resourceSpans": [{
+            "resource": self.resource,
+            "scopeSpans": [{"scope": {"name": "agentai"}, "spans": [span.to_otlp()]}],
+        }]})
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class MetricsSummary:
+    """
+    In-process aggregate of finished spans per (kind, name): call and error
+    counts, recent duration percentiles, and summed token, cache hit and byte
+    attributes.
+    """
+
+    SUMMED = (
+        "tokens.input", "tokens.output", "tokens.total", "context.tokens.input", "context.tokens.packed",
+        "cache.hit", "coalesced", "queries.suppressed", "bytes.request", "bytes.response",
+    )
+
+    def __init__(self, window: int = SUMMARY_WINDOW):
+        self.window = window
+        self.entries: Dict[tuple, dict] = {}
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self._lock:
+            entry = self.entries.get((span.kind, span.name))
+            if entry is None:
+                entry = self.entries[(span.kind, span.name)] = {
+                    "calls": 0, "errors": 0, "seconds": 0.0, "durations": deque(maxlen=self.window),
+                }
+            entry["calls"] += 1
+            entry["errors"] += span.error is not None
+            entry["seconds"] += span.duration
+            entry["durations"].append(span.duration)
+            for key in self.SUMMED:
+                value = span.attributes.get(key)
+                if value:
+                    entry[key] = entry.get(key, 0) + value
+
+    def summary(self) -> List[dict]:
+        """Aggregates sorted by total time spent, the likeliest bottleneck first."""
+        with self._lock:
+            rows = []
+            for (kind, name), entry in self.entries.items():
+                durations = sorted(entry["durations"])
+                rows.append({
+                    "kind": kind,
+                    "name": name,
+                    **{key: value for key, value in entry.items() if key != "durations"},
+                    "p50": durations[len(durations) // 2],
+                    "p95": durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+                    "max": durations[-1],
+                })
+        return sorted(rows, key=lambda row: row["seconds"], reverse=True)
+
+    def format(self) -> str:
+        lines = [f"{'kind':<9} {'name':<32} {'calls':>6} {'errors':>6} {'total s':>9} {'p50 s':>8} {'p95 s':>8} {'tokens':>8} {'hits':>5} {'shared':>6}"]
+        for row in self.summary():
+            lines.append(
+                f"{row['kind']:<9} {row['name'][:32]:<32} {row['calls']:>6} {row['errors']:>6} "
+                f"{row['seconds']:>9.3f} {row['p50']:>8.3f} {row['p95']:>8.3f} "
+                f"{row.get('tokens.total', 0):>8} {row.get('cache.hit', 0):>5} {row.get('coalesced', 0):>6}"
+            )
+        return "\n".join(lines)
+
+
+class Tracer:
+    """Hands finished spans to its exporters and keeps a metrics summary."""
+
+    def __init__(self, exporters: Optional[list] = None):
+        self.metrics = MetricsSummary()
+        self.exporters = [self.metrics, *(exporters or [])]
+
+    def record(self, span: Span):
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                print(f"Span export failed: {e}", file=sys.stderr)
+
+    def close(self):
+        for exporter in self.exporters:
+            if hasattr(exporter, "close"):
+                exporter.close()
+
+
+def current_span():
+    """The innermost open span, or a no-op span when there is none."""
+    return _current_span.get() or NOOP_SPAN
+
+
+def get_tracer() -> Optional[Tracer]:
+    return _tracer
+
+
+def set_tracer(tracer: Optional[Tracer]):
+    """Install the process-wide tracer, or None to turn tracing off."""
+    global _tracer
+    _tracer = tracer
+
+
+def configure_tracing(path: Optional[str] = None) -> Optional[Tracer]:
+    """
+    Turn tracing on, exporting spans to `path` (default: the TRACE_FILE env var).
+
+    Returns the tracer, or None if no trace file is configured.
+    """
+    path = path or os.getenv("TRACE_FILE")
+    if not path:
+        return None
+    tracer = Tracer([JsonlExporter(path)])
+    set_tracer(tracer)
+    return tracer
+
+
+@contextlib.contextmanager
+def span(name: str, kind: str = "internal", **attributes):
+    """
+    Time the enclosed block as a child of the current span.
+
+    Yields the span so the block can attach attributes; does nothing when tracing is off.
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield NOOP_SPAN
+        return
+    current = Span(tracer, name, kind, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        _current_span.reset(token)
+        current.end(e)
+        raise
+    _current_span.reset(token)
+    current.end()
+
+
+def traced_node(name: str, func: Callable) -> Callable:
+    """
+    Wrap a graph node so each run is recorded as a "node" span.
+
+    A node failing with Backpressure waits as long as the upstream asked
+    before it is retried, outside its span.
+    """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_node(*args, **kwargs):
+            try:
+                with span(name, kind="node") as node_span:
+                    update = await func(*args, **kwargs)
+                    node_span.set("update.keys", ",".join(update) if isinstance(update, dict) else None)
+                    return update
+            except Backpressure as e:
+                await asyncio.sleep(backpressure_delay(e))
+                raise
+        return async_node
+
+    @functools.wraps(func)
+    def node(*args, **kwargs):
+        try:
+            with span(name, kind="node") as node_span:
+                update = func(*args, **kwargs)
+                node_span.set("update.keys", ",".join(update) if isinstance(update, dict) else None)
+                return update
+        except Backpressure as e:
+            time.sleep(backpressure_delay(e))
+            raise
+    return node
+
+
+def in_context(func: Callable) -> Callable:
+    """
+    Bind `func` to a copy of the current context, so calls handed to an
+    executor are still recorded under the span that submitted them.
+    """
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Records every chat model call as an "llm" span with prompt and response
+    sizes and token usage. Attached to the registry's models, so it traces
+    all agents' LLM calls whenever a tracer is installed.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._spans: Dict[Any, Span] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, invocation_params=None, **kwargs):
+        tracer = _tracer
+        if tracer is None:
+            return
+        model = (invocation_params or {}).get("model") or (serialized or {}).get("name", "llm")
+        prompt = sum(len(str(message.content)) for batch in messages for message in batch)
+        llm_span = Span(tracer, f"llm {model}", "llm", _current_span.get(), {"bytes.request": prompt})
+        with self._lock:
+            self._spans[run_id] = llm_span
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            llm_span = self._spans.pop(run_id, None)
+        if llm_span is None:
+            return
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        message = getattr(generation, "message", None)
+        usage = getattr(message, "usage_metadata", None) or {}
+        llm_span.set("bytes.response", len(generation.text) if generation is not None else 0)
+        llm_span.set("tokens.input", usage.get("input_tokens"))
+        llm_span.set("tokens.output", usage.get("output_tokens"))
+        llm_span.set("tokens.total", usage.get("total_tokens"))
+        llm_span.end()
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            llm_span = self._spans.pop(run_id, None)
+        if llm_span is not None:
+            llm_span.end(error)
+
+
+LLM_CALLBACKS = TracingCallbackHandler()
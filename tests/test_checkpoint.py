@@ -0,0 +1,121 @@
+import operator
+import os
+import sys
+from typing import Annotated, TypedDict
+
+import pytest
+from langgraph.graph import END, START, StateGraph
+from langgraph.types import Send
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "web-agent"))
+
+from shared.Checkpoint import CompactSerializer, SqliteSaver, resume_input, thread_config  # noqa: E402
+from Sources import Source, SourceTable, merge_sources  # noqa: E402
+
+CODECS = {"SourceTable": (SourceTable, SourceTable.to_rows, SourceTable.from_rows)}
+QUERIES = ["alpha", "beta", "gamma"]
+
+
+class State(TypedDict, total=False):
+    queries: list
+    sources: Annotated[SourceTable, merge_sources]
+    searched: Annotated[list, operator.add]
+    answer: str
+
+
+def research_graph(checkpointer, calls: list, fail: set):
+    """gen fans out one search per query; a search in `fail` raises once."""
+
+    def gen(state: State):
+        calls.append("gen")
+        return {"queries": QUERIES}
+
+    def fan_out(state: State):
+        return [Send("search", {"query": query}) for query in state["queries"]]
+
+    def search(state: dict):
+        query = state["query"]
+        calls.append(query)
+        if query in fail:
+            fail.discard(query)
+            raise RuntimeError(f"search for {query} failed")
+        table = SourceTable([Source(query, f"[{query}]", f"https://example.com/{query}")])
+        return {"sources": table, "searched": [query]}
+
+    def fin(state: State):
+        calls.append("fin")
+        return {"answer": ", ".join(sorted(state["searched"]))}
+
+    builder = StateGraph(State)
+    builder.add_node("gen", gen)
+    builder.add_node("search", search)
+    builder.add_node("fin", fin)
+    builder.add_edge(START, "gen")
+    builder.add_conditional_edges("gen", fan_out, ["search"])
+    builder.add_edge("search", "fin")
+    builder.add_edge("fin", END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+@pytest.fixture
+def saver(tmp_path):
+    saver = SqliteSaver(str(tmp_path / "checkpoints.sqlite3"), CompactSerializer(CODECS))
+    yield saver
+    saver.close()
+
+
+def test_resume_skips_finished_branches(saver):
+    calls = []
+    graph = research_graph(saver, calls, fail={"beta"})
+    config = thread_config(None, "thread-1")
+
+    state = resume_input(graph, {"queries": []}, config)
+    with pytest.raises(RuntimeError, match="beta"):
+        graph.invoke(state, config)
+    assert sorted(calls) == ["alpha", "beta", "gamma", "gen"]
+
+    calls.clear()
+    assert resume_input(graph, {"queries": []}, config) is None
+    result = graph.invoke(None, config)
+
+    # Only the failed search runs again, the others come from the pending writes
+    assert calls == ["beta", "fin"]
+    assert result["answer"] == "alpha, beta, gamma"
+    assert isinstance(result["sources"], SourceTable)
+    assert {source.value for source in result["sources"]} == {f"https://example.com/{q}" for q in QUERIES}
+
+
+def test_source_table_round_trips(saver):
+    graph = research_graph(saver, [], fail=set())
+    config = thread_config(None, "thread-2")
+    result = graph.invoke({"queries": []}, config)
+
+    stored = saver.get_tuple(config).checkpoint["channel_values"]["sources"]
+    assert isinstance(stored, SourceTable)
+    assert stored == result["sources"]
+    assert len(stored) == len(QUERIES)
+
+
+def test_finished_thread_starts_fresh(saver):
+    calls = []
+    graph = research_graph(saver, calls, fail=set())
+    config = thread_config(None, "thread-3")
+    graph.invoke({"queries": []}, config)
+
+    calls.clear()
+    state = {"queries": []}
+    assert resume_input(graph, state, config) is state
+    result = graph.invoke(state, config)
+    assert calls.count("gen") == 1
+    # The earlier run's searches aren't added to the new one
+    assert sorted(result["searched"]) == QUERIES
+
+
+def test_serializer_compresses_large_values():
+    serde = CompactSerializer(CODECS, compress_over=64)
+    table = SourceTable(Source(str(i), f"[{i}]", f"https://example.com/{i}") for i in range(50))
+    kind, data = serde.dumps_typed({"sources": table})
+    assert kind.endswith("+zlib")
+    assert serde.loads_typed((kind, data)) == {"sources": table}
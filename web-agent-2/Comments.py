@@ -0,0 +1,107 @@
+import contextlib
+import threading
+from collections import deque
+from typing import Callable, ContextManager, List, Tuple
+
+import praw
+from praw.models import MoreComments
+
+
+class CommentBudget:
+    """
+    How much comment harvesting one request may still do, shared by the
+    workers harvesting its submissions: comments kept in total and per
+    submission, reply depth, and "load more comments" expansions, each of
+    which costs a Reddit request.
+    """
+
+    def __init__(self, max_comments: int, per_submission: int, max_depth: int, max_expansions: int):
+        self.max_comments = max_comments
+        self.per_submission = per_submission
+        self.max_depth = max_depth
+        self.comments = max_comments
+        self.expansions = max_expansions
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        """Spend one comment of the budget, False once it is gone."""
+        with self._lock:
+            if self.comments <= 0:
+                return False
+            self.comments -= 1
+            return True
+
+    def expand(self) -> bool:
+        """Spend one MoreComments expansion of the budget, False once they are gone."""
+        with self._lock:
+            if self.expansions <= 0:
+                return False
+            self.expansions -= 1
+            return True
+
+    def take_up_to(self, count: int) -> int:
+        """Spend up to `count` comments of the budget, returning how many it had left for them."""
+        with self._lock:
+            granted = max(0, min(count, self.comments))
+            self.comments -= granted
+            return granted
+
+    def drain(self):
+        """Spend whatever is left, so walks still running stop at their next comment."""
+        with self._lock:
+            self.comments = 0
+            self.expansions = 0
+
+    @property
+    def spent(self) -> bool:
+        with self._lock:
+            return self.comments <= 0
+
+
+def harvest_comments(
+    reddit: praw.Reddit,
+    submission_id: str,
+    budget: CommentBudget,
+    slot: Callable[[], ContextManager] = contextlib.nullcontext,
+) -> Tuple[List[dict], bool]:
+    """
+    Collect a submission's top comments breadth first, within `budget`.
+
+    Top-level comments come first, then their replies down to the budget's
+    depth. Collapsed "load more comments" stubs are only expanded when the
+    walk reaches them and the budget still allows it, since each one is
+    another request. Every Reddit request runs inside `slot()`.
+
+    Returns the comments and whether the request-wide budget cut the walk
+    short, rather than the per-submission and depth limits.
+    """
+    submission = reddit.submission(id=submission_id)
+    submission.comment_sort = "top"
+    # Don't download more of the tree than can be kept
+    submission.comment_limit = budget.per_submission
+    with slot():
+        forest = list(submission.comments)
+
+    comments = []
+    truncated = False
+    queue = deque((item, 0) for item in forest)
+    while queue and len(comments) < budget.per_submission:
+        item, depth = queue.popleft()
+        if isinstance(item, MoreComments):
+            if depth >= budget.max_depth:
+                continue
+            if budget.spent or not budget.expand():
+                truncated = True
+                continue
+            with slot():
+                expanded = item.comments()
+            # Expanded comments come back as a flat list, they're kept at the stub's depth
+            queue.extend((child, depth) for child in expanded)
+            continue
+        if not budget.take():
+            truncated = True
+            break
+        comments.append({"body": item.body, "score": item.score, "depth": depth})
+        if depth + 1 < budget.max_depth:
+            queue.extend((reply, depth + 1) for reply in item.replies)
+    return comments, truncated
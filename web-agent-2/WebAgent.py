@@ -1,25 +1,41 @@
+import asyncio
 import os
-import requests
+import sys
+from concurrent.futures import ThreadPoolExecutor
 import matplotlib.pyplot as plt
 from langgraph.graph import StateGraph
 from langgraph.graph import START, END
+from langgraph.config import get_stream_writer
 
 from State import State
 from dotenv import load_dotenv
-from google.genai import Client
 import praw
-from langchain_google_genai import ChatGoogleGenerativeAI
 from Schema import GoogleResults, RedditResults
 from Prompt import synthesise_answer, reflection_instructions
 from Utils import current_date
+from Comments import CommentBudget, harvest_comments
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.Checkpoint import model_codec
+from shared.Clients import get_chat_model, get_genai_client, get_structured_model
+from shared.Http import close_http_client, get_http_client
+from shared.Packing import pack_context, pack_documents
+from shared.RateLimit import BACKPRESSURE_RETRY, as_backpressure, get_limiter, is_throttled
+from shared.SingleFlight import flight_key, single_flight
+from shared.Streaming import astream_events, print_event
+from shared.Tracing import configure_tracing, in_context, span, traced_node
+
+SERP_API_URL = "https://serpapi.com/search.json"
+# Nodes whose LLM tokens are forwarded when streaming
+ANSWER_NODES = {"synthesize-answer"}
+# State types stored in checkpoints, beyond what LangGraph serializes itself
+CHECKPOINT_CODECS = {"GoogleResults": model_codec(GoogleResults), "RedditResults": model_codec(RedditResults)}
 
 class WebAgent:
     def __init__(self):
         load_dotenv("../config/.env")
         self.api_key = os.getenv("GEMINI_API_KEY")
-        self.client = Client(
-            api_key=self.api_key,
-        )
+        self.client = get_genai_client(self.api_key)
 
         reddit_client_id = os.getenv("REDDIT_CLIENT_ID")
         reddit_client_secret = os.getenv("REDDIT_SECRET")
@@ -29,15 +45,79 @@ class WebAgent:
             redirect_uri="http://localhost:8080",
             user_agent="Karma breakdown 1.0 by /u/riki4284 ",
         )
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-1.5-flash",
-            api_key=self.api_key,
-            temperature=1.0,
-            max_retries=2,
+        self.model = "gemini-1.5-flash"
+        # Upper bound for each retrieval branch, so a slow source cannot hold up the answer
+        self.branch_timeout = float(os.getenv("BRANCH_TIMEOUT_SECONDS", 20))
+        # Token budgets for the search results and analyses packed into each prompt
+        self.analysis_context_tokens = int(os.getenv("ANALYSIS_CONTEXT_TOKENS", 6000))
+        self.answer_context_tokens = int(os.getenv("ANSWER_CONTEXT_TOKENS", 4000))
+        # Own pool for blocking retrievals: asyncio.run would otherwise wait on timed out
+        # calls when shutting down the default executor
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="web-agent-branch")
+        # Comment trees are fetched one submission per worker
+        self.harvest_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("REDDIT_HARVEST_WORKERS", 8)), thread_name_prefix="reddit-comments"
         )
+        self.reddit_submissions = int(os.getenv("REDDIT_SUBMISSIONS", 10))
+        # Per request comment harvesting budget
+        self.max_comments = int(os.getenv("REDDIT_MAX_COMMENTS", 200))
+        self.comments_per_submission = int(os.getenv("REDDIT_COMMENTS_PER_SUBMISSION", 30))
+        self.comment_depth = int(os.getenv("REDDIT_COMMENT_DEPTH", 3))
+        self.comment_expansions = int(os.getenv("REDDIT_COMMENT_EXPANSIONS", 10))
+        self.llm = get_chat_model(self.model, temperature=1.0, api_key=self.api_key)
+
+    async def with_timeout(self, retrieval, key: str):
+        """Await a retrieval, returning empty results for `key` if it exceeds the branch timeout."""
+        try:
+            return await asyncio.wait_for(retrieval, timeout=self.branch_timeout)
+        except asyncio.TimeoutError:
+            print(f"{key} timed out after {self.branch_timeout}s, continuing without it")
+            return {key: []}
+
+    async def google_branch(self, state: State):
+        return await self.with_timeout(self.google_search(state), "google_results")
+
+    async def reddit_branch(self, state: State):
+        """
+        Search Reddit, then harvest the comments of every submission found in parallel.
+
+        Posts are collected as their comments arrive, so when the branch times
+        out the analysis still gets every post harvested by then. Each one is
+        reported as a progress event; the analysis itself starts once the
+        branch is done.
+        """
+        # praw is blocking, so the search and the harvesting run on worker threads
+        loop = asyncio.get_running_loop()
+        write = get_stream_writer()
+        budget = CommentBudget(
+            self.max_comments, self.comments_per_submission, self.comment_depth, self.comment_expansions
+        )
+        fetches = []
+        posts = []
+
+        async def harvest():
+            found = await loop.run_in_executor(self.executor, in_context(self.reddit_search), state)
+            fetches.extend(
+                loop.run_in_executor(self.harvest_executor, in_context(self.harvest_post), post, budget)
+                for post in found["reddit_results"]
+            )
+            for fetch in asyncio.as_completed(fetches):
+                post = await fetch
+                posts.append(post)
+                write({"node": "reddit-search", "title": post["title"], "comments": len(post["comments"])})
+
+        try:
+            await asyncio.wait_for(harvest(), timeout=self.branch_timeout)
+        except asyncio.TimeoutError:
+            # Stop the walks still running and drop the queued ones, they would keep spending Reddit capacity
+            budget.drain()
+            for fetch in fetches:
+                fetch.cancel()
+            print(f"reddit_results timed out after {self.branch_timeout}s, continuing with {len(posts)} posts")
+        return {"reddit_results": posts}
 
     @staticmethod
-    def google_search(state: State):
+    async def google_search(state: State):
         print("Searching Google using SERP...")
         question = state["question"]
 
@@ -45,48 +125,94 @@ class WebAgent:
         # Replace with your actual SerpApi key and endpoint
 
         api_key = os.getenv("SERP_KEY")
-        url = f"https://serpapi.com/search.json?q={question}&api_key={api_key}"
+
+        async def search():
+            async with get_limiter("serpapi").aslot():
+                return await get_http_client().get_json(SERP_API_URL, params={"q": question, "api_key": api_key})
 
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            search_results = response.json().get("organic_results", [])
+            # Concurrent requests for the same question share one SerpAPI call
+            data, _ = await single_flight("serpapi.search").ado(flight_key(question), search)
+            search_results = data.get("organic_results", [])
             # Extract and format the results for analysis
             summaries = [f"Title: {r['title']}\nSnippet: {r['snippet']}" for r in search_results[:5]]
 
             return {"google_results": summaries}
         except Exception as e:
+            # Throttling is retried by the graph rather than answered without results
+            if is_throttled(e):
+                raise as_backpressure("serpapi", e) from e
             print(f"Google search failed: {e}")
             return {"google_results": []}  # Return empty to handle graceful failure
 
     def reddit_search(self, state: State):
         print("Searching Reddit for relevant discussions...")
         question = state.get("question")
-        results = []
-        try:
+
+        def search():
             # Use the search method to find submissions across all of Reddit
             # You can adjust the subreddit and limit as needed
-            for submission in self.reddit.subreddit("all").search(question, limit=5):
-                results.append({
-                    "title": submission.title,
-                    "selftext": submission.selftext,
-                    "url": submission.url
-                })
+            with get_limiter("reddit").slot():
+                return [
+                    {
+                        "id": submission.id,
+                        "title": submission.title,
+                        "selftext": submission.selftext,
+                        "url": submission.url
+                    }
+                    for submission in self.reddit.subreddit("all").search(question, limit=self.reddit_submissions)
+                ]
+
+        try:
+            with span("reddit.search", kind="upstream") as search_span:
+                results, _ = single_flight("reddit.search").do(flight_key(question), search)
+                search_span.set("results", len(results))
+                search_span.set("bytes.response", sum(len(r["title"]) + len(r["selftext"]) for r in results))
             return {"reddit_results": results}
 
         except Exception as e:
+            if is_throttled(e):
+                raise as_backpressure("reddit", e) from e
             print(f"Error during Reddit search: {e}")
             # Return an empty list on failure to prevent the graph from crashing
             return {"reddit_results": []}
 
+    def harvest_post(self, post: dict, budget: CommentBudget) -> dict:
+        """A search result with its comments, or none if they can't be fetched."""
+        slot = get_limiter("reddit").slot
+        try:
+            with span("reddit.comments", kind="upstream", submission=post["id"]) as harvest_span:
+                # Requests running at the same time share the walk of a popular thread, when they walk it alike
+                (comments, truncated), coalesced = single_flight("reddit.comments").do(
+                    (post["id"], budget.per_submission, budget.max_depth),
+                    lambda: harvest_comments(self.reddit, post["id"], budget, slot),
+                )
+                if coalesced and truncated:
+                    # Cut short by the other request's budget, drained if its branch timed out
+                    comments, _ = harvest_comments(self.reddit, post["id"], budget, slot)
+                elif coalesced:
+                    # The shared walk spent the other request's budget, this one pays for what it keeps
+                    comments = comments[:budget.take_up_to(len(comments))]
+                harvest_span.set("results", len(comments))
+                harvest_span.set("bytes.response", sum(len(comment["body"]) for comment in comments))
+        except Exception as e:
+            # The post itself is still worth analysing, throttling included
+            print(f"Error harvesting comments for {post['url']}: {e}")
+            comments = []
+        return {**post, "comments": comments}
+
     def google_analysis(self, state: State):
         print("Google analysis started...")
         google_results = state.get("google_results")
         user_question = state.get("question")
-        llm_structured = self.llm.with_structured_output(GoogleResults)
+        if not google_results:
+            return {"google_analysis": None}
+        llm_structured = get_structured_model(
+            self.model, temperature=1.0, schema=GoogleResults, api_key=self.api_key
+        )
         formatted_prompt = reflection_instructions.format(
             user_question=user_question,
-            search_results=google_results,
+            search_results=pack_context(google_results, user_question, self.analysis_context_tokens),
         )
         output = llm_structured.invoke(formatted_prompt)
         return {"google_analysis": output}
@@ -95,71 +221,139 @@ class WebAgent:
         print("Reddit analysis started...")
         reddit_results = state.get("reddit_results")
         user_question = state.get("question")
-        llm_structured = self.llm.with_structured_output(RedditResults)
+        if not reddit_results:
+            return {"reddit_analysis": None}
+        llm_structured = get_structured_model(
+            self.model, temperature=1.0, schema=RedditResults, api_key=self.api_key
+        )
+        # One passage per comment, each kept under its post's title and url
+        posts = [
+            "\n\n".join([
+                f"Title: {r['title']}\nURL: {r['url']}",
+                r["selftext"],
+                *(
+                    f"Comment (score {c['score']}): {self.one_paragraph(c['body'])}"
+                    for c in r.get("comments", [])
+                ),
+            ])
+            for r in reddit_results
+        ]
         formatted_prompt = reflection_instructions.format(
             user_question=user_question,
-            search_results=reddit_results,
+            search_results=pack_context(posts, user_question, self.analysis_context_tokens, headers=True),
         )
         output = llm_structured.invoke(formatted_prompt)
         return {"reddit_analysis": output}
 
+    @staticmethod
+    def one_paragraph(text: str) -> str:
+        """`text` without blank lines, so the context packer keeps it as a single passage."""
+        return "\n".join(line for line in text.splitlines() if line.strip())
+
+    @staticmethod
+    def analysis_text(analysis) -> str:
+        """One paragraph per item of a structured analysis, so they can be packed individually."""
+        if analysis is None:
+            return ""
+        return "\n\n".join(
+            f"{field}: {item}"
+            for field, value in analysis.model_dump().items()
+            for item in (value if isinstance(value, list) else [value])
+        )
+
     def synthesize_answer(self, state: State):
         print("Get an answer...")
         user_question = state.get("question")
-        reddit_res = state.get("reddit_analysis")
-        google_res = state.get("google_analysis")
+        # Both analyses are packed against one budget, so points they repeat are only sent once
+        google_res, reddit_res = pack_documents(
+            [self.analysis_text(state.get("google_analysis")), self.analysis_text(state.get("reddit_analysis"))],
+            user_question,
+            self.answer_context_tokens,
+        )
         formatted_prompt = synthesise_answer.format(
             user_question=user_question,
-            google_analysis=google_res,
-            reddit_analysis=reddit_res
+            google_analysis=google_res or None,
+            reddit_analysis=reddit_res or None
         )
         output = self.llm.invoke(formatted_prompt)
         return {"answer": output.content}
 
-    def build_graph(self):
+    def build_graph(self, checkpointer=None):
         builder = StateGraph(State)
-        builder.add_node("google-search", self.google_search)
-        builder.add_node("reddit-search", self.reddit_search)
-        builder.add_node("google-analysis", self.google_analysis)
-        builder.add_node("reddit-analysis", self.reddit_analysis)
-        builder.add_node("synthesize-answer", self.synthesize_answer)
+        builder.add_node("google-search", traced_node("google-search", self.google_branch), retry_policy=BACKPRESSURE_RETRY)
+        builder.add_node("reddit-search", traced_node("reddit-search", self.reddit_branch), retry_policy=BACKPRESSURE_RETRY)
+        builder.add_node("google-analysis", traced_node("google-analysis", self.google_analysis), retry_policy=BACKPRESSURE_RETRY)
+        builder.add_node("reddit-analysis", traced_node("reddit-analysis", self.reddit_analysis), retry_policy=BACKPRESSURE_RETRY)
+        builder.add_node("synthesize-answer", traced_node("synthesize-answer", self.synthesize_answer), retry_policy=BACKPRESSURE_RETRY)
 
+        # Google and Reddit are independent branches, joined when both analyses are done
         builder.add_edge(START, "google-search")
-        builder.add_edge("google-search", "reddit-search")
+        builder.add_edge(START, "reddit-search")
+        builder.add_edge("google-search", "google-analysis")
         builder.add_edge("reddit-search", "reddit-analysis")
-        builder.add_edge("reddit-analysis", "google-analysis")
-        # builder.add_edge("google-analysis", "synthesize-answer")
-        # builder.add_edge("reddit-analysis", "synthesize-answer")
-        # builder.add_edge("synthesize-answer", END)
-        builder.add_edge("google-analysis", "synthesize-answer")
+        builder.add_edge(["google-analysis", "reddit-analysis"], "synthesize-answer")
         builder.add_edge("synthesize-answer", END)
-        graph = builder.compile()
+        graph = builder.compile(checkpointer=checkpointer)
 
         return graph
 
+    @staticmethod
+    async def stream(graph, initial_state: State):
+        """Run the graph, yielding answer tokens as they arrive plus node progress events."""
+        async for event in astream_events(graph, initial_state, ANSWER_NODES):
+            yield event
+
+    async def answer(self, graph, initial_state: State):
+        """Stream the answer to stdout as it is generated and return the final state."""
+        final_state = {}
+        answering = False
+        try:
+            with span("request web-agent-2", kind="request"):
+                async for event in self.stream(graph, initial_state):
+                    if event["type"] == "token" and not answering:
+                        print("\nFinal Answer:")
+                        answering = True
+                    final_state = print_event(event) or final_state
+        finally:
+            # Each asyncio.run gets a new loop, so its HTTP client can't be reused
+            await close_http_client()
+        print()
+        return final_state
+
+    @staticmethod
+    def initial_state(question: str) -> State:
+        return State(
+            messages=[{"role": "user", "content": question}],
+            question=question,
+            google_results=None,
+            reddit_results=None,
+            google_analysis=None,
+            reddit_analysis=None,
+            answer=None
+        )
+
+    async def from_request(self, payload: dict):
+        """Build the (state, config) of a graph run from a server request body."""
+        question = payload.get("question")
+        if not isinstance(question, str) or not question.strip():
+            raise ValueError("'question' is required")
+        return self.initial_state(question), None
+
+    @staticmethod
+    def to_response(state: dict) -> dict:
+        return {"answer": state.get("answer")}
+
     def run(self):
         graph = self.build_graph()
+        tracer = configure_tracing()
         while True:
             print("Starting WebAgent")
             question = input("What do you want to lookup?")
-            initial_state = State(
-                messages=[{"role": "user", "content": question}],
-                question=question,
-                google_results=None,
-                reddit_results=None,
-                google_analysis=None,
-                reddit_analysis=None,
-                answer=None
-            )
-
-            # The .stream() method is better for complex agents as it shows incremental progress
-            final_state = {}
-            for state in graph.stream(initial_state):
-                # print(f"Current State: {state}")
-                final_state = state
+            initial_state = self.initial_state(question)
 
-            print("\nFinal Answer:")
-            print(final_state.get("answer"))
+            asyncio.run(self.answer(graph, initial_state))
+            if tracer is not None:
+                print(tracer.metrics.format(), file=sys.stderr)
 
 
 if __name__ == '__main__':
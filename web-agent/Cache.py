@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from google.genai import types
+
+
+class SearchCache:
+    """
+    Content-addressed on-disk cache for grounded search responses.
+
+    Entries are keyed on the model, the normalized prompt and the tool config and
+    store the full serialized response, grounding metadata included, so citations
+    can be rebuilt from a hit exactly as from a live call. Entries expire after
+    `ttl_seconds` and the least recently used ones are evicted once the stored
+    payloads exceed `max_bytes`.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_bytes: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS search_cache (
+                    key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS search_cache_accessed_at ON search_cache (accessed_at)"
+            )
+
+    @staticmethod
+    def make_key(model: str, prompt: str, config: dict[str, Any]) -> str:
+        """
+        Build the cache key for a request from its model, prompt and tool config.
+        """
+        normalized = json.dumps(
+            {"model": model, "prompt": " ".join(prompt.split()), "config": config},
+            sort_keys=True,
+        )
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[types.GenerateContentResponse]:
+        """
+        Return the cached response for `key`, or None if missing or expired.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT payload, created_at FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            payload, created_at = row
+            if now - created_at > self.ttl_seconds:
+                self._connection.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                return None
+            self._connection.execute(
+                "UPDATE search_cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        return types.GenerateContentResponse.model_validate_json(payload)
+
+    def put(self, key: str, response: types.GenerateContentResponse):
+        """
+        Store `response` under `key` and evict least recently used entries over budget.
+        """
+        payload = response.model_dump_json(exclude_none=True)
+        size = len(payload.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO search_cache (key, payload, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, payload, size, now, now),
+            )
+            self._connection.execute(
+                "DELETE FROM search_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+            (total,) = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM search_cache"
+            ).fetchone()
+            if total <= self.max_bytes:
+                return
+            excess = total - self.max_bytes
+            evicted = []
+            for entry_key, entry_size in self._connection.execute(
+                "SELECT key, size FROM search_cache ORDER BY accessed_at ASC"
+            ).fetchall():
+                if excess <= 0:
+                    break
+                evicted.append((entry_key,))
+                excess -= entry_size
+            self._connection.executemany("DELETE FROM search_cache WHERE key = ?", evicted)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
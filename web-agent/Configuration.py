@@ -1,5 +1,6 @@
 import os
-from pydantic import BaseModel, Field
+from functools import lru_cache
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Any, Optional
 
 from langchain_core.runnables import RunnableConfig
@@ -8,6 +9,9 @@ from langchain_core.runnables import RunnableConfig
 class Configuration(BaseModel):
     """The configuration for the agent."""
 
+    # Resolved instances are cached and shared between node calls
+    model_config = ConfigDict(frozen=True)
+
     query_generator_model: str = Field(
         default="gemini-1.5-flash",
         metadata={
@@ -31,14 +35,84 @@ class Configuration(BaseModel):
 
     number_of_initial_queries: int = Field(
         default=3,
+        ge=1,
         metadata={"description": "The number of initial search queries to generate."},
     )
 
     max_research_loops: int = Field(
         default=2,
+        ge=0,
         metadata={"description": "The maximum number of research loops to perform."},
     )
 
+    query_similarity_threshold: float = Field(
+        default=0.75,
+        gt=0,
+        le=1,
+        metadata={
+            "description": "Estimated similarity of a query's content words to an already searched one from which it is dropped as a near duplicate; 1 only drops exact repeats."
+        },
+    )
+
+    max_concurrent_searches: int = Field(
+        default=3,
+        ge=1,
+        metadata={
+            "description": "The maximum number of web search branches of a run allowed in flight at the same time."
+        },
+    )
+
+    max_research_seconds: Optional[float] = Field(
+        default=None,
+        gt=0,
+        metadata={
+            "description": "Wall-clock budget for the research loop; no follow-up searches are started once it is spent."
+        },
+    )
+
+    max_research_tokens: Optional[int] = Field(
+        default=None,
+        gt=0,
+        metadata={
+            "description": "Token budget for the research loop; no follow-up searches are started once it is spent."
+        },
+    )
+
+    reflection_context_tokens: int = Field(
+        default=8000,
+        gt=0,
+        metadata={
+            "description": "Token budget for the research summaries packed into the reflection model's prompt."
+        },
+    )
+
+    answer_context_tokens: int = Field(
+        default=16000,
+        gt=0,
+        metadata={
+            "description": "Token budget for the research summaries packed into the answer model's prompt."
+        },
+    )
+
+    search_cache_path: str = Field(
+        default="../config/search_cache.sqlite3",
+        metadata={
+            "description": "SQLite file caching grounded search responses; an empty value disables the cache."
+        },
+    )
+
+    search_cache_ttl_seconds: float = Field(
+        default=6 * 60 * 60,
+        metadata={"description": "How long a cached search response stays valid."},
+    )
+
+    search_cache_max_bytes: int = Field(
+        default=256 * 1024 * 1024,
+        metadata={
+            "description": "Maximum size of the cached payloads before least recently used entries are evicted."
+        },
+    )
+
     @classmethod
     def from_runnable_config(
         cls, config: Optional[RunnableConfig] = None
@@ -47,7 +121,20 @@ class Configuration(BaseModel):
         configurable = (
             config["configurable"] if config and "configurable" in config else {}
         )
+        # Only the fields of this model matter; LangGraph adds its own keys to configurable
+        key = tuple(
+            (name, configurable[name])
+            for name in cls.model_fields.keys()
+            if name in configurable
+        )
+        try:
+            return cls._from_configurable(key)
+        except TypeError:
+            # Unhashable values can't be cached, resolve them directly
+            return cls._resolve(dict(key))
 
+    @classmethod
+    def _resolve(cls, configurable: dict[str, Any]) -> "Configuration":
         # Get raw values from environment or config
         raw_values: dict[str, Any] = {
             name: os.environ.get(name.upper(), configurable.get(name))
@@ -57,4 +144,9 @@ class Configuration(BaseModel):
         # Filter out None values
         values = {k: v for k, v in raw_values.items() if v is not None}
 
-        return cls(**values)
\ No newline at end of file
+        return cls(**values)
+
+    @classmethod
+    @lru_cache(maxsize=128)
+    def _from_configurable(cls, key: tuple) -> "Configuration":
+        return cls._resolve(dict(key))
\ No newline at end of file
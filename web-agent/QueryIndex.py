@@ -0,0 +1,95 @@
+import hashlib
+import random
+import re
+from typing import Iterable, List, Optional, Tuple
+
+from Utils import normalize_query
+
+# Words that don't change what a search returns
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how in into is it its of on or the to was what when where which who why "
+    "with about does do did can vs versus".split()
+)
+NUM_PERM = 128
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Fixed seed, so signatures are comparable across processes
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+_WORD = re.compile(r"\w+")
+
+
+def stem(word: str) -> str:
+    """Strip common English suffixes, so "panels" and "panel" count as the same word."""
+    for suffix in ("ing", "ies", "es", "ed", "s"):
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return word[: -len(suffix)] + ("y" if suffix == "ies" else "")
+    return word
+
+
+def query_features(query: str) -> frozenset:
+    """The stemmed content words of a query; word order and filler words don't matter."""
+    return frozenset(stem(word) for word in _WORD.findall(normalize_query(query)) if word not in STOPWORDS)
+
+
+def minhash(features: Iterable[str]) -> Tuple[int, ...]:
+    hashes = [int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "big") for f in features]
+    return tuple(
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+class QueryIndex:
+    """
+    MinHash index of the queries a research session has searched.
+
+    A query whose estimated Jaccard similarity to an indexed one reaches
+    `threshold` is a near duplicate of it: it would ground the answer in the
+    same results, so it isn't worth another search call. Queries made only
+    of stop words fall back to exact comparison.
+    """
+
+    def __init__(self, threshold: float, queries: Iterable[str] = ()):
+        self.threshold = threshold
+        self.entries: List[Tuple[str, Optional[Tuple[int, ...]], str]] = []
+        for query in queries:
+            self.add(query)
+
+    @staticmethod
+    def signature(query: str) -> Optional[Tuple[int, ...]]:
+        features = query_features(query)
+        return minhash(features) if features else None
+
+    def add(self, query: str):
+        self.entries.append((query, self.signature(query), normalize_query(query)))
+
+    def match(self, query: str) -> Optional[str]:
+        """The indexed query `query` duplicates, if any."""
+        signature = self.signature(query)
+        normalized = normalize_query(query)
+        for indexed, indexed_signature, indexed_normalized in self.entries:
+            if normalized == indexed_normalized:
+                return indexed
+            if signature is None or indexed_signature is None:
+                continue
+            agreeing = sum(x == y for x, y in zip(signature, indexed_signature))
+            if agreeing >= self.threshold * NUM_PERM:
+                return indexed
+        return None
+
+    def filter(self, queries: Iterable[str]) -> Tuple[List[str], List[dict]]:
+        """
+        Split queries into those worth searching and the suppressed ones, each
+        with the query it duplicates. Kept queries are indexed as they go, so
+        paraphrases within `queries` are caught too.
+        """
+        kept, suppressed = [], []
+        for query in queries:
+            duplicate_of = self.match(query)
+            if duplicate_of is None:
+                kept.append(query)
+                self.add(query)
+            else:
+                suppressed.append({"query": query, "duplicate_of": duplicate_of})
+        return kept, suppressed
@@ -0,0 +1,166 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+
+class Source:
+    """A single grounding source, interned once per unique chunk URI."""
+
+    __slots__ = ("label", "short_url", "value")
+
+    def __init__(self, label: str, short_url: str, value: str):
+        self.label = label
+        self.short_url = short_url
+        self.value = value
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"label": self.label, "short_url": self.short_url, "value": self.value}
+
+    def __eq__(self, other):
+        if not isinstance(other, Source):
+            return NotImplemented
+        return (self.label, self.short_url, self.value) == (other.label, other.short_url, other.value)
+
+    def __repr__(self):
+        return f"Source(label={self.label!r}, short_url={self.short_url!r}, value={self.value!r})"
+
+
+class Citation:
+    """A cited text segment referring to its sources by index into a SourceTable."""
+
+    __slots__ = ("start_index", "end_index", "source_ids")
+
+    def __init__(self, start_index: int, end_index: int, source_ids: tuple):
+        self.start_index = start_index
+        self.end_index = end_index
+        self.source_ids = source_ids
+
+    def __repr__(self):
+        return (
+            f"Citation(start_index={self.start_index}, end_index={self.end_index}, "
+            f"source_ids={self.source_ids})"
+        )
+
+
+class SourceTable:
+    """
+    Deduplicated table of grounding sources.
+
+    Each unique URI is stored once and referenced by its integer position, so
+    citations and research loops that hit the same chunk share one record.
+    """
+
+    __slots__ = ("_sources", "_index")
+
+    def __init__(self, sources: Optional[Iterable[Source]] = None):
+        self._sources: List[Source] = []
+        self._index: Dict[str, int] = {}
+        for source in sources or ():
+            self.add_source(source)
+
+    def add(self, label: str, short_url: str, value: str) -> int:
+        """
+        Return the index of the source for `value`, adding it if it is new.
+        """
+        source_id = self._index.get(value)
+        if source_id is None:
+            source_id = self.add_source(Source(label, short_url, value))
+        return source_id
+
+    def add_source(self, source: Source) -> int:
+        source_id = self._index.get(source.value)
+        if source_id is None:
+            source_id = len(self._sources)
+            self._sources.append(source)
+            self._index[source.value] = source_id
+        return source_id
+
+    def __getitem__(self, source_id: int) -> Source:
+        return self._sources[source_id]
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+    def __iter__(self) -> Iterator[Source]:
+        return iter(self._sources)
+
+    def __contains__(self, value: str) -> bool:
+        return value in self._index
+
+    def __eq__(self, other):
+        if not isinstance(other, SourceTable):
+            return NotImplemented
+        return self._sources == other._sources
+
+    def __repr__(self):
+        return f"SourceTable({self._sources!r})"
+
+    def copy(self) -> "SourceTable":
+        """
+        A new table holding the same Source records, so adding to it leaves this one unchanged.
+        """
+        table = SourceTable()
+        table._sources = list(self._sources)
+        table._index = dict(self._index)
+        return table
+
+    def to_dicts(self) -> List[Dict[str, str]]:
+        """
+        Convert the table back to the list-of-dicts shape of `sources_gathered`.
+        """
+        return [source.to_dict() for source in self._sources]
+
+    @classmethod
+    def from_dicts(cls, sources: Iterable[Dict[str, Any]]) -> "SourceTable":
+        return cls(Source(s["label"], s["short_url"], s["value"]) for s in sources)
+
+    def to_rows(self) -> List[List[str]]:
+        """
+        Compact form for checkpoints: one [label, short_url, value] row per source.
+        """
+        return [[source.label, source.short_url, source.value] for source in self._sources]
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Iterable[str]]) -> "SourceTable":
+        return cls(Source(*row) for row in rows)
+
+
+def merge_sources(left: Optional[SourceTable], right: Any) -> SourceTable:
+    """
+    State reducer merging the sources of a branch into the session-wide table.
+
+    Sources already present in `left` are skipped, so the merged table holds one
+    record per URI across all research loops. `right` may also be a list of
+    source dicts, the shape used before the compact table.
+
+    `left` is never modified: LangGraph hands the same table to stream
+    chunks, snapshots and checkpoint serialization. The merged table is a
+    new one sharing `left`'s Source records, only made when `right` brings
+    new sources.
+    """
+    if right is None:
+        return left if left is not None else SourceTable()
+    if not isinstance(right, SourceTable):
+        right = SourceTable.from_dicts(right)
+    if left is None:
+        # The session's table, not the branch's own
+        return right.copy()
+    new = [source for source in right if source.value not in left]
+    if not new:
+        return left
+    merged = left.copy()
+    for source in new:
+        merged.add_source(source)
+    return merged
+
+
+def expand_citations(citations: List[Citation], table: SourceTable) -> List[Dict[str, Any]]:
+    """
+    Convert compact citations to the dict shape produced by `get_citations`.
+    """
+    return [
+        {
+            "start_index": citation.start_index,
+            "end_index": citation.end_index,
+            "segments": [table[source_id].to_dict() for source_id in citation.source_ids],
+        }
+        for citation in citations
+    ]
@@ -7,19 +7,26 @@ from typing_extensions import Annotated
 
 import operator
 
+from Sources import SourceTable, merge_sources
+
 
 class OverallState(TypedDict):
     messages: Annotated[list, add_messages]
     search_query: Annotated[list, operator.add]
     web_research_result: Annotated[list, operator.add]
-    sources_gathered: Annotated[list, operator.add]
+    sources_gathered: Annotated[SourceTable, merge_sources]
     initial_search_query_count: int
     max_research_loops: int
     research_loop_count: int
     reasoning_model: str
+    research_started_at: float
+    loop_started_at: float
+    tokens_used: Annotated[int, operator.add]
+    research_loop_timings: Annotated[list, operator.add]
+    suppressed_queries: Annotated[list, operator.add]
 
 
-class ReflectionState(TypedDict):
+class ReflectionState(OverallState):
     is_sufficient: bool
     knowledge_gap: str
     follow_up_queries: Annotated[list, operator.add]
@@ -1,6 +1,9 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 from langchain_core.messages import AnyMessage, AIMessage, HumanMessage
 import datetime
+import hashlib
+
+from Sources import Citation, SourceTable, expand_citations
 
 def get_current_date():
     return datetime.datetime.now().strftime("%B %d, %Y")
@@ -22,109 +25,126 @@ def get_research_topic(messages: List[AnyMessage]) -> str:
     return research_topic
 
 
+def normalize_query(query: str) -> str:
+    """
+    Normalize a search query so that trivially different spellings compare equal.
+    """
+    return " ".join(query.casefold().split())
+
+
 def resolve_urls(urls_to_resolve: List[Any]) -> Dict[str, str]:
     """
     Create a map of the vertex ai search urls (very long) to a short url with a unique id for each url.
     Ensures each original URL gets a consistent shortened form while maintaining uniqueness.
+    The id is derived from the url itself, so the same url gets the same short url in every
+    search branch and research loop, and different urls never collide across branches.
     """
     prefix = f"https://vertexaisearch.cloud.google.com/id/"
     urls = [site.web.uri for site in urls_to_resolve]
 
-    # Create a dictionary that maps each unique URL to its first occurrence index
     resolved_map = {}
-    for idx, url in enumerate(urls):
+    for url in urls:
         if url not in resolved_map:
-            resolved_map[url] = f"{prefix}-{idx}"
+            resolved_map[url] = f"{prefix}{hashlib.blake2b(url.encode('utf-8'), digest_size=6).hexdigest()}"
 
     return resolved_map
 
 
-def insert_citation_markers(text, citations_list):
+def iter_cited_text(text, citations_list):
     """
-    Inserts citation markers into a text string based on start and end indices.
+    Yields the text with citation markers inserted, chunk by chunk.
+
+    Each chunk is the slice of the original text up to the next citation
+    position followed by its markers, so callers can stream the cited text as
+    it is built. The concatenated chunks equal `insert_citation_markers`.
 
     Args:
         text (str): The original text string.
         citations_list (list): A list of dictionaries, where each dictionary
-                               contains 'start_index', 'end_index', and
-                               'segment_string' (the marker to insert).
+                               contains 'end_index' and 'segments' (the
+                               segments whose markers to insert).
                                Indices are assumed to be for the original text.
 
-    Returns:
-        str: The text with citation markers inserted.
+    Yields:
+        str: Consecutive chunks of the cited text.
     """
-    # Sort citations by end_index in descending order.
-    # If end_index is the same, secondary sort by start_index descending.
-    # This ensures that insertions at the end of the string don't affect
-    # the indices of earlier parts of the string that still need to be processed.
+    # Markers sharing an end_index are emitted in ascending start_index order,
+    # and exact ties in reverse list order, matching repeated insertion from the end.
     sorted_citations = sorted(
-        citations_list, key=lambda c: (c["end_index"], c["start_index"]), reverse=True
+        reversed(citations_list), key=lambda c: (c["end_index"], c["start_index"])
     )
 
-    modified_text = text
+    position = 0
     for citation_info in sorted_citations:
-        # These indices refer to positions in the *original* text,
-        # but since we iterate from the end, they remain valid for insertion
-        # relative to the parts of the string already processed.
-        end_idx = citation_info["end_index"]
-        marker_to_insert = ""
-        for segment in citation_info["segments"]:
-            marker_to_insert += f" [{segment['label']}]({segment['short_url']})"
-        # Insert the citation marker at the original end_idx position
-        modified_text = (
-            modified_text[:end_idx] + marker_to_insert + modified_text[end_idx:]
+        end_idx = min(citation_info["end_index"], len(text))
+        if end_idx > position:
+            yield text[position:end_idx]
+            position = end_idx
+        marker_to_insert = "".join(
+            f" [{segment['label']}]({segment['short_url']})"
+            for segment in citation_info["segments"]
         )
+        if marker_to_insert:
+            yield marker_to_insert
+    if position < len(text):
+        yield text[position:]
 
-    return modified_text
 
+def insert_citation_markers(text, citations_list):
+    """
+    Inserts citation markers into a text string based on start and end indices.
 
-def get_citations(response, resolved_urls_map):
+    Args:
+        text (str): The original text string.
+        citations_list (list): A list of dictionaries, where each dictionary
+                               contains 'start_index', 'end_index', and
+                               'segments' (the segments whose markers to insert).
+                               Indices are assumed to be for the original text.
+
+    Returns:
+        str: The text with citation markers inserted.
     """
-    Extracts and formats citation information from a Gemini model's response.
+    # Collect the chunks in a single pass and join once, instead of rebuilding
+    # the string for every citation.
+    return "".join(iter_cited_text(text, citations_list))
 
-    This function processes the grounding metadata provided in the response to
-    construct a list of citation objects. Each citation object includes the
-    start and end indices of the text segment it refers to, and a string
-    containing formatted markdown links to the supporting web chunks.
+
+def get_compact_citations(response, resolved_urls_map) -> Tuple[List[Citation], SourceTable]:
+    """
+    Extracts citation information from a Gemini model's response in compact form.
+
+    Every grounding chunk referenced by a support is interned once in a
+    SourceTable, and each citation refers to its chunks by index into it.
 
     Args:
         response: The response object from the Gemini model, expected to have
                   a structure including `candidates[0].grounding_metadata`.
-                  It also relies on a `resolved_map` being available in its
-                  scope to map chunk URIs to resolved URLs.
+        resolved_urls_map: The map of chunk URIs to short urls from `resolve_urls`.
 
     Returns:
-        list: A list of dictionaries, where each dictionary represents a citation
-              and has the following keys:
-              - "start_index" (int): The starting character index of the cited
-                                     segment in the original text. Defaults to 0
-                                     if not specified.
-              - "end_index" (int): The character index immediately after the
-                                   end of the cited segment (exclusive).
-              - "segments" (list[str]): A list of individual markdown-formatted
-                                        links for each grounding chunk.
-              - "segment_string" (str): A concatenated string of all markdown-
-                                        formatted links for the citation.
-              Returns an empty list if no valid candidates or grounding supports
-              are found, or if essential data is missing.
+        tuple: The list of Citation objects and the SourceTable they index into.
+               The list is empty if no valid candidates or grounding supports
+               are found, or if essential data is missing.
     """
     citations = []
+    table = SourceTable()
 
     # Ensure response and necessary nested structures are present
     if not response or not response.candidates:
-        return citations
+        return citations, table
 
     candidate = response.candidates[0]
     if (
         not hasattr(candidate, "grounding_metadata")
         or not candidate.grounding_metadata
         or not hasattr(candidate.grounding_metadata, "grounding_supports")
+        or not candidate.grounding_metadata.grounding_supports
     ):
-        return citations
+        return citations, table
 
+    # Chunk index -> source id, so each chunk's label is computed once
+    chunk_sources = {}
     for support in candidate.grounding_metadata.grounding_supports:
-        citation = {}
-
         # Ensure segment information is present
         if not hasattr(support, "segment") or support.segment is None:
             continue  # Skip this support if segment info is missing
@@ -139,31 +159,57 @@ def get_citations(response, resolved_urls_map):
         if support.segment.end_index is None:
             continue  # Skip if end_index is missing, as it's crucial
 
-        # Add 1 to end_index to make it an exclusive end for slicing/range purposes
-        # (assuming the API provides an inclusive end_index)
-        citation["start_index"] = start_index
-        citation["end_index"] = support.segment.end_index
-
-        citation["segments"] = []
+        source_ids = []
         if (
             hasattr(support, "grounding_chunk_indices")
             and support.grounding_chunk_indices
         ):
             for ind in support.grounding_chunk_indices:
-                try:
-                    chunk = candidate.grounding_metadata.grounding_chunks[ind]
-                    resolved_url = resolved_urls_map.get(chunk.web.uri, None)
-                    citation["segments"].append(
-                        {
-                            "label": chunk.web.title.split(".")[:-1][0],
-                            "short_url": resolved_url,
-                            "value": chunk.web.uri,
-                        }
-                    )
-                except (IndexError, AttributeError, NameError):
-                    # Handle cases where chunk, web, uri, or resolved_map might be problematic
-                    # For simplicity, we'll just skip adding this particular segment link
-                    # In a production system, you might want to log this.
-                    pass
-        citations.append(citation)
-    return citations
\ No newline at end of file
+                if ind not in chunk_sources:
+                    try:
+                        chunk = candidate.grounding_metadata.grounding_chunks[ind]
+                        chunk_sources[ind] = table.add(
+                            label=chunk.web.title.split(".")[:-1][0],
+                            short_url=resolved_urls_map.get(chunk.web.uri, None),
+                            value=chunk.web.uri,
+                        )
+                    except (IndexError, AttributeError, NameError, TypeError):
+                        # Handle cases where chunk, web, uri, or resolved_map might be problematic
+                        # For simplicity, we'll just skip adding this particular segment link
+                        # In a production system, you might want to log this.
+                        chunk_sources[ind] = None
+                if chunk_sources[ind] is not None:
+                    source_ids.append(chunk_sources[ind])
+        citations.append(Citation(start_index, support.segment.end_index, tuple(source_ids)))
+    return citations, table
+
+
+def get_citations(response, resolved_urls_map):
+    """
+    Extracts and formats citation information from a Gemini model's response.
+
+    This function processes the grounding metadata provided in the response to
+    construct a list of citation objects. Each citation object includes the
+    start and end indices of the text segment it refers to, and a string
+    containing formatted markdown links to the supporting web chunks.
+
+    Args:
+        response: The response object from the Gemini model, expected to have
+                  a structure including `candidates[0].grounding_metadata`.
+                  It also relies on a `resolved_map` being available in its
+                  scope to map chunk URIs to resolved URLs.
+
+    Returns:
+        list: A list of dictionaries, where each dictionary represents a citation
+              and has the following keys:
+              - "start_index" (int): The starting character index of the cited
+                                     segment in the original text. Defaults to 0
+                                     if not specified.
+              - "end_index" (int): The character index immediately after the
+                                   end of the cited segment (exclusive).
+              - "segments" (list[str]): A list of individual markdown-formatted
+                                        links for each grounding chunk.
+              Returns an empty list if no valid candidates or grounding supports
+              are found, or if essential data is missing.
+    """
+    return expand_citations(*get_compact_citations(response, resolved_urls_map))
@@ -1,20 +1,53 @@
 from dotenv import load_dotenv
+import hashlib
 import os
+import sys
+import threading
+import time
 from langgraph.graph import StateGraph
+from langgraph.types import Send
+from pydantic import ValidationError
 from State import (OverallState,
                    QueryGenerationState,
                    ReflectionState,
                    WebSearchState)
 from Configuration import Configuration
+from Cache import SearchCache
+from QueryIndex import QueryIndex
 from langchain_core.runnables import RunnableConfig
-from Schema import SearchQueryList
-from Prompt import query_writer_instructions, web_searcher_instructions
-from Utils import get_research_topic, get_current_date, resolve_urls, get_citations, insert_citation_markers
-from langchain_google_genai import ChatGoogleGenerativeAI
+from Schema import SearchQueryList, Reflection
+from Prompt import query_writer_instructions, web_searcher_instructions, reflection_instructions, answer_instructions
+from Utils import (get_research_topic,
+                   get_current_date,
+                   normalize_query,
+                   resolve_urls,
+                   get_compact_citations,
+                   insert_citation_markers)
+from Sources import SourceTable, expand_citations
 from langgraph.graph import START, END
 from argparse import ArgumentParser
-from langchain_core.messages import HumanMessage
-from google.genai import Client
+from langchain_core.messages import AIMessage, HumanMessage
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.Checkpoint import CompactSerializer, SqliteSaver, forget, resume_input, thread_config
+from shared.Clients import get_chat_model, get_genai_client, get_structured_model
+from shared.Packing import pack_context
+from shared.RateLimit import BACKPRESSURE_RETRY, as_backpressure, get_limiter, is_throttled
+from shared.SingleFlight import single_flight
+from shared.Streaming import print_event, stream_events
+from shared.Tracing import configure_tracing, current_span, span, traced_node
+
+# Nodes whose LLM tokens are forwarded when streaming
+ANSWER_NODES = {"finalize_answer"}
+# Configuration fields a server request may set, cache paths and models stay server side
+REQUEST_CONFIGURABLE = (
+    "max_concurrent_searches", "max_research_seconds", "max_research_tokens", "query_similarity_threshold",
+)
+# Bounds of the research size a server request may ask for, each query and loop costs upstream calls
+MAX_INITIAL_QUERIES = 10
+MAX_RESEARCH_LOOPS = 10
+# State types stored in checkpoints, beyond what LangGraph serializes itself
+CHECKPOINT_CODECS = {"SourceTable": (SourceTable, SourceTable.to_rows, SourceTable.from_rows)}
 
 class WebAgent:
     def __init__(self):
@@ -23,23 +56,31 @@ class WebAgent:
             raise ValueError("GEMINI_API_KEY is not set")
         else:
             self.api_key = os.getenv("GEMINI_API_KEY")
-        self.client = Client(
-            api_key=self.api_key,
-        )
-        self.run()
+        self.client = get_genai_client(self.api_key)
+        # One bound on in-flight searches for all runs of the process together; the gemini limiter paces them
+        self.search_slots = threading.BoundedSemaphore(max(1, int(os.getenv("MAX_PROCESS_SEARCHES", 32))))
+        self._search_caches = {}
+        self._search_caches_lock = threading.Lock()
 
     def load_graph(self):
         builder = StateGraph(OverallState, config_schema=Configuration)
         self.add_node(builder,"generate_query", self.generate_query)
         self.add_node(builder,"web_search", self.search_web)
+        self.add_node(builder,"reflection", self.reflection)
+        self.add_node(builder,"finalize_answer", self.finalize_answer)
         self.add_edge(builder, START, "generate_query")
-        self.add_edge(builder, "generate_query", "web_search")
-        self.add_edge(builder, "web_search", END)
+        self.add_edge(builder, "generate_query", self.continue_to_web_research, is_conditional=True)
+        self.add_edge(builder, "web_search", "reflection")
+        self.add_edge(builder, "reflection", self.evaluate_research, is_conditional=True)
+        self.add_edge(builder, "finalize_answer", END)
         return builder
 
+    def build_graph(self, checkpointer=None):
+        return self.load_graph().compile(name="search-agent", checkpointer=checkpointer)
+
     @staticmethod
     def add_node(builder:StateGraph, key, func):
-        builder.add_node(key, func)
+        builder.add_node(key, traced_node(key, func), retry_policy=BACKPRESSURE_RETRY)
         return builder
 
     @staticmethod
@@ -52,48 +93,301 @@ class WebAgent:
 
     def generate_query(self, state: OverallState, config: RunnableConfig):
         configurable = Configuration.from_runnable_config(config)
-        llm = ChatGoogleGenerativeAI(
-            model=configurable.query_generator_model,
+        structured_llm = get_structured_model(
+            configurable.query_generator_model,
             temperature=1.0,
-            max_retries=2,
+            schema=SearchQueryList,
             api_key=self.api_key,
         )
-        structured_llm = llm.with_structured_output(SearchQueryList)
         formatted_prompt = query_writer_instructions.format(
             current_date=get_current_date(),
             research_topic=get_research_topic(state["messages"]),
             number_queries=state["initial_search_query_count"],
         )
         result = structured_llm.invoke(formatted_prompt)
-        return {"search_query": result.query}
+        # Paraphrases among the generated queries would search for the same results
+        queries, suppressed = QueryIndex(configurable.query_similarity_threshold).filter(result.query)
+        current_span().add("queries.suppressed", len(suppressed))
+        now = time.time()
+        return {
+            "search_query": queries,
+            "suppressed_queries": suppressed,
+            "research_started_at": now,
+            "loop_started_at": now,
+        }
+
+    @staticmethod
+    def continue_to_web_research(state: QueryGenerationState):
+        """Fan out one web_search branch per generated query."""
+        return [
+            Send("web_search", {"search_query": search_query, "id": str(idx)})
+            for idx, search_query in enumerate(state["search_query"])
+        ]
 
-    def search_web(self, state: OverallState, config: RunnableConfig):
+    @staticmethod
+    def run_config(configurable: dict) -> RunnableConfig:
+        """
+        The config of a graph run. The run's own max_concurrent_searches
+        bounds its searches; all runs together share the process-wide
+        `search_slots`, sized by MAX_PROCESS_SEARCHES.
+        """
+        config = {"configurable": configurable}
+        # Only web_search fans out, so the run's task concurrency is its search concurrency
+        config["max_concurrency"] = max(1, Configuration.from_runnable_config(config).max_concurrent_searches)
+        return config
+
+    def search_cache(self, configurable: Configuration):
+        """Return the grounded search cache for the configured path, if enabled."""
+        if not configurable.search_cache_path:
+            return None
+        with self._search_caches_lock:
+            if configurable.search_cache_path not in self._search_caches:
+                self._search_caches[configurable.search_cache_path] = SearchCache(
+                    configurable.search_cache_path,
+                    ttl_seconds=configurable.search_cache_ttl_seconds,
+                    max_bytes=configurable.search_cache_max_bytes,
+                )
+            return self._search_caches[configurable.search_cache_path]
+
+    def search_web(self, state: WebSearchState, config: RunnableConfig):
         configurable = Configuration.from_runnable_config(config)
         question = state.get("search_query")
         formatted_prompt = web_searcher_instructions.format(
             current_date=get_current_date(),
             research_topic=question,
         )
-        response = self.client.models.generate_content(
-            model="gemini-1.5-flash",
-            contents=formatted_prompt,
-            config={
-                "tools": [{"google_search_retrieval": {}}],
-                "temperature": 0,
-            },
-        )
+        model = "gemini-1.5-flash"
+        search_config = {
+            "tools": [{"google_search_retrieval": {}}],
+            "temperature": 0,
+        }
+        cache = self.search_cache(configurable)
+        cache_key = SearchCache.make_key(model, formatted_prompt, search_config)
+
+        def search():
+            response = cache.get(cache_key) if cache else None
+            if response is not None:
+                return response, True
+            try:
+                with self.search_slots, get_limiter("gemini").slot():
+                    response = self.client.models.generate_content(
+                        model=model,
+                        contents=formatted_prompt,
+                        config=search_config,
+                    )
+            except Exception as e:
+                if is_throttled(e):
+                    raise as_backpressure("gemini", e) from e
+                raise
+            if cache:
+                cache.put(cache_key, response)
+            return response, False
+
+        with span("gemini.search", kind="upstream", model=model) as search_span:
+            # Identical searches running for other requests share one upstream call
+            flight = (model, normalize_query(formatted_prompt))
+            (response, cache_hit), coalesced = single_flight("gemini.search").do(flight, search)
+            search_span.set("cache.hit", int(cache_hit))
+            search_span.set("bytes.request", len(formatted_prompt))
+            search_span.set("bytes.response", len(response.text or ""))
+            # Only the call that reached the model spends tokens
+            usage = None if cache_hit or coalesced else getattr(response, "usage_metadata", None)
+            search_span.set("tokens.total", (usage.total_token_count or 0) if usage else 0)
         resolved_urls = resolve_urls(
             response.candidates[0].grounding_metadata.grounding_chunks
         )
         # Gets the citations and adds them to the generated text
-        citations = get_citations(response, resolved_urls)
-        modified_text = insert_citation_markers(response.text, citations)
-        sources_gathered = [item for citation in citations for item in citation["segments"]]
+        citations, sources_gathered = get_compact_citations(response, resolved_urls)
+        modified_text = insert_citation_markers(
+            response.text, expand_citations(citations, sources_gathered)
+        )
 
         return {
             "sources_gathered": sources_gathered,
             "search_query": [state["search_query"]],
             "web_research_result": [modified_text],
+            "tokens_used": (usage.total_token_count or 0) if usage else 0,
+        }
+
+    def reflection(self, state: OverallState, config: RunnableConfig):
+        """Identify knowledge gaps in the gathered research and propose follow-up queries."""
+        configurable = Configuration.from_runnable_config(config)
+        started_at = time.time()
+        research_loop_count = state.get("research_loop_count", 0) + 1
+        research_topic = get_research_topic(state["messages"])
+        formatted_prompt = reflection_instructions.format(
+            current_date=get_current_date(),
+            research_topic=research_topic,
+            summaries=pack_context(
+                state["web_research_result"], research_topic, configurable.reflection_context_tokens
+            ),
+        )
+        structured_llm = get_structured_model(
+            configurable.reflection_model,
+            temperature=1.0,
+            schema=Reflection,
+            api_key=self.api_key,
+            include_raw=True,
+        )
+        output = structured_llm.invoke(formatted_prompt)
+        result = output["parsed"]
+        usage = getattr(output["raw"], "usage_metadata", None) or {}
+        # Follow-ups paraphrasing a query this session already searched are not searched again
+        index = QueryIndex(configurable.query_similarity_threshold, state["search_query"])
+        follow_up_queries, suppressed = index.filter(result.follow_up_queries)
+        current_span().add("queries.suppressed", len(suppressed))
+        finished_at = time.time()
+
+        return {
+            "is_sufficient": result.is_sufficient,
+            "knowledge_gap": result.knowledge_gap,
+            "follow_up_queries": follow_up_queries,
+            "suppressed_queries": suppressed,
+            "research_loop_count": research_loop_count,
+            "number_of_ran_queries": len(state["search_query"]),
+            "tokens_used": usage.get("total_tokens", 0),
+            "loop_started_at": finished_at,
+            "research_loop_timings": [
+                {
+                    "loop": research_loop_count,
+                    "search_seconds": started_at - state["loop_started_at"],
+                    "reflection_seconds": finished_at - started_at,
+                }
+            ],
+        }
+
+    @staticmethod
+    def evaluate_research(state: ReflectionState, config: RunnableConfig):
+        """
+        Route to the next research loop or to the final answer.
+
+        Follow-up queries are dispatched as web_search branches straight from the
+        reflection output, which already left out near duplicates of searched
+        queries, skipping any query that has already been searched. The loop ends
+        when reflection is satisfied, the loop count is reached, or the time/token
+        budget is spent.
+        """
+        configurable = Configuration.from_runnable_config(config)
+        max_research_loops = (
+            state.get("max_research_loops")
+            if state.get("max_research_loops") is not None
+            else configurable.max_research_loops
+        )
+        if state["is_sufficient"] or state["research_loop_count"] >= max_research_loops:
+            return "finalize_answer"
+        if (
+            configurable.max_research_seconds is not None
+            and time.time() - state["research_started_at"] >= configurable.max_research_seconds
+        ):
+            return "finalize_answer"
+        if (
+            configurable.max_research_tokens is not None
+            and state["tokens_used"] >= configurable.max_research_tokens
+        ):
+            return "finalize_answer"
+
+        seen = {normalize_query(query) for query in state["search_query"]}
+        follow_up_queries = []
+        for query in state["follow_up_queries"]:
+            normalized = normalize_query(query)
+            if normalized not in seen:
+                seen.add(normalized)
+                follow_up_queries.append(query)
+        if not follow_up_queries:
+            return "finalize_answer"
+
+        return [
+            Send(
+                "web_search",
+                {
+                    "search_query": follow_up_query,
+                    "id": str(state["number_of_ran_queries"] + idx),
+                },
+            )
+            for idx, follow_up_query in enumerate(follow_up_queries)
+        ]
+
+    def finalize_answer(self, state: OverallState, config: RunnableConfig):
+        """Write the final answer from the gathered research."""
+        configurable = Configuration.from_runnable_config(config)
+        reasoning_model = state.get("reasoning_model") or configurable.answer_model
+        research_topic = get_research_topic(state["messages"])
+        formatted_prompt = answer_instructions.format(
+            current_date=get_current_date(),
+            research_topic=research_topic,
+            summaries=pack_context(
+                state["web_research_result"], research_topic, configurable.answer_context_tokens, "\n---\n\n"
+            ),
+        )
+        llm = get_chat_model(reasoning_model, temperature=0, api_key=self.api_key)
+        result = llm.invoke(formatted_prompt)
+
+        # Replace the short urls with the original urls
+        content = result.content
+        for source in state["sources_gathered"]:
+            if source.short_url and source.short_url in content:
+                content = content.replace(source.short_url, source.value)
+
+        return {"messages": [AIMessage(content=content)]}
+
+    def stream(self, graph, state: OverallState, config: RunnableConfig = None):
+        """
+        Run the research graph, yielding answer tokens as they arrive plus node progress events.
+
+        Streamed tokens carry the short citation urls; the final message in the
+        last "state" event has them replaced with the original urls.
+        """
+        yield from stream_events(graph, state, ANSWER_NODES, config)
+
+    async def from_request(self, payload: dict):
+        """Build the (state, config) of a graph run from a server request body."""
+        question = payload.get("question")
+        if not isinstance(question, str) or not question.strip():
+            raise ValueError("'question' is required")
+        reasoning_model = payload.get("reasoning_model", "gemini-1.5-flash")
+        if not isinstance(reasoning_model, str) or not reasoning_model.strip():
+            raise ValueError("'reasoning_model' must be a model name")
+        state = {
+            "messages": [HumanMessage(content=question)],
+            "initial_search_query_count": self.request_int(payload, "initial_queries", 3, 1, MAX_INITIAL_QUERIES),
+            "max_research_loops": self.request_int(payload, "max_loops", 2, 0, MAX_RESEARCH_LOOPS),
+            "reasoning_model": reasoning_model,
+        }
+        configurable = {
+            key: payload[key] for key in REQUEST_CONFIGURABLE if payload.get(key) is not None
+        }
+        try:
+            Configuration.model_validate(configurable)
+        except ValidationError as e:
+            error = e.errors()[0]
+            raise ValueError(f"invalid '{error['loc'][0]}': {error['msg']}") from None
+        return state, self.run_config(configurable)
+
+    @staticmethod
+    def request_int(payload: dict, key: str, default: int, low: int, high: int) -> int:
+        """An integer field of a request body, `default` when unset or null, raising ValueError unless within [low, high]."""
+        value = payload.get(key)
+        if value is None:
+            value = default
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            raise ValueError(f"'{key}' must be an integer")
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValueError(f"'{key}' must be an integer") from None
+        if not low <= value <= high:
+            raise ValueError(f"'{key}' must be between {low} and {high}")
+        return value
+
+    @staticmethod
+    def to_response(state: dict) -> dict:
+        messages = state.get("messages", [])
+        sources = state.get("sources_gathered")
+        return {
+            "answer": messages[-1].content if messages else None,
+            "sources": sources.to_dicts() if sources is not None else [],
+            "research_loop_timings": state.get("research_loop_timings", []),
+            "suppressed_queries": state.get("suppressed_queries", []),
         }
 
     def run(self):
@@ -117,7 +411,31 @@ class WebAgent:
             default="gemini-1.5-flash",
             help="Model for the final answer",
         )
+        parser.add_argument(
+            "--max-concurrent-searches",
+            type=int,
+            default=3,
+            help="Maximum number of web searches running at the same time",
+        )
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            help="Print the answer token by token as it is generated",
+        )
+        parser.add_argument(
+            "--trace",
+            help="Write spans to this OTLP JSON file and print a timing summary (default: $TRACE_FILE)",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="Save progress to this SQLite file, so a failed run resumes where it stopped when run again",
+        )
+        parser.add_argument(
+            "--thread-id",
+            help="Checkpoint thread of the run (default: derived from the question)",
+        )
         args = parser.parse_args()
+        tracer = configure_tracing(args.trace)
 
         state = {
             "messages": [HumanMessage(content=args.question)],
@@ -125,12 +443,39 @@ class WebAgent:
             "max_research_loops": args.max_loops,
             "reasoning_model": args.reasoning_model,
         }
-        builder = self.load_graph()
-        graph = builder.compile(name="search-agent")
-        result = graph.invoke(state)
-        messages = result.get("messages", [])
-        if messages:
-            print(messages[-1].content)
+        config = self.run_config({"max_concurrent_searches": args.max_concurrent_searches})
+        if args.checkpoint:
+            graph = self.build_graph(SqliteSaver(args.checkpoint, CompactSerializer(CHECKPOINT_CODECS)))
+            thread_id = args.thread_id or hashlib.blake2b(args.question.encode(), digest_size=12).hexdigest()
+            config = thread_config(config, thread_id)
+            state = resume_input(graph, state, config)
+            if state is None:
+                print(f"Resuming research thread {thread_id}", file=sys.stderr)
+        else:
+            graph = self.build_graph()
+        with span("request web-agent", kind="request"):
+            if args.stream:
+                result = {}
+                for event in self.stream(graph, state, config):
+                    result = print_event(event) or result
+                print()
+            else:
+                result = graph.invoke(state, config=config)
+                messages = result.get("messages", [])
+                if messages:
+                    print(messages[-1].content)
+        forget(graph, config)
+        for timing in result.get("research_loop_timings", []):
+            print(
+                f"Research loop {timing['loop']}: "
+                f"search {timing['search_seconds']:.2f}s, "
+                f"reflection {timing['reflection_seconds']:.2f}s"
+            )
+        for suppressed in result.get("suppressed_queries", []):
+            print(f"Skipped {suppressed['query']!r}, a near duplicate of {suppressed['duplicate_of']!r}")
+        if tracer is not None:
+            print(tracer.metrics.format(), file=sys.stderr)
+            tracer.close()
 
 if __name__ == '__main__':
-    WebAgent()
+    WebAgent().run()